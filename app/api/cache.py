@@ -0,0 +1,91 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from app.core.config import settings
+from app.core.metricas import CACHE_API
+
+
+@dataclass
+class Entrada:
+    etag: str
+    cuerpo: bytes
+    creada: float
+
+
+def etag_de(valor: str) -> str:
+    # Débil: el middleware de gzip/brotli cambia los bytes pero no la etiqueta
+    return f'W/"{valor}"'
+
+
+def etag_de_cuerpo(cuerpo: bytes) -> str:
+    return etag_de(hashlib.sha256(cuerpo).hexdigest()[:32])
+
+
+class CacheRespuestas:
+    """
+    Caché en proceso de respuestas ya serializadas (TTL + LRU). Un acierto sirve el
+    JSON tal cual, sin tocar la DB ni volver a serializar. El worker avisa de lo que
+    escribe (POST /cache/invalidar) para que no se sirvan datos viejos hasta el TTL.
+    El aviso sólo limpia la caché del proceso que lo recibe: la API se lanza con un
+    único worker de uvicorn.
+    """
+
+    def __init__(self, capacidad: int, ttl_seg: int):
+        self.capacidad = max(1, capacidad)
+        self.ttl_seg = ttl_seg
+        self._entradas: OrderedDict[str, Entrada] = OrderedDict()
+
+    def get(self, clave: str) -> Optional[Entrada]:
+        entrada = self._entradas.get(clave)
+        if entrada is not None and time.monotonic() - entrada.creada > self.ttl_seg:
+            del self._entradas[clave]
+            entrada = None
+        if entrada is None:
+            CACHE_API.labels("fallo").inc()
+            return None
+        CACHE_API.labels("acierto").inc()
+        self._entradas.move_to_end(clave)
+        return entrada
+
+    def set(self, clave: str, etag: str, cuerpo: bytes) -> Entrada:
+        entrada = Entrada(etag, cuerpo, time.monotonic())
+        self._entradas[clave] = entrada
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+        return entrada
+
+    def invalidar(self, claves: Iterable[str] = (), prefijos: Iterable[str] = ()) -> int:
+        borradas = 0
+        for clave in claves:
+            if self._entradas.pop(clave, None) is not None:
+                borradas += 1
+        prefijos = tuple(prefijos)
+        if prefijos:
+            for clave in [c for c in self._entradas if c.startswith(prefijos)]:
+                del self._entradas[clave]
+                borradas += 1
+        return borradas
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+cache = CacheRespuestas(settings.API_CACHE_MAX, settings.API_CACHE_TTL_SEG)
+
+
+def invalidar_novelas(ids: Iterable[int]) -> int:
+    ids = list(ids)
+    return cache.invalidar(
+        claves=[f"novela:{i}" for i in ids],
+        prefijos=["novelas:"] + [f"capitulos:{i}:" for i in ids]
+    )
+
+
+def invalidar_capitulos(ids: Iterable[int]) -> int:
+    claves = []
+    for i in ids:
+        claves += [f"capitulo:{i}", f"traduccion:{i}"]
+    return cache.invalidar(claves=claves)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_db
+from app.services.exportacion import ESCRITORES, datos_novela, exportar_en_flujo
+
+router = APIRouter()
+
+
+@router.get("/novelas/{id_novela}/exportar")
+async def exportar_novela(
+    id_novela: int,
+    formato: str = Query("jsonl", pattern="^(jsonl|epub)$"),
+    texto: str = Query("ambos", pattern="^(original|traduccion|ambos)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Novela completa en JSONL o EPUB, enviada capítulo a capítulo según se lee de la DB."""
+    novela = await db.run_sync(datos_novela, id_novela)
+    if novela is None:
+        raise HTTPException(status_code=404, detail="Novela no encontrada")
+    escritor = ESCRITORES[formato]
+    return StreamingResponse(
+        exportar_en_flujo(novela, formato, texto),
+        media_type=escritor.media_type,
+        headers={"Content-Disposition": f'attachment; filename="novela_{id_novela}_{texto}.{escritor.extension}"'}
+    )
@@ -0,0 +1,210 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from app.core.config import settings
+from app.db.database import get_db
+from app.db.models import Novela, Capitulo, TraduccionCapitulo
+from app.schemas.novelas import (
+    Pagina, NovelaResumen, NovelaDetalle, CapituloResumen, CapituloContenido, Invalidacion
+)
+from app.api.cache import Entrada, cache, etag_de, etag_de_cuerpo, invalidar_novelas, invalidar_capitulos
+
+router = APIRouter()
+
+# Los listados nunca cargan columnas Text
+_COLUMNAS_NOVELA = [getattr(Novela, campo) for campo in NovelaResumen.model_fields]
+_COLUMNAS_NOVELA_DETALLE = [getattr(Novela, campo) for campo in NovelaDetalle.model_fields]
+_COLUMNAS_CAPITULO = [getattr(Capitulo, campo) for campo in CapituloResumen.model_fields]
+
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match usa la comparación débil: se ignora el prefijo W/ en los dos lados
+    if not if_none_match:
+        return False
+    etiquetas = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+    return "*" in etiquetas or etag.removeprefix("W/") in etiquetas
+
+
+def _respuesta(request: Request, entrada: Entrada) -> Response:
+    cabeceras = {"ETag": entrada.etag, "Cache-Control": "no-cache"}
+    if _coincide(request.headers.get("if-none-match"), entrada.etag):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=entrada.cuerpo, media_type="application/json", headers=cabeceras)
+
+
+def _guardar(clave: str, modelo, etag: Optional[str] = None) -> Entrada:
+    cuerpo = modelo.model_dump_json().encode("utf-8")
+    return cache.set(clave, etag or etag_de_cuerpo(cuerpo), cuerpo)
+
+
+def _leer_cursor(cursor: Optional[str]) -> tuple[int, int]:
+    """Cursor de capítulos: 'orden_capitulo:id_capitulo' del último elemento servido."""
+    if not cursor:
+        return 0, 0
+    try:
+        orden, id_capitulo = cursor.split(":")
+        return int(orden), int(id_capitulo)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# ---------------------------------------------------------
+# NOVELAS
+# ---------------------------------------------------------
+
+@router.get("/novelas", response_model=Pagina[NovelaResumen])
+async def listar_novelas(
+    request: Request,
+    despues_de: int = 0,
+    limite: int = Query(50, ge=1, le=settings.API_PAGINA_MAX),
+    db: AsyncSession = Depends(get_db)
+):
+    clave = f"novelas:{despues_de}:{limite}"
+    entrada = cache.get(clave)
+    if entrada is None:
+        # Paginación por clave (id > cursor): el coste no crece con el número de página
+        novelas = (await db.execute(
+            select(Novela).options(load_only(*_COLUMNAS_NOVELA))
+            .where(Novela.id_novela > despues_de).order_by(Novela.id_novela).limit(limite + 1)
+        )).scalars().all()
+        pagina = Pagina[NovelaResumen](
+            items=[NovelaResumen.model_validate(n) for n in novelas[:limite]],
+            siguiente=str(novelas[limite - 1].id_novela) if len(novelas) > limite else None
+        )
+        entrada = _guardar(clave, pagina)
+    return _respuesta(request, entrada)
+
+
+@router.get("/novelas/{id_novela}", response_model=NovelaDetalle)
+async def detalle_novela(id_novela: int, request: Request, db: AsyncSession = Depends(get_db)):
+    clave = f"novela:{id_novela}"
+    entrada = cache.get(clave)
+    if entrada is None:
+        novela = (await db.execute(
+            select(Novela).options(load_only(*_COLUMNAS_NOVELA_DETALLE)).where(Novela.id_novela == id_novela)
+        )).scalar_one_or_none()
+        if novela is None:
+            raise HTTPException(status_code=404, detail="Novela no encontrada")
+        entrada = _guardar(clave, NovelaDetalle.model_validate(novela))
+    return _respuesta(request, entrada)
+
+
+@router.get("/novelas/{id_novela}/capitulos", response_model=Pagina[CapituloResumen])
+async def listar_capitulos(
+    id_novela: int,
+    request: Request,
+    despues_de: Optional[str] = None,
+    limite: int = Query(100, ge=1, le=settings.API_PAGINA_MAX),
+    db: AsyncSession = Depends(get_db)
+):
+    clave = f"capitulos:{id_novela}:{despues_de or ''}:{limite}"
+    entrada = cache.get(clave)
+    if entrada is None:
+        orden, id_capitulo = _leer_cursor(despues_de)
+        # Orden de idx_capitulos_novela_orden (InnoDB le añade la clave primaria): sin filesort
+        capitulos = (await db.execute(
+            select(Capitulo).options(load_only(*_COLUMNAS_CAPITULO, Capitulo.orden_capitulo))
+            .where(
+                Capitulo.id_novela == id_novela,
+                tuple_(Capitulo.orden_capitulo, Capitulo.id_capitulo) > tuple_(orden, id_capitulo)
+            )
+            .order_by(Capitulo.orden_capitulo, Capitulo.id_capitulo).limit(limite + 1)
+        )).scalars().all()
+        ultimo = capitulos[limite - 1] if len(capitulos) > limite else None
+        pagina = Pagina[CapituloResumen](
+            items=[CapituloResumen.model_validate(c) for c in capitulos[:limite]],
+            siguiente=f"{ultimo.orden_capitulo}:{ultimo.id_capitulo}" if ultimo else None
+        )
+        entrada = _guardar(clave, pagina)
+    return _respuesta(request, entrada)
+
+
+# ---------------------------------------------------------
+# CONTENIDO DE CAPÍTULOS
+# ---------------------------------------------------------
+
+def _texto_original(db: Session, id_capitulo: int) -> Optional[str]:
+    cap = db.get(Capitulo, id_capitulo)
+    return cap.texto_original if cap else None
+
+
+def _texto_traducido(db: Session, id_traduccion: int) -> Optional[str]:
+    traduccion = db.get(TraduccionCapitulo, id_traduccion)
+    return traduccion.texto_traducido if traduccion else None
+
+
+@router.get("/capitulos/{id_capitulo}", response_model=CapituloContenido)
+async def contenido_capitulo(id_capitulo: int, request: Request, db: AsyncSession = Depends(get_db)):
+    clave = f"capitulo:{id_capitulo}"
+    entrada = cache.get(clave)
+    if entrada is None:
+        cabecera = (await db.execute(
+            select(Capitulo.id_novela, Capitulo.numero_capitulo, Capitulo.titulo_original, Capitulo.hash_contenido)
+            .where(Capitulo.id_capitulo == id_capitulo)
+        )).first()
+        if cabecera is None:
+            raise HTTPException(status_code=404, detail="Capítulo no encontrado")
+        etag = etag_de(cabecera.hash_contenido) if cabecera.hash_contenido else None
+        # Si el cliente ya tiene esta versión no se lee el texto
+        if etag and _coincide(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+        texto = await db.run_sync(_texto_original, id_capitulo)
+        if texto is None:
+            raise HTTPException(status_code=404, detail="Capítulo aún sin contenido")
+        entrada = _guardar(clave, CapituloContenido(
+            id_capitulo=id_capitulo, id_novela=cabecera.id_novela, numero_capitulo=cabecera.numero_capitulo,
+            titulo=cabecera.titulo_original, contenido=texto
+        ), etag)
+    return _respuesta(request, entrada)
+
+
+@router.get("/capitulos/{id_capitulo}/traduccion", response_model=CapituloContenido)
+async def traduccion_capitulo(id_capitulo: int, request: Request, db: AsyncSession = Depends(get_db)):
+    clave = f"traduccion:{id_capitulo}"
+    entrada = cache.get(clave)
+    if entrada is None:
+        cabecera = (await db.execute(
+            select(
+                TraduccionCapitulo.id_traduccion_capitulo_es, TraduccionCapitulo.titulo_traducido,
+                TraduccionCapitulo.hash_traduccion, Capitulo.id_novela, Capitulo.numero_capitulo
+            )
+            .join(Capitulo, Capitulo.id_capitulo == TraduccionCapitulo.id_capitulo)
+            .where(TraduccionCapitulo.id_capitulo == id_capitulo, TraduccionCapitulo.estado_traduccion == 'completado')
+            .order_by(TraduccionCapitulo.version_traduccion.desc(), TraduccionCapitulo.id_traduccion_capitulo_es.desc())
+            .limit(1)
+        )).first()
+        if cabecera is None:
+            raise HTTPException(status_code=404, detail="Capítulo sin traducción")
+        etag = etag_de(cabecera.hash_traduccion) if cabecera.hash_traduccion else None
+        if etag and _coincide(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+        texto = await db.run_sync(_texto_traducido, cabecera.id_traduccion_capitulo_es)
+        entrada = _guardar(clave, CapituloContenido(
+            id_capitulo=id_capitulo, id_novela=cabecera.id_novela, numero_capitulo=cabecera.numero_capitulo,
+            titulo=cabecera.titulo_traducido, contenido=texto or ""
+        ), etag)
+    return _respuesta(request, entrada)
+
+
+# ---------------------------------------------------------
+# INVALIDACIÓN (la llama el worker al escribir)
+# ---------------------------------------------------------
+
+@router.post("/cache/invalidar")
+async def invalidar_cache(
+    cambios: Invalidacion,
+    x_token_interno: Optional[str] = Header(None)
+):
+    # Sin token no hay invalidación: detrás de un proxy inverso todas las peticiones
+    # llegan desde 127.0.0.1, así que el origen no sirve para reconocer al worker
+    if not settings.API_TOKEN_INTERNO:
+        raise HTTPException(status_code=403, detail="Invalidación desactivada (falta API_TOKEN_INTERNO)")
+    if not x_token_interno or not hmac.compare_digest(x_token_interno, settings.API_TOKEN_INTERNO):
+        raise HTTPException(status_code=403, detail="Token inválido")
+    borradas = invalidar_novelas(cambios.novelas) + invalidar_capitulos(cambios.capitulos)
+    return {"invalidadas": borradas, "en_cache": len(cache)}
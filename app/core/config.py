@@ -8,14 +8,107 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_NAME: str
+    DB_POOL_SIZE: int = 10  # Conexiones fijas del pool (por motor)
+    DB_POOL_OVERFLOW: int = 10  # Conexiones extra en picos
+    DB_POOL_RECYCLE_SEG: int = 1800  # Reabrir conexiones antes del wait_timeout de MySQL
+    DB_URL: Optional[str] = None  # URL SQLAlchemy completa (p. ej. sqlite:///bench.db); si se define, se ignoran DB_HOST...
 
     # IA y APIs
     GEMINI_API_KEY : str
+    GEMINI_MODELO: str = "gemini-2.0-flash"
+    GEMINI_BASE_URL: Optional[str] = None  # Otro endpoint compatible (proxy, o el Gemini falso de bench/)
+    GEMINI_CONCURRENCIA_MAX: int = 4  # Peticiones simultáneas (se reduce sola ante 429)
+    GEMINI_REINTENTOS: int = 5
+    TRADUCCION_LOTE_MAX_CAPITULOS: int = 6  # Capítulos cortos por petición a Gemini (1 = una petición por capítulo)
+    TRADUCCION_LOTE_ESPERA_MS: int = 150  # Cuánto se espera a que lleguen más capítulos antes de enviar un lote
+    TRADUCCION_MAX_INTENTOS: int = 5  # Traducciones fallidas antes de marcar el capítulo como 'fallido'
+    TRADUCCION_REINTENTO_BASE_SEG: int = 600  # Espera tras el primer fallo; se duplica en cada intento
+    TRADUCCION_REINTENTO_MAX_SEG: int = 86400
+    TM_CACHE_MAX: int = 50000  # Párrafos en la LRU de la memoria de traducción
+    GLOSARIO_TTL_SEG: int = 600  # Tiempo que se mantiene en memoria el glosario de cada novela
 
     # Configuración del Agente
     AGENT_POLLING_INTERVAL: int = 60
+    AGENT_MODO: str = "secuencial"  # secuencial | pipeline
+    AGENT_TRADUCCION_ACTIVA: bool = False  # Fase 2 (Gemini)
     MAX_TOKENS_PER_CHUNK: int = 3000  # Para controlar el tamaño de fragmentos de novela
 
+    # Pool de navegadores (Playwright)
+    BROWSER_POOL_SIZE: int = 2  # Navegadores Chromium calientes
+    BROWSER_MAX_PAGINAS: int = 100  # Páginas servidas antes de reiniciar un navegador
+    BROWSER_HEADLESS: bool = True
+
+    # Escrituras en bloque y cachés por ciclo
+    DB_BATCH_SIZE: int = 500  # Filas por INSERT/UPDATE en bloque
+    FUENTES_CACHE_SEG: int = 60  # Vida de la caché de fuentes_scraping
+
+    # Texto de capítulos y traducciones comprimido con zstd (ver app/db/compresion.py)
+    # Opt-in: la plataforma Laravel lee capitulos.contenido_original directamente de MySQL y
+    # con la compresión activa queda a NULL. Sin efecto si 'zstandard' no está instalado
+    COMPRESION_ACTIVA: bool = False
+    COMPRESION_NIVEL: int = 9
+    COMPRESION_TRADUCCION_EN_CLARO: bool = True  # Mantener contenido_traducido para la plataforma
+    COMPRESION_MIN_MUESTRAS: int = 20  # Capítulos necesarios para entrenar el diccionario de una novela
+    COMPRESION_MUESTRAS_DICCIONARIO: int = 200
+    COMPRESION_TAMANO_DICCIONARIO: int = 112640  # Bytes (110 KB, el valor por defecto de zstd)
+    COMPRESION_DICCIONARIOS_EN_MEMORIA: int = 32  # Diccionarios cacheados en proceso (LRU)
+    COMPRESION_SIN_DICCIONARIO_TTL_SEG: int = 600  # Cada cuánto se vuelve a buscar el diccionario de una novela que no tenía
+
+    # Discovery
+    DISCOVERY_INTERVALO_MIN: int = 60  # Minutos entre revisiones si la novela no tiene fuente registrada
+    DISCOVERY_RESCAN_COMPLETO_HORAS: int = 24  # Entre rescans completos sólo se lee la cola del índice (0 = siempre completo)
+    DISCOVERY_LOTE_NOVELAS: int = 50  # Novelas leídas por consulta; la sesión se vacía entre lotes
+
+    # Scraping de capítulos
+    SCRAPE_BATCH_SIZE: int = 50  # Capítulos pendientes por ciclo
+    SCRAPE_CONCURRENCIA_POR_FUENTE: int = 2  # Si la fuente no define 'concurrencia_max'
+    SCRAPE_LIMITE_HORA_DEFAULT: int = 60  # Para URLs sin fila en fuentes_scraping
+    SCRAPE_MODO_FETCH: str = "auto"  # auto | http | navegador (se puede forzar por fuente)
+    SCRAPE_MAX_INTENTOS: int = 5  # Lecturas fallidas antes de marcar el capítulo como 'fallido'
+    SCRAPE_REINTENTO_BASE_SEG: int = 300  # Espera tras el primer fallo; se duplica en cada intento
+    SCRAPE_REINTENTO_MAX_SEG: int = 21600
+
+    # Circuito por fuente (ver app/services/fallos.py)
+    FUENTE_FALLOS_PARA_BLOQUEAR: int = 10  # Fallos seguidos que pasan la fuente a 'bloqueada'
+    FUENTE_BLOQUEO_BASE_SEG: int = 300  # Espera hasta la primera sonda; se duplica si la sonda falla
+    FUENTE_BLOQUEO_MAX_SEG: int = 7200
+    FUENTE_VENTANA_EXITO: int = 100  # Lecturas recientes con las que se calcula tasa_exito
+    FUENTE_TASA_CADA_SEG: int = 60  # Cada cuánto se guarda tasa_exito como mucho
+
+    # Revisión de capítulos recientes por si la fuente los ha cambiado (ver app/services/revision.py)
+    REVISION_ACTIVA: bool = False
+    REVISION_DIAS: int = 14  # Sólo se revisan los capítulos scrapeados en estos días
+    REVISION_INTERVALO_HORAS: int = 24  # Tiempo mínimo entre dos revisiones del mismo capítulo
+    REVISION_LOTE: int = 50  # Capítulos por pasada
+
+    # Modo pipeline (etapas concurrentes unidas por colas)
+    PIPELINE_SCRAPERS: int = 4
+    PIPELINE_TRADUCTORES: int = 2
+    PIPELINE_COLA_MAX: int = 100  # Tamaño máximo de cada cola (backpressure)
+    PIPELINE_ALIMENTADOR_SEG: int = 30  # Cada cuánto se encola el trabajo pendiente de la DB
+
+    # Varios workers sobre la misma DB: duración de los leases (se renuevan con heartbeat)
+    LEASE_TTL_SEGUNDOS: int = 300
+
+    # Cliente HTTP (vía rápida sin navegador)
+    HTTP_TIMEOUT_SEGUNDOS: float = 20.0
+    HTTP_MAX_CONEXIONES: int = 20
+
+    # Métricas y coste de Gemini (USD por millón de tokens)
+    METRICAS_PUERTO_WORKER: int = 9108  # 0 para desactivar el exportador del worker
+    GEMINI_PRECIO_ENTRADA_1M: float = 0.10
+    GEMINI_PRECIO_SALIDA_1M: float = 0.40
+
+    # API de lectura (app/api)
+    API_CACHE_MAX: int = 2000  # Respuestas en la caché en memoria
+    API_CACHE_TTL_SEG: int = 300
+    API_PAGINA_MAX: int = 200
+    API_URL_INVALIDACION: Optional[str] = None  # p. ej. http://127.0.0.1:8000/cache/invalidar (lo usa el worker)
+    API_TOKEN_INTERNO: Optional[str] = None  # Cabecera X-Token-Interno de la invalidación; sin él queda desactivada
+
+    # Exportación de novelas completas (app/services/exportacion.py)
+    EXPORTACION_LOTE: int = 100  # Filas que trae cada viaje del cursor de servidor
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
\ No newline at end of file
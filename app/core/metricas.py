@@ -0,0 +1,82 @@
+"""
+Métricas Prometheus del agente. El worker las expone con su propio servidor
+(METRICAS_PUERTO_WORKER) y la API en GET /metrics.
+"""
+import logging
+import time
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_SEGUNDOS_WEB = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40, 60)
+_SEGUNDOS_DB = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+_SEGUNDOS_GEMINI = (0.5, 1, 2, 5, 10, 20, 40, 80, 160)
+
+NAVEGACION = Histogram(
+    "novelagent_navegacion_segundos", "Tiempo de descarga/navegación de una página",
+    ["pagina", "via"], buckets=_SEGUNDOS_WEB
+)
+EXTRACCION = Histogram(
+    "novelagent_extraccion_segundos", "Tiempo de extracción del contenido ya descargado",
+    ["pagina", "via"], buckets=_SEGUNDOS_WEB
+)
+CAPITULOS_SCRAPEADOS = Counter(
+    "novelagent_capitulos_scrapeados_total", "Capítulos procesados por el scraper",
+    ["fuente", "resultado"]
+)
+CAPITULOS_DESCUBIERTOS = Counter(
+    "novelagent_capitulos_descubiertos_total", "Capítulos nuevos dados de alta por discovery", ["fuente"]
+)
+CAPITULOS_TRADUCIDOS = Counter(
+    "novelagent_capitulos_traducidos_total", "Traducciones guardadas", ["origen"]
+)
+FUENTE_TASA_EXITO = Gauge(
+    "novelagent_fuente_tasa_exito", "Porcentaje de lecturas correctas en la ventana reciente", ["fuente"]
+)
+FUENTE_BLOQUEADA = Gauge("novelagent_fuente_bloqueada", "1 si el circuito de la fuente está abierto", ["fuente"])
+COLAS = Gauge("novelagent_cola_tamano", "Elementos esperando en cada cola del pipeline", ["cola"])
+FASES = Histogram(
+    "novelagent_fase_segundos", "Duración de cada fase del ciclo del worker", ["fase"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+)
+DB_CONSULTAS = Histogram(
+    "novelagent_db_consulta_segundos", "Tiempo de cada sentencia SQL", ["operacion"], buckets=_SEGUNDOS_DB
+)
+GEMINI_PETICIONES = Histogram(
+    "novelagent_gemini_peticion_segundos", "Latencia de cada petición a Gemini", ["resultado"],
+    buckets=_SEGUNDOS_GEMINI
+)
+GEMINI_TOKENS = Counter("novelagent_gemini_tokens_total", "Tokens consumidos en Gemini", ["tipo"])
+GEMINI_COSTO = Counter("novelagent_gemini_costo_usd_total", "Coste estimado de las traducciones (USD)")
+CACHE_API = Counter("novelagent_api_cache_total", "Consultas a la caché de respuestas de la API", ["resultado"])
+
+_OPERACIONES = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def instrumentar_engine(engine):
+    """Mide cada sentencia SQL del engine (síncrono; para el async, su sync_engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        context._inicio_metricas = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, "_inicio_metricas", None)
+        if inicio is None:
+            return
+        operacion = statement.lstrip()[:6].upper()
+        DB_CONSULTAS.labels(operacion if operacion in _OPERACIONES else "OTRA").observe(time.perf_counter() - inicio)
+
+
+def iniciar_exportador(puerto: int):
+    """Servidor HTTP de métricas del worker (en un hilo aparte, no toca el event loop)."""
+    if puerto <= 0:
+        return
+    try:
+        start_http_server(puerto)
+        logger.info(f"📈 Métricas del worker en http://0.0.0.0:{puerto}/metrics")
+    except OSError as e:
+        # Varios workers en la misma máquina: sólo el primero consigue el puerto
+        logger.warning(f"⚠️ No se pudo abrir el puerto de métricas {puerto}: {e}")
@@ -0,0 +1,169 @@
+"""
+Almacenamiento comprimido de los textos largos (capítulos y traducciones).
+
+Los cuerpos se guardan en zstd. El texto original de cada novela puede usar un
+diccionario entrenado con sus propios capítulos; el id del diccionario viaja en
+la cabecera del frame, así que para descomprimir basta con buscarlo en
+`diccionarios_compresion`.
+
+La compresión es opt-in (COMPRESION_ACTIVA=true): la plataforma lee
+`capitulos.contenido_original` en claro. Si está desactivada o `zstandard` no
+está instalado se sigue escribiendo el texto en claro como antes.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+logger = logging.getLogger(__name__)
+
+# dict_id -> diccionario, los usados más recientemente al final (como mucho
+# COMPRESION_DICCIONARIOS_EN_MEMORIA; los que salen se vuelven a leer de la DB)
+_diccionarios: "OrderedDict[int, zstd.ZstdCompressionDict]" = OrderedDict()
+_diccionario_novela: dict[int, int] = {}  # id_novela -> dict_id
+# id_novela -> hasta cuándo se da por hecho que no tiene diccionario (monotonic): otro
+# proceso (app.db.comprimir) puede entrenarlo, así que se vuelve a mirar pasado el TTL
+_sin_diccionario: dict[int, float] = {}
+_compresores: dict[int, "zstd.ZstdCompressor"] = {}  # dict_id (0 = sin diccionario) -> compresor
+_descompresores: dict[int, "zstd.ZstdDecompressor"] = {}
+
+
+def compresion_activa() -> bool:
+    return settings.COMPRESION_ACTIVA and zstd is not None
+
+
+def _registrar(id_diccionario: int, datos: bytes):
+    _diccionarios[id_diccionario] = zstd.ZstdCompressionDict(datos)
+    _diccionarios.move_to_end(id_diccionario)
+    while len(_diccionarios) > max(1, settings.COMPRESION_DICCIONARIOS_EN_MEMORIA):
+        viejo, _ = _diccionarios.popitem(last=False)
+        # Los (des)compresores guardan una referencia al diccionario
+        _compresores.pop(viejo, None)
+        _descompresores.pop(viejo, None)
+
+
+def _diccionario(db: Optional[Session], id_diccionario: int):
+    if id_diccionario not in _diccionarios:
+        from app.db.models import DiccionarioCompresion
+        if db is None:
+            raise RuntimeError(f"Diccionario zstd {id_diccionario} no cargado y sin sesión para buscarlo")
+        fila = db.get(DiccionarioCompresion, id_diccionario)
+        if fila is None:
+            raise RuntimeError(f"Diccionario zstd {id_diccionario} no encontrado")
+        _registrar(id_diccionario, fila.datos)
+    else:
+        _diccionarios.move_to_end(id_diccionario)
+    return _diccionarios[id_diccionario]
+
+
+def diccionario_de_novela(db: Session, id_novela: int) -> Optional[int]:
+    """Id del diccionario más reciente de la novela (cacheado en proceso)."""
+    if id_novela in _diccionario_novela:
+        return _diccionario_novela[id_novela]
+    if _sin_diccionario.get(id_novela, 0) > time.monotonic():
+        return None
+    from app.db.models import DiccionarioCompresion
+    fila = db.query(DiccionarioCompresion.id_diccionario, DiccionarioCompresion.datos).filter(
+        DiccionarioCompresion.id_novela == id_novela
+    ).order_by(DiccionarioCompresion.fecha_creacion.desc()).first()
+    if fila is None:
+        _sin_diccionario[id_novela] = time.monotonic() + settings.COMPRESION_SIN_DICCIONARIO_TTL_SEG
+        return None
+    _registrar(fila[0], fila[1])
+    _diccionario_novela[id_novela] = fila[0]
+    _sin_diccionario.pop(id_novela, None)
+    return fila[0]
+
+
+def precargar_diccionarios(db: Session, id_novela: int):
+    """
+    Carga en memoria todos los diccionarios de la novela. Hace falta antes de
+    recorrerla con un cursor de servidor: mientras está abierto, la conexión no
+    admite otra consulta para buscar un diccionario (por eso
+    COMPRESION_DICCIONARIOS_EN_MEMORIA debe cubrir los de una novela).
+    """
+    if zstd is None:
+        return
+    from app.db.models import DiccionarioCompresion
+    filas = db.query(DiccionarioCompresion.id_diccionario, DiccionarioCompresion.datos).filter(
+        DiccionarioCompresion.id_novela == id_novela,
+        DiccionarioCompresion.id_diccionario.notin_(list(_diccionarios) or [0])
+    ).all()
+    for id_diccionario, datos in filas:
+        _registrar(id_diccionario, datos)
+
+
+def comprimir(texto: str, db: Optional[Session] = None, id_novela: Optional[int] = None) -> bytes:
+    id_diccionario = diccionario_de_novela(db, id_novela) if db is not None and id_novela else None
+    clave = id_diccionario or 0
+    diccionario = _diccionario(db, clave) if clave else None
+    if clave not in _compresores:
+        _compresores[clave] = zstd.ZstdCompressor(level=settings.COMPRESION_NIVEL, dict_data=diccionario)
+    return _compresores[clave].compress(texto.encode("utf-8"))
+
+
+def id_diccionario_de(datos: bytes) -> int:
+    """dict_id de un frame zstd (0 si no usa diccionario); basta con su cabecera."""
+    return zstd.get_frame_parameters(datos).dict_id
+
+
+def descomprimir(datos: bytes, db: Optional[Session] = None) -> str:
+    if zstd is None:
+        raise RuntimeError("Hay contenido comprimido en la DB pero 'zstandard' no está instalado")
+    clave = id_diccionario_de(datos)
+    diccionario = _diccionario(db, clave) if clave else None
+    if clave not in _descompresores:
+        _descompresores[clave] = zstd.ZstdDecompressor(dict_data=diccionario)
+    return _descompresores[clave].decompress(datos).decode("utf-8")
+
+
+def columnas_texto(texto: Optional[str], db: Optional[Session] = None,
+                   id_novela: Optional[int] = None) -> tuple[Optional[str], Optional[bytes]]:
+    """
+    (texto en claro, texto comprimido) a guardar: sólo uno de los dos va relleno.
+    """
+    if texto is None or not compresion_activa():
+        return texto, None
+    return None, comprimir(texto, db, id_novela)
+
+
+def entrenar_diccionario(db: Session, id_novela: int) -> Optional[int]:
+    """
+    Entrena un diccionario zstd con una muestra de capítulos de la novela y lo guarda.
+    Devuelve su id, o None si la novela aún no tiene capítulos suficientes.
+    """
+    from app.db.models import Capitulo, DiccionarioCompresion
+
+    filas = db.query(Capitulo.contenido_original, Capitulo.contenido_comprimido).filter(
+        Capitulo.id_novela == id_novela,
+        (Capitulo.contenido_original != None) | (Capitulo.contenido_comprimido != None)
+    ).order_by(Capitulo.id_capitulo.desc()).limit(settings.COMPRESION_MUESTRAS_DICCIONARIO).all()
+    if len(filas) < settings.COMPRESION_MIN_MUESTRAS:
+        return None
+
+    muestras = [
+        (plano if plano is not None else descomprimir(comprimido, db)).encode("utf-8")
+        for plano, comprimido in filas
+    ]
+    try:
+        entrenado = zstd.train_dictionary(settings.COMPRESION_TAMANO_DICCIONARIO, muestras)
+    except zstd.ZstdError as e:
+        logger.warning(f"No se pudo entrenar el diccionario de la novela {id_novela}: {e}")
+        return None
+
+    id_diccionario = entrenado.dict_id()
+    if db.get(DiccionarioCompresion, id_diccionario) is None:
+        db.add(DiccionarioCompresion(id_diccionario=id_diccionario, id_novela=id_novela, datos=entrenado.as_bytes()))
+        db.commit()
+    _registrar(id_diccionario, entrenado.as_bytes())
+    _diccionario_novela[id_novela] = id_diccionario
+    _sin_diccionario.pop(id_novela, None)
+    logger.info(f"📕 Diccionario zstd {id_diccionario} entrenado para la novela {id_novela} ({len(muestras)} muestras)")
+    return id_diccionario
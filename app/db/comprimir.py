@@ -0,0 +1,169 @@
+"""
+Comprime los textos que ya estaban en claro en la DB (migración en segundo plano).
+
+Recorre `capitulos` y `capitulos_traduccion_espanol` por bloques de DB_BATCH_SIZE
+filas ordenadas por clave primaria, así que se puede parar y relanzar cuando se
+quiera. Antes entrena el diccionario zstd de las novelas que aún no tienen uno, y
+después vuelve a comprimir con su diccionario los capítulos que el worker guardó
+sin él (los de novelas nuevas, o los escritos antes de entrenarlo).
+
+Uso: python -m app.db.comprimir [--sin-diccionarios]
+
+MySQL no devuelve al disco el espacio liberado hasta un OPTIMIZE TABLE.
+"""
+import logging
+import sys
+from sqlalchemy import update, bindparam, func
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.compresion import (
+    compresion_activa, comprimir, descomprimir, diccionario_de_novela, entrenar_diccionario, id_diccionario_de
+)
+from app.db.models import Capitulo, TraduccionCapitulo, DiccionarioCompresion
+
+logger = logging.getLogger(__name__)
+
+
+def entrenar_diccionarios_pendientes(db: Session):
+    # Cuentan también los capítulos ya comprimidos: el worker los guarda así desde el
+    # principio, y entrenar_diccionario descomprime sus muestras
+    con_diccionario = db.query(DiccionarioCompresion.id_novela)
+    novelas = db.query(Capitulo.id_novela).filter(
+        (Capitulo.contenido_original != None) | (Capitulo.contenido_comprimido != None),
+        Capitulo.id_novela.notin_(con_diccionario)
+    ).group_by(Capitulo.id_novela).having(func.count() >= settings.COMPRESION_MIN_MUESTRAS).all()
+    for (id_novela,) in novelas:
+        entrenar_diccionario(db, id_novela)
+
+
+# Lo justo para leer la cabecera del frame zstd (y su dict_id) sin traer el texto
+_CABECERA_FRAME = 18
+
+
+def recomprimir_sin_diccionario(db: Session):
+    """
+    Vuelve a comprimir con el diccionario de su novela los capítulos guardados sin
+    diccionario. Sólo se lee la cabecera de cada fila para decidir.
+    """
+    con_diccionario = db.query(DiccionarioCompresion.id_novela)
+    sentencia = update(Capitulo.__table__).where(
+        Capitulo.__table__.c.id_capitulo == bindparam("b_id")
+    ).values(contenido_comprimido=bindparam("b_comprimido"))
+
+    ultimo, revisadas, total = 0, 0, 0
+    while True:
+        filas = db.query(
+            Capitulo.id_capitulo, Capitulo.id_novela, func.substr(Capitulo.contenido_comprimido, 1, _CABECERA_FRAME)
+        ).filter(
+            Capitulo.id_capitulo > ultimo,
+            Capitulo.contenido_comprimido != None,
+            Capitulo.id_novela.in_(con_diccionario)
+        ).order_by(Capitulo.id_capitulo).limit(settings.DB_BATCH_SIZE).all()
+        if not filas:
+            break
+        ultimo = filas[-1][0]
+        revisadas += len(filas)
+        pendientes = {fila[0]: fila[1] for fila in filas if id_diccionario_de(fila[2]) == 0}
+        if not pendientes:
+            continue
+        lote = []
+        for id_capitulo, comprimido in db.query(Capitulo.id_capitulo, Capitulo.contenido_comprimido).filter(
+            Capitulo.id_capitulo.in_(list(pendientes))
+        ).all():
+            id_novela = pendientes[id_capitulo]
+            if diccionario_de_novela(db, id_novela) is None:
+                continue
+            lote.append({"b_id": id_capitulo, "b_comprimido": comprimir(descomprimir(comprimido, db), db, id_novela)})
+        if lote:
+            db.execute(sentencia, lote)
+        db.commit()
+        total += len(lote)
+        logger.info(f"🗜️ {Capitulo.__tablename__}: {total} filas recomprimidas con diccionario ({revisadas} revisadas)")
+
+
+def _comprimir_tabla(db: Session, modelo, pk, columna_plana, con_novela: bool, vaciar_plano: bool):
+    t = modelo.__table__
+    valores = {"contenido_comprimido": bindparam("b_comprimido")}
+    if vaciar_plano:
+        valores[columna_plana.key] = None
+    sentencia = update(t).where(t.c[pk.key] == bindparam("b_id")).values(**valores)
+
+    columnas = [pk, columna_plana] + ([modelo.id_novela] if con_novela else [])
+    ultimo, filas_total, antes, despues = 0, 0, 0, 0
+    while True:
+        filas = db.query(*columnas).filter(
+            pk > ultimo, columna_plana != None, modelo.contenido_comprimido == None
+        ).order_by(pk).limit(settings.DB_BATCH_SIZE).all()
+        if not filas:
+            break
+        lote = []
+        for fila in filas:
+            datos = comprimir(fila[1], db, fila[2] if con_novela else None)
+            antes += len(fila[1].encode("utf-8"))
+            despues += len(datos)
+            lote.append({"b_id": fila[0], "b_comprimido": datos})
+        db.execute(sentencia, lote)
+        db.commit()
+        ultimo = filas[-1][0]
+        filas_total += len(filas)
+        logger.info(f"🗜️ {modelo.__tablename__}: {filas_total} filas comprimidas (hasta id {ultimo})")
+
+    if filas_total:
+        logger.info(
+            f"✅ {modelo.__tablename__}: {antes / 1e6:.1f} MB → {despues / 1e6:.1f} MB "
+            f"(x{antes / max(despues, 1):.1f})"
+        )
+
+
+def _quitar_copias_comprimidas(db: Session):
+    """
+    Con COMPRESION_TRADUCCION_EN_CLARO las traducciones se guardan sólo en claro:
+    se borra la copia comprimida que escribían las versiones anteriores.
+    """
+    pk = TraduccionCapitulo.id_traduccion_capitulo_es
+    ultimo, total = 0, 0
+    while True:
+        ids = [fila[0] for fila in db.query(pk).filter(
+            pk > ultimo,
+            TraduccionCapitulo.contenido_traducido != None,
+            TraduccionCapitulo.contenido_comprimido != None
+        ).order_by(pk).limit(settings.DB_BATCH_SIZE).all()]
+        if not ids:
+            break
+        db.query(TraduccionCapitulo).filter(pk.in_(ids)).update(
+            {TraduccionCapitulo.contenido_comprimido: None}, synchronize_session=False
+        )
+        db.commit()
+        ultimo = ids[-1]
+        total += len(ids)
+    if total:
+        logger.info(f"🧹 {TraduccionCapitulo.__tablename__}: {total} copias comprimidas duplicadas eliminadas")
+
+
+def comprimir_existentes(db: Session, diccionarios: bool = True):
+    if not compresion_activa():
+        logger.error("❌ Compresión desactivada o 'zstandard' no instalado")
+        return
+    if diccionarios:
+        entrenar_diccionarios_pendientes(db)
+    _comprimir_tabla(db, Capitulo, Capitulo.id_capitulo, Capitulo.contenido_original,
+                     con_novela=True, vaciar_plano=True)
+    if diccionarios:
+        recomprimir_sin_diccionario(db)
+    # Las traducciones sólo se comprimen si la plataforma no necesita contenido_traducido
+    if settings.COMPRESION_TRADUCCION_EN_CLARO:
+        _quitar_copias_comprimidas(db)
+    else:
+        _comprimir_tabla(db, TraduccionCapitulo, TraduccionCapitulo.id_traduccion_capitulo_es,
+                         TraduccionCapitulo.contenido_traducido, con_novela=False, vaciar_plano=True)
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    db = SessionLocal()
+    try:
+        comprimir_existentes(db, diccionarios="--sin-diccionarios" not in sys.argv)
+    finally:
+        db.close()
@@ -1,32 +1,60 @@
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker
 from app.core.config import settings
+from app.core.metricas import instrumentar_engine
 
 # Construimos la URL de conexión para MySQL
 # Usamos pymysql como driver para la compatibilidad con XAMPP
-SQLALCHEMY_DATABASE_URL = (
+SQLALCHEMY_DATABASE_URL = settings.DB_URL or (
     f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}@"
     f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
 
-# El motor de la base de datos
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    # pool_pre_ping ayuda a reconectar si XAMPP cierra la conexión por inactividad
-    pool_pre_ping=True 
+# Misma base de datos con driver asíncrono (aiomysql, o aiosqlite para las bases
+# de usar y tirar del benchmark) para el worker y la API
+ASYNC_DATABASE_URL = (
+    SQLALCHEMY_DATABASE_URL
+    .replace("mysql+pymysql://", "mysql+aiomysql://", 1)
+    .replace("sqlite://", "sqlite+aiosqlite://", 1)
 )
 
-# Sesión local para interactuar con la DB
+_POOL = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_POOL_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE_SEG,
+    # pool_pre_ping ayuda a reconectar si XAMPP cierra la conexión por inactividad
+    pool_pre_ping=True
+) if SQLALCHEMY_DATABASE_URL.startswith("mysql") else {}
+
+# El motor síncrono: scripts de mantenimiento (migraciones, compresión...)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_POOL)
+
+# Sesión local para interactuar con la DB desde scripts
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# El motor asíncrono: las consultas no bloquean el event loop mientras Playwright trabaja.
+# Los helpers síncronos (leases, autores, memoria...) se llaman con `await db.run_sync(fn, ...)`
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_POOL)
+
+# expire_on_commit=False: tras un commit los objetos siguen legibles sin otra consulta
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+instrumentar_engine(engine)
+instrumentar_engine(async_engine.sync_engine)
+
 # Clase base para nuestros modelos
 Base = declarative_base()
 
 # Dependencia para obtener la sesión en las rutas de FastAPI
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_db_sync():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
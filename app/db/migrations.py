@@ -0,0 +1,145 @@
+"""
+Migraciones del esquema que necesita el agente.
+
+El esquema base lo gestiona la plataforma Laravel; aquí sólo van las columnas,
+índices y tablas propias del agente. Cada migración se aplica una única vez y
+queda registrada en `agente_migraciones`.
+
+Uso: python -m app.db.migrations
+"""
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# (nombre, [sentencias SQL]) en orden de aplicación
+MIGRACIONES = [
+    ("0001_leases", [
+        "ALTER TABLE capitulos ADD COLUMN lease_owner VARCHAR(64) NULL, "
+        "ADD COLUMN lease_expira TIMESTAMP NULL DEFAULT NULL",
+        "CREATE INDEX idx_capitulos_lease ON capitulos (lease_expira)",
+        "ALTER TABLE novelas ADD COLUMN lease_owner VARCHAR(64) NULL, "
+        "ADD COLUMN lease_expira TIMESTAMP NULL DEFAULT NULL",
+    ]),
+    ("0002_memoria_traduccion", [
+        "CREATE TABLE IF NOT EXISTS memoria_traduccion ("
+        "hash_parrafo CHAR(64) NOT NULL PRIMARY KEY, "
+        "texto_traducido TEXT NOT NULL, "
+        "fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+        "CREATE INDEX idx_capitulos_hash_contenido ON capitulos (hash_contenido)",
+    ]),
+    ("0003_glosario_novelas", [
+        "CREATE TABLE IF NOT EXISTS glosario_novelas ("
+        "id_termino INT AUTO_INCREMENT PRIMARY KEY, "
+        "id_novela INT NOT NULL, "
+        "termino_original VARCHAR(100) NOT NULL, "
+        "termino_traducido VARCHAR(200) NOT NULL, "
+        "notas VARCHAR(255) NULL, "
+        "fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "UNIQUE KEY uq_glosario_termino (id_novela, termino_original), "
+        "CONSTRAINT fk_glosario_novela FOREIGN KEY (id_novela) REFERENCES novelas (id_novela) ON DELETE CASCADE"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4",
+    ]),
+    ("0004_autores_unicos", [
+        # Las novelas pasan a apuntar al autor más antiguo con el mismo nombre
+        "UPDATE novelas n JOIN autores_novelas a ON n.id_autor = a.id_autor "
+        "JOIN (SELECT nombre_autor, MIN(id_autor) AS id_min FROM autores_novelas GROUP BY nombre_autor) m "
+        "ON m.nombre_autor = a.nombre_autor "
+        "SET n.id_autor = m.id_min WHERE n.id_autor <> m.id_min",
+        "DELETE a FROM autores_novelas a JOIN autores_novelas b "
+        "ON a.nombre_autor = b.nombre_autor AND a.id_autor > b.id_autor",
+        "ALTER TABLE autores_novelas ADD UNIQUE KEY uq_autor_nombre (nombre_autor)",
+    ]),
+    ("0005_contenido_comprimido", [
+        "ALTER TABLE capitulos ADD COLUMN contenido_comprimido MEDIUMBLOB NULL",
+        # La columna existía como TEXT pero nunca se escribía
+        "ALTER TABLE capitulos_traduccion_espanol MODIFY contenido_comprimido MEDIUMBLOB NULL",
+        "CREATE TABLE IF NOT EXISTS diccionarios_compresion ("
+        "id_diccionario BIGINT NOT NULL PRIMARY KEY, "
+        "id_novela INT NOT NULL, "
+        "datos MEDIUMBLOB NOT NULL, "
+        "fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "KEY idx_diccionarios_novela (id_novela), "
+        "CONSTRAINT fk_diccionario_novela FOREIGN KEY (id_novela) REFERENCES novelas (id_novela) ON DELETE CASCADE"
+        ") ENGINE=InnoDB",
+    ]),
+    ("0006_estado_pipeline", [
+        "ALTER TABLE capitulos ADD COLUMN estado_pipeline "
+        "ENUM('descubierto','scrapeando','scrapeado','traduciendo','traducido','fallido') "
+        "NOT NULL DEFAULT 'descubierto'",
+        "UPDATE capitulos c SET c.estado_pipeline = CASE "
+        "WHEN EXISTS (SELECT 1 FROM capitulos_traduccion_espanol t WHERE t.id_capitulo = c.id_capitulo) THEN 'traducido' "
+        "WHEN c.contenido_original IS NOT NULL OR c.contenido_comprimido IS NOT NULL THEN 'scrapeado' "
+        "WHEN c.fuente_url IS NULL THEN 'fallido' "
+        "ELSE 'descubierto' END",
+        # Prioridad descendente para que ORDER BY ... LIMIT salga directamente del índice
+        "CREATE INDEX idx_capitulos_pipeline ON capitulos (estado_pipeline, prioridad_traduccion DESC, id_novela)",
+    ]),
+    ("0007_discovery_incremental", [
+        "ALTER TABLE novelas ADD COLUMN ultimo_capitulo_url VARCHAR(255) NULL, "
+        "ADD COLUMN ultimo_capitulo_posicion INT NULL, "
+        "ADD COLUMN ultimo_rescan_completo TIMESTAMP NULL DEFAULT NULL",
+        # Discovery no rellenaba orden_capitulo: se iguala al número hasta el próximo rescan completo
+        "UPDATE capitulos SET orden_capitulo = numero_capitulo WHERE orden_capitulo IS NULL OR orden_capitulo = 0",
+        "CREATE INDEX idx_capitulos_novela_orden ON capitulos (id_novela, orden_capitulo)",
+    ]),
+    ("0008_fallos_scraping", [
+        "ALTER TABLE capitulos ADD COLUMN ultimo_error_scraping VARCHAR(255) NULL, "
+        "ADD COLUMN reintentar_despues TIMESTAMP NULL DEFAULT NULL",
+    ]),
+    ("0009_revision_capitulos", [
+        "ALTER TABLE capitulos ADD COLUMN revisado_en TIMESTAMP NULL DEFAULT NULL",
+    ]),
+    ("0010_indice_pipeline_leases", [
+        # Cada reclamación filtra por estado y lease_expira con igualdad: así el LIMIT sale
+        # del índice en orden y FOR UPDATE SKIP LOCKED sólo bloquea las filas que se lleva
+        "DROP INDEX idx_capitulos_pipeline ON capitulos",
+        "CREATE INDEX idx_capitulos_pipeline ON capitulos "
+        "(estado_pipeline, lease_expira, prioridad_traduccion DESC, id_novela, reintentar_despues)",
+    ]),
+    ("0011_intentos_traduccion", [
+        "ALTER TABLE capitulos ADD COLUMN intentos_traduccion INT NOT NULL DEFAULT 0",
+    ]),
+    ("0012_indice_revision", [
+        # La revisión filtra y ordena por revisado_en, que ahora se rellena al scrapear
+        "UPDATE capitulos SET revisado_en = scrapeado_en WHERE revisado_en IS NULL AND scrapeado_en IS NOT NULL",
+        "CREATE INDEX idx_capitulos_revision ON capitulos (estado_pipeline, revisado_en, scrapeado_en)",
+    ]),
+    ("0013_memoria_por_glosario", [
+        # Las entradas anteriores no dicen con qué glosario se tradujeron (podrían llevar
+        # nombres impuestos por el de otra novela): se descartan
+        "DELETE FROM memoria_traduccion",
+        "ALTER TABLE memoria_traduccion ADD COLUMN hash_glosario CHAR(64) NOT NULL DEFAULT '' AFTER hash_parrafo, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (hash_parrafo, hash_glosario)",
+    ]),
+]
+
+
+def aplicar_migraciones(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS agente_migraciones ("
+            "nombre VARCHAR(100) PRIMARY KEY, "
+            "aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        aplicadas = {fila[0] for fila in conn.execute(text("SELECT nombre FROM agente_migraciones"))}
+
+    for nombre, sentencias in MIGRACIONES:
+        if nombre in aplicadas:
+            continue
+        logger.info(f"🛠️ Aplicando migración {nombre}")
+        # MySQL hace commit implícito en cada DDL: se registran al terminar todas
+        with engine.begin() as conn:
+            for sentencia in sentencias:
+                conn.execute(text(sentencia))
+            conn.execute(text("INSERT INTO agente_migraciones (nombre) VALUES (:nombre)"), {"nombre": nombre})
+    logger.info("✅ Esquema al día")
+
+
+if __name__ == "__main__":
+    from app.db.database import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    aplicar_migraciones(engine)
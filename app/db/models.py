@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, TIMESTAMP, Enum, JSON, DECIMAL, Date, BIGINT
+from typing import Optional
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, TIMESTAMP, Enum, JSON, DECIMAL, Date, BIGINT, UniqueConstraint, LargeBinary, Index
+from sqlalchemy.orm import object_session, deferred
 from sqlalchemy.sql import func
 from app.db.database import Base
 
@@ -9,7 +11,8 @@ class Novela(Base):
     titulo_original = Column(String(200), nullable=False)
     id_autor = Column(Integer, ForeignKey("autores_novelas.id_autor"), nullable=True)
     autor_original = Column(String(100))
-    descripcion_original = Column(Text)
+    # Las columnas de texto grandes no se cargan con la entidad, sólo al leerlas
+    descripcion_original = deferred(Column(Text))
     url_original_qidian = Column(String(255))
     estado_original = Column(Enum('en_progreso', 'completado', 'pausado', 'cancelado'), default='en_progreso')
     fecha_publicacion_original = Column(Date)
@@ -26,16 +29,34 @@ class Novela(Base):
     total_comentarios = Column(Integer, default=0)
     fecha_creacion = Column(TIMESTAMP, server_default=func.now())
     fecha_actualizacion = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Reparto de trabajo entre workers (ver app/services/leases.py)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expira = Column(TIMESTAMP, nullable=True)
+    # Cola del índice para el discovery incremental (ver migración 0007)
+    ultimo_capitulo_url = Column(String(255), nullable=True)
+    ultimo_capitulo_posicion = Column(Integer, nullable=True)
+    ultimo_rescan_completo = Column(TIMESTAMP, nullable=True)
+
+# Estado de cada capítulo en el agente: descubierto → scrapeando → scrapeado → traduciendo → traducido
+ESTADOS_PIPELINE = ('descubierto', 'scrapeando', 'scrapeado', 'traduciendo', 'traducido', 'fallido')
 
 class Capitulo(Base):
     __tablename__ = "capitulos"
+    # Los índices llevan los nombres de app/db/migrations.py: create_all y una DB migrada
+    # acaban con los mismos (idx_capitulos_pipeline va después de la clase)
+    __table_args__ = (
+        Index("idx_capitulos_lease", "lease_expira"),
+        Index("idx_capitulos_hash_contenido", "hash_contenido"),
+        Index("idx_capitulos_novela_orden", "id_novela", "orden_capitulo"),
+        Index("idx_capitulos_revision", "estado_pipeline", "revisado_en", "scrapeado_en"),
+    )
 
     id_capitulo = Column(Integer, primary_key=True, index=True)
     id_novela = Column(Integer, ForeignKey("novelas.id_novela"), nullable=False)
     numero_capitulo = Column(Integer, nullable=False)
     orden_capitulo = Column(Integer, nullable=False)
     titulo_original = Column(String(200))
-    contenido_original = Column(Text)
+    contenido_original = deferred(Column(Text), group="texto")
     fecha_publicacion_original = Column(TIMESTAMP, nullable=True)
     fuente_url = Column(String(255))
     palabras_original = Column(Integer)
@@ -45,30 +66,96 @@ class Capitulo(Base):
     hash_contenido = Column(String(64))
     scrapeado_en = Column(TIMESTAMP, nullable=True)
     intentos_scraping = Column(Integer, default=0)
+    intentos_traduccion = Column(Integer, default=0)
+    # Último fallo de lectura y cuándo se puede reintentar (ver app/services/fallos.py)
+    ultimo_error_scraping = Column(String(255), nullable=True)
+    reintentar_despues = Column(TIMESTAMP, nullable=True)
+    # Última vez que se comparó con la fuente (ver app/services/revision.py)
+    revisado_en = Column(TIMESTAMP, nullable=True)
     fecha_creacion = Column(TIMESTAMP, server_default=func.now())
     fecha_actualizacion = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Reparto de trabajo entre workers (ver app/services/leases.py)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expira = Column(TIMESTAMP, nullable=True)
+    estado_pipeline = Column(Enum(*ESTADOS_PIPELINE), nullable=False, default='descubierto')
+    # Texto original en zstd (ver app/db/compresion.py); excluyente con contenido_original.
+    # Las dos columnas de texto se cargan juntas y sólo cuando se leen
+    contenido_comprimido = deferred(Column(LargeBinary), group="texto")
+
+    @property
+    def texto_original(self) -> Optional[str]:
+        """Texto original, descomprimido bajo demanda si está guardado en zstd."""
+        if self.contenido_original is not None:
+            return self.contenido_original
+        if self.contenido_comprimido is not None:
+            from app.db.compresion import descomprimir
+            return descomprimir(self.contenido_comprimido, object_session(self))
+        return None
+
+    @texto_original.setter
+    def texto_original(self, texto: Optional[str]):
+        from app.db.compresion import columnas_texto
+        self.contenido_original, self.contenido_comprimido = columnas_texto(texto, object_session(self), self.id_novela)
+
+# La búsqueda del siguiente lote recorre sólo este índice (ver migración 0010): con estado
+# y lease_expira por igualdad (ver leases.reclamar_por_estado) las filas salen ya en el
+# orden de ORDEN_PENDIENTES, y reintentar_despues se filtra sin leer la fila
+Index(
+    "idx_capitulos_pipeline",
+    Capitulo.estado_pipeline, Capitulo.lease_expira, Capitulo.prioridad_traduccion.desc(),
+    Capitulo.id_novela, Capitulo.reintentar_despues
+)
+ORDEN_PENDIENTES = [Capitulo.prioridad_traduccion.desc(), Capitulo.id_novela]
+
+class TraduccionNovela(Base):
+    __tablename__ = "novelas_traduccion_espanol"
+
+    # Tabla de la plataforma: aquí sólo las columnas que usa el agente
+    id_traduccion_novela_es = Column(Integer, primary_key=True, index=True)
+    id_novela = Column(Integer, ForeignKey("novelas.id_novela"), nullable=False, index=True)
+    titulo_traducido = Column(String(200))
+    fecha_creacion = Column(TIMESTAMP, server_default=func.now())
 
 class TraduccionCapitulo(Base):
     __tablename__ = "capitulos_traduccion_espanol"
 
     id_traduccion_capitulo_es = Column(Integer, primary_key=True, index=True)
     id_capitulo = Column(Integer, ForeignKey("capitulos.id_capitulo"), nullable=False)
-    id_traduccion_novela_es = Column(Integer, nullable=False)
+    id_traduccion_novela_es = Column(Integer, ForeignKey("novelas_traduccion_espanol.id_traduccion_novela_es"), nullable=False)
     titulo_traducido = Column(String(200))
-    contenido_traducido = Column(Text)
+    contenido_traducido = deferred(Column(Text), group="texto")
     estado_traduccion = Column(Enum('pendiente', 'en_progreso', 'completado', 'pausado', 'error'), default='pendiente')
     fecha_traduccion = Column(TIMESTAMP, server_default=func.now())
     traductor_ia = Column(String(50))
     version_traduccion = Column(Integer, default=1)
     calidad_estimada = Column(Enum('baja', 'media', 'alta', 'excelente'), default='media')
     palabras_traducidas = Column(Integer)
-    contenido_comprimido = Column(Text)
+    contenido_comprimido = deferred(Column(LargeBinary), group="texto")
     hash_traduccion = Column(String(64))
     tiempo_traduccion_segundos = Column(Integer)
     costo_traduccion = Column(DECIMAL(10,4), default=0)
     revisado_manualmente = Column(Boolean, default=False)
     errores_reportados = Column(Integer, default=0)
 
+    @property
+    def texto_traducido(self) -> Optional[str]:
+        """Traducción, leída de contenido_comprimido si está disponible."""
+        if self.contenido_comprimido is not None:
+            from app.db.compresion import descomprimir
+            return descomprimir(self.contenido_comprimido, object_session(self))
+        return self.contenido_traducido
+
+    @texto_traducido.setter
+    def texto_traducido(self, texto: Optional[str]):
+        from app.db.compresion import columnas_texto
+        from app.core.config import settings
+        # La plataforma Laravel lee contenido_traducido: se mantiene en claro salvo que se
+        # desactive, y entonces no se guarda además comprimido (ocuparía más, no menos)
+        if settings.COMPRESION_TRADUCCION_EN_CLARO:
+            self.contenido_traducido, self.contenido_comprimido = texto, None
+        else:
+            self.contenido_traducido, self.contenido_comprimido = columnas_texto(texto)
+
 class FuenteScraping(Base):
     __tablename__ = "fuentes_scraping"
 
@@ -92,10 +179,43 @@ class FuenteScraping(Base):
 
 class AutoresNovelas(Base):
     __tablename__ = "autores_novelas"
+    __table_args__ = (UniqueConstraint("nombre_autor", name="uq_autor_nombre"),)
 
     id_autor = Column(Integer, primary_key=True, index=True)
     nombre_autor = Column(String(100), nullable=False)
     biografia = Column(Text)
     otras_obras = Column(JSON)
     seguidores = Column(Integer, default=0)
-    # índice se puede crear desde migraciones si se desea
\ No newline at end of file
+
+class MemoriaTraduccion(Base):
+    __tablename__ = "memoria_traduccion"
+
+    # sha256 del párrafo original normalizado y de los términos del glosario que se le
+    # aplicaron ("" si ninguno) (ver app/services/translation_memory.py)
+    hash_parrafo = Column(String(64), primary_key=True)
+    hash_glosario = Column(String(64), primary_key=True, default="")
+    texto_traducido = Column(Text, nullable=False)
+    fecha_creacion = Column(TIMESTAMP, server_default=func.now())
+
+
+class GlosarioNovela(Base):
+    __tablename__ = "glosario_novelas"
+    __table_args__ = (UniqueConstraint("id_novela", "termino_original", name="uq_glosario_termino"),)
+
+    id_termino = Column(Integer, primary_key=True)
+    id_novela = Column(Integer, ForeignKey("novelas.id_novela"), nullable=False)
+    termino_original = Column(String(100), nullable=False)
+    termino_traducido = Column(String(200), nullable=False)
+    notas = Column(String(255))
+    fecha_creacion = Column(TIMESTAMP, server_default=func.now())
+
+
+class DiccionarioCompresion(Base):
+    __tablename__ = "diccionarios_compresion"
+    __table_args__ = (Index("idx_diccionarios_novela", "id_novela"),)
+
+    # dict_id de zstd (va en la cabecera de cada frame comprimido con el diccionario)
+    id_diccionario = Column(BIGINT, primary_key=True, autoincrement=False)
+    id_novela = Column(Integer, ForeignKey("novelas.id_novela"), nullable=False)
+    datos = Column(LargeBinary, nullable=False)
+    fecha_creacion = Column(TIMESTAMP, server_default=func.now())
@@ -1,15 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.core.config import settings
+from app.api.novelas import router as novelas_router
+from app.api.exportacion import router as exportacion_router
 
 app = FastAPI(
     title="Agente de Novelas IA",
     description="Servicio de scraping y traducción para la plataforma Laravel"
 )
 
+# Brotli si está instalado (brotli-asgi también sirve gzip a quien no lo acepte); si no, gzip
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+app.include_router(novelas_router)
+app.include_router(exportacion_router)
+
+@app.get("/metrics")
+async def metricas():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def health_check():
     return {
         "status": "online",
         "agent": "NovelAgent-V1",
         "db_connected": f"Host: {settings.DB_HOST}"
-    }
\ No newline at end of file
+    }
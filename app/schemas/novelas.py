@@ -0,0 +1,52 @@
+from datetime import date, datetime
+from typing import Generic, Optional, TypeVar
+from pydantic import BaseModel, ConfigDict
+
+T = TypeVar("T")
+
+
+class Pagina(BaseModel, Generic[T]):
+    items: list[T]
+    # Cursor para pedir la página siguiente (None si no hay más)
+    siguiente: Optional[str] = None
+
+
+class NovelaResumen(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_novela: int
+    titulo_original: str
+    autor_original: Optional[str] = None
+    estado_original: Optional[str] = None
+    portada_url: Optional[str] = None
+    total_capitulos_originales: Optional[int] = None
+    ultimo_scraping: Optional[datetime] = None
+
+
+class NovelaDetalle(NovelaResumen):
+    descripcion_original: Optional[str] = None
+    fecha_publicacion_original: Optional[date] = None
+    fuente_scraping: Optional[str] = None
+
+
+class CapituloResumen(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_capitulo: int
+    numero_capitulo: int
+    titulo_original: Optional[str] = None
+    estado_pipeline: str
+    scrapeado_en: Optional[datetime] = None
+
+
+class CapituloContenido(BaseModel):
+    id_capitulo: int
+    id_novela: int
+    numero_capitulo: int
+    titulo: Optional[str] = None
+    contenido: str
+
+
+class Invalidacion(BaseModel):
+    novelas: list[int] = []
+    capitulos: list[int] = []
@@ -0,0 +1,56 @@
+import logging
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+from app.db.models import AutoresNovelas
+
+logger = logging.getLogger(__name__)
+
+# nombre_autor -> id_autor, compartido por todo el proceso
+_cache_autores: dict[str, int] = {}
+
+
+def precargar_autores(db: Session, nombres: set[str]):
+    """Carga de una vez los IDs de los autores que aún no están en la caché."""
+    faltan = [n for n in nombres if n and n not in _cache_autores]
+    if not faltan:
+        return
+    filas = db.query(AutoresNovelas.nombre_autor, AutoresNovelas.id_autor).filter(
+        AutoresNovelas.nombre_autor.in_(faltan)
+    ).all()
+    _cache_autores.update({nombre: id_autor for nombre, id_autor in filas})
+
+
+def id_autor(db: Session, nombre: str) -> int:
+    """
+    Devuelve el id del autor, creándolo si no existe. No hace commit: la fila
+    se confirma junto con la novela que lo referencia.
+    """
+    nombre = nombre.strip()
+    if nombre in _cache_autores:
+        return _cache_autores[nombre]
+
+    if db.bind.dialect.name == "mysql":
+        # Upsert sobre la clave única de nombre_autor: LAST_INSERT_ID devuelve el id
+        # tanto si se inserta como si ya existía
+        sentencia = mysql_insert(AutoresNovelas).values(nombre_autor=nombre).on_duplicate_key_update(
+            id_autor=func.last_insert_id(AutoresNovelas.id_autor)
+        )
+        nuevo_id = db.execute(sentencia).lastrowid
+    else:
+        existente = db.query(AutoresNovelas.id_autor).filter(AutoresNovelas.nombre_autor == nombre).first()
+        if existente:
+            nuevo_id = existente[0]
+        else:
+            autor = AutoresNovelas(nombre_autor=nombre)
+            db.add(autor)
+            db.flush()
+            nuevo_id = autor.id_autor
+
+    _cache_autores[nombre] = nuevo_id
+    return nuevo_id
+
+
+def olvidar_autor(nombre: str):
+    """Para deshacer la caché si la transacción que creó el autor hace rollback."""
+    _cache_autores.pop(nombre.strip(), None)
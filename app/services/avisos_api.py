@@ -0,0 +1,35 @@
+import asyncio
+import logging
+from typing import Iterable
+from app.core.config import settings
+from app.services.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Referencias a los envíos en curso (si no, el recolector puede cancelarlos)
+_envios: set[asyncio.Task] = set()
+
+
+def avisar_cambios(novelas: Iterable[int] = (), capitulos: Iterable[int] = ()):
+    """
+    Avisa a la API de lectura de lo que ha escrito el worker para que invalide su
+    caché. No bloquea: si la API no responde, sus entradas caducan por TTL.
+    """
+    if not settings.API_URL_INVALIDACION or not settings.API_TOKEN_INTERNO:
+        return
+    cuerpo = {"novelas": sorted(set(novelas)), "capitulos": sorted(set(capitulos))}
+    if not cuerpo["novelas"] and not cuerpo["capitulos"]:
+        return
+    envio = asyncio.create_task(_enviar(cuerpo))
+    _envios.add(envio)
+    envio.add_done_callback(_envios.discard)
+
+
+async def _enviar(cuerpo: dict):
+    cabeceras = {"X-Token-Interno": settings.API_TOKEN_INTERNO} if settings.API_TOKEN_INTERNO else {}
+    try:
+        respuesta = await get_http_client().post(settings.API_URL_INVALIDACION, json=cuerpo, headers=cabeceras)
+        if respuesta.status_code >= 400:
+            logger.debug(f"La API rechazó la invalidación de caché: HTTP {respuesta.status_code}")
+    except Exception as e:
+        logger.debug(f"No se pudo avisar a la API: {e}")
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+
+
+class _BrowserSlot:
+    """Un Chromium caliente con su contexto reutilizable."""
+
+    def __init__(self, indice: int):
+        self.indice = indice
+        self.browser = None
+        self.context = None
+        self.paginas_servidas = 0
+        self.caido = False
+
+    def necesita_reinicio(self, max_paginas: int) -> bool:
+        if self.browser is None or self.caido:
+            return True
+        if not self.browser.is_connected():
+            return True
+        return self.paginas_servidas >= max_paginas
+
+
+class BrowserPool:
+    """
+    Pool de navegadores Chromium compartido por todo el worker.
+
+    Mantiene `tamano` navegadores lanzados con un contexto reutilizable cada uno.
+    Cada llamada a `lease()` presta una página nueva de un navegador libre; el
+    navegador se reinicia tras `max_paginas` páginas servidas o si se cae.
+    """
+
+    def __init__(self, tamano: int, max_paginas: int, headless: bool = True):
+        self.tamano = max(1, tamano)
+        self.max_paginas = max(1, max_paginas)
+        self.headless = headless
+        self._playwright = None
+        self._slots: list[_BrowserSlot] = []
+        self._libres: asyncio.Queue | None = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._lock:
+            if self._playwright is not None:
+                return
+            # Playwright se importa aquí: los procesos que no abren el navegador no lo cargan
+            from playwright.async_api import async_playwright
+
+            logger.info(f"🧭 Iniciando pool de navegadores ({self.tamano} instancias)")
+            self._playwright = await async_playwright().start()
+            self._libres = asyncio.Queue()
+            for i in range(self.tamano):
+                slot = _BrowserSlot(i)
+                try:
+                    await self._lanzar(slot)
+                except Exception as e:
+                    # Se reintentará al prestarlo por primera vez
+                    logger.warning(f"⚠️ No se pudo lanzar el navegador #{i}: {e}")
+                    slot.caido = True
+                self._slots.append(slot)
+                self._libres.put_nowait(slot)
+
+    async def _lanzar(self, slot: _BrowserSlot):
+        slot.browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            args=["--disable-blink-features=AutomationControlled"]
+        )
+        slot.browser.on("disconnected", lambda _: setattr(slot, "caido", True))
+        slot.context = await slot.browser.new_context(user_agent=USER_AGENT)
+        await slot.context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        slot.paginas_servidas = 0
+        slot.caido = False
+
+    async def _cerrar_slot(self, slot: _BrowserSlot):
+        if slot.browser is not None:
+            try:
+                await slot.browser.close()
+            except Exception:
+                pass
+        slot.browser = None
+        slot.context = None
+
+    async def _reiniciar(self, slot: _BrowserSlot):
+        logger.info(f"♻️ Reiniciando navegador #{slot.indice} ({slot.paginas_servidas} páginas servidas)")
+        await self._cerrar_slot(slot)
+        await self._lanzar(slot)
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Presta una página de un navegador libre. La página se cierra al salir;
+        el contexto del navegador se conserva para la siguiente llamada.
+        """
+        await self.start()
+        slot = await self._libres.get()
+        page = None
+        try:
+            if slot.necesita_reinicio(self.max_paginas):
+                await self._reiniciar(slot)
+            page = await slot.context.new_page()
+            yield page
+        finally:
+            slot.paginas_servidas += 1
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    slot.caido = True
+            self._libres.put_nowait(slot)
+
+    async def close(self):
+        async with self._lock:
+            if self._playwright is None:
+                return
+            for slot in self._slots:
+                await self._cerrar_slot(slot)
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+            self._slots = []
+            self._libres = None
+            logger.info("🧭 Pool de navegadores cerrado")
+
+
+# Pool único del proceso: lo arranca el worker y lo comparten discovery y scraper
+browser_pool = BrowserPool(
+    tamano=settings.BROWSER_POOL_SIZE,
+    max_paginas=settings.BROWSER_MAX_PAGINAS,
+    headless=settings.BROWSER_HEADLESS
+)
@@ -1,361 +1,459 @@
-import asyncio
+import hashlib
 import logging
 import re
+import time
 from urllib.parse import urljoin
-from datetime import datetime
-from playwright.async_api import async_playwright
+from datetime import datetime, timedelta
+from typing import Optional
+from dataclasses import dataclass
+from sqlalchemy import or_, insert, update, bindparam, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.models import Novela, Capitulo, AutoresNovelas
+from app.core.config import settings
+from app.core.metricas import NAVEGACION, EXTRACCION, CAPITULOS_DESCUBIERTOS
+from app.db.models import Novela, Capitulo, FuenteScraping
+from app.services.browser_pool import browser_pool
+from app.services.http_client import get_http_client
+from app.services.avisos_api import avisar_cambios
+from app.services.autores import id_autor, precargar_autores, olvidar_autor
+from app.services.fuentes import fuentes_cacheadas, fuente_para_url
+from app.services.fallos import circuito_para, guardar_estado_fuentes
+from app.services.leases import reclamar, liberar
+from app.services.extraction_rules import reglas_para, transformar_url, extraer_en_pagina, extraer_campo_lxml
+from app.services.page_loader import (
+    Plazo, perfil_de_carga, bloquear_recursos, cargar, contar_enlaces, esperar_enlaces_estables,
+    pulsar_antes_de_extraer
+)
 
 logger = logging.getLogger(__name__)
 
-async def discover_new_chapters(db: Session):
-    novelas = db.query(Novela).filter(Novela.fuente_scraping != None).all()
-    if not novelas: return
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=False, 
-            args=["--disable-blink-features=AutomationControlled"]
+@dataclass
+class NovelaPendiente:
+    """
+    Lo que discovery necesita de cada novela, leído antes de empezar el trabajo async
+    (con AsyncSession no se puede cargar un atributo caducado fuera de run_sync).
+    """
+    id_novela: int
+    titulo: str
+    url: str
+    hash_metadata: Optional[str]
+    fuente: Optional[FuenteScraping]
+    # Último capítulo conocido del índice (para leer sólo la cola)
+    ultima_url: Optional[str] = None
+    ultima_posicion: Optional[int] = None
+    ultimo_rescan: Optional[datetime] = None
+
+
+# Sólo las columnas que usa discovery: sin entidades Novela en la sesión (ni su descripción)
+_COLUMNAS_PENDIENTES = (
+    Novela.id_novela, Novela.titulo_original, Novela.fuente_scraping, Novela.hash_metadata,
+    Novela.ultimo_scraping, Novela.autor_original, Novela.ultimo_capitulo_url,
+    Novela.ultimo_capitulo_posicion, Novela.ultimo_rescan_completo
+)
+
+
+def _novelas_pendientes(db: Session, ahora: datetime, despues_de: int) -> tuple[list[NovelaPendiente], int, Optional[int]]:
+    """
+    Siguiente lote (DISCOVERY_LOTE_NOVELAS) de novelas con id mayor que `despues_de`.
+    Devuelve las que tocan, cuántas se leyeron y el último id (None si no quedan más).
+    """
+    fuentes = fuentes_cacheadas(db)
+
+    # Prefiltro en SQL con el intervalo más corto configurado; el fino se hace por fuente
+    intervalo_min = min([f.intervalo_scraping_min for f in fuentes if f.intervalo_scraping_min] + [settings.DISCOVERY_INTERVALO_MIN])
+    lote = max(1, settings.DISCOVERY_LOTE_NOVELAS)
+    filas = db.query(*_COLUMNAS_PENDIENTES).filter(
+        Novela.id_novela > despues_de,
+        Novela.fuente_scraping != None,
+        or_(Novela.ultimo_scraping == None, Novela.ultimo_scraping <= ahora - timedelta(minutes=intervalo_min))
+    ).order_by(Novela.id_novela).limit(lote).all()
+
+    pendientes = []
+    autores = set()
+    for fila in filas:
+        fuente = fuente_para_url(fila.fuente_scraping, fuentes)
+        if _toca_revisar(fila, fuente, ahora):
+            pendientes.append(NovelaPendiente(
+                fila.id_novela, fila.titulo_original, fila.fuente_scraping, fila.hash_metadata, fuente,
+                fila.ultimo_capitulo_url, fila.ultimo_capitulo_posicion, fila.ultimo_rescan_completo
+            ))
+            if fila.autor_original:
+                autores.add(fila.autor_original.strip())
+
+    # Los autores conocidos se resuelven con una sola consulta por lote
+    precargar_autores(db, autores)
+    ultimo_id = filas[-1].id_novela if len(filas) == lote else None
+    return pendientes, len(filas), ultimo_id
+
+
+async def discover_new_chapters(db: AsyncSession) -> list[int]:
+    """
+    Revisa las novelas que tocan y devuelve los IDs de los capítulos nuevos.
+    Las novelas se leen por lotes y la sesión se vacía entre uno y otro, así que
+    la memoria no crece con el tamaño del catálogo.
+    """
+    ahora = datetime.utcnow()
+    revisadas = set()
+    nuevos_ids = []
+    leidas = por_revisar = 0
+    despues_de: Optional[int] = 0
+    while despues_de is not None:
+        pendientes, n, despues_de = await db.run_sync(_novelas_pendientes, ahora, despues_de)
+        leidas += n
+        por_revisar += len(pendientes)
+        if pendientes:
+            nuevos_ids.extend(await _revisar_lote(db, pendientes, revisadas))
+        # Nada de lo cargado en este lote hace falta para el siguiente
+        db.expunge_all()
+
+    if leidas:
+        logger.info(f"🗓️ {por_revisar} novelas revisadas ({leidas - por_revisar} aún dentro de su intervalo)")
+
+    # Marcamos cuándo se revisó cada fuente por última vez (y su tasa de éxito / bloqueo)
+    if revisadas:
+        await db.execute(
+            update(FuenteScraping).where(FuenteScraping.id_fuente.in_(revisadas)).values(ultimo_check=datetime.utcnow()),
+            execution_options={"synchronize_session": False}
         )
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+    await db.run_sync(guardar_estado_fuentes)
+    await db.commit()
+    return nuevos_ids
+
+
+async def _revisar_lote(db: AsyncSession, pendientes: list[NovelaPendiente], revisadas: set[int]) -> list[int]:
+    # Con varios workers, cada novela la revisa sólo quien consiga su lease
+    reclamadas = set(await db.run_sync(
+        reclamar, Novela, [Novela.id_novela.in_([n.id_novela for n in pendientes])], len(pendientes)
+    ))
+
+    nuevos_ids = []
+    for novela in pendientes:
+        if novela.id_novela not in reclamadas:
+            continue
+        circuito = circuito_para(novela.fuente, novela.url)
+        try:
+            if not circuito.permite():
+                logger.info(f"🚧 Se salta {novela.titulo}: la fuente {circuito.nombre} está bloqueada")
+                continue
+            # Las reglas de cada sitio salen de fuentes_scraping (o de las integradas)
+            reglas = reglas_para(novela.url, novela.fuente)
+            nuevos = await _procesar_novela(db, novela, reglas)
+            circuito.registrar(nuevos is not None)
+            nuevos_ids.extend(nuevos or [])
+            avisar_cambios(novelas=[novela.id_novela])
+            if novela.fuente is not None:
+                revisadas.add(novela.fuente.id_fuente)
+        finally:
+            await db.rollback()
+            await db.run_sync(liberar, Novela, [novela.id_novela])
+            await db.commit()
+    return nuevos_ids
+
+
+def _toca_revisar(novela, fuente: Optional[FuenteScraping], ahora: datetime) -> bool:
+    if novela.ultimo_scraping is None:
+        return True
+    intervalo = (fuente.intervalo_scraping_min if fuente else None) or settings.DISCOVERY_INTERVALO_MIN
+    return novela.ultimo_scraping + timedelta(minutes=intervalo) <= ahora
+
+
+async def _huella_portada(portada_url: str, reglas: dict) -> Optional[str]:
+    """
+    Huella de la portada pedida por HTTP (sin navegador). None si la fuente no define
+    regla de huella o no se pudo calcular.
+    """
+    if not reglas.get("huella"):
+        return None
+    try:
+        respuesta = await get_http_client().get(portada_url)
+        if respuesta.status_code >= 400:
+            return None
+        NAVEGACION.labels("portada", "http").observe(respuesta.elapsed.total_seconds())
+        texto = extraer_campo_lxml(respuesta.text, reglas["huella"])
+    except Exception as e:
+        logger.debug(f"No se pudo calcular la huella de {portada_url}: {e}")
+        return None
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest() if texto else None
+
+
+async def _procesar_novela(db: AsyncSession, novela: NovelaPendiente, reglas: dict) -> Optional[list[int]]:
+    """IDs de los capítulos nuevos, o None si no se pudo leer el índice."""
+    url = novela.url
+    portada_url = transformar_url(url, reglas["url_portada"])
+
+    huella = await _huella_portada(portada_url, reglas)
+    sin_cambios = huella is not None and huella == novela.hash_metadata
+    if sin_cambios and reglas.get("huella_cubre_indice"):
+        logger.info(f"⏭️ Sin cambios desde la última revisión: {novela.titulo}")
+        await _marcar_revisada(db, novela.id_novela)
+        return []
+
+    async with browser_pool.lease() as page:
+        await bloquear_recursos(page, perfil_de_carga(reglas, "portada"))
+        metadata_ok = sin_cambios or await _extraer_metadata(db, page, novela.id_novela, portada_url, reglas)
+        nuevos_ids = await _sincronizar_indice(db, page, novela, url, reglas)
+        if nuevos_ids is not None:
+            # Sólo guardamos la huella cuando portada e índice se leyeron bien, para reintentar si falla
+            await _marcar_revisada(db, novela.id_novela, huella if metadata_ok else None)
+    return nuevos_ids
+
+
+async def _marcar_revisada(db: AsyncSession, id_novela: int, huella: Optional[str] = None):
+    valores = {"ultimo_scraping": datetime.utcnow()}
+    if huella is not None:
+        valores["hash_metadata"] = huella
+    await db.execute(
+        update(Novela).where(Novela.id_novela == id_novela).values(**valores),
+        execution_options={"synchronize_session": False}
+    )
+    await db.commit()
+
+
+async def _extraer_metadata(db: AsyncSession, page, id_novela: int, portada_url: str, reglas: dict) -> bool:
+    # --- VISITAR LA PORTADA PRIMERO: extraer metadata útil ---
+    try:
+        perfil = perfil_de_carga(reglas, "portada")
+        plazo = Plazo(perfil["plazo_seg"])
+        with NAVEGACION.labels("portada", "navegador").time():
+            await cargar(page, portada_url, perfil, plazo)
+            await pulsar_antes_de_extraer(page, perfil, plazo)
+
+        # Todos los campos de la portada en un único page.evaluate
+        with EXTRACCION.labels("portada", "navegador").time():
+            datos = await extraer_en_pagina(page, reglas, ("campos",), portada_url)
+        await db.run_sync(_aplicar_metadata, id_novela, datos.get("campos") or {}, portada_url, reglas["modo_metadata"])
+        return True
+    except Exception as e:
+        logger.debug(f"No se pudo acceder a la portada ({portada_url}): {e}")
+        return False
+
+
+def _lee_solo_la_cola(novela: NovelaPendiente, ahora: datetime) -> bool:
+    """Modo incremental: hay un último capítulo conocido y el último rescan completo es reciente."""
+    if not settings.DISCOVERY_RESCAN_COMPLETO_HORAS or not novela.ultima_url or not novela.ultima_posicion:
+        return False
+    return (novela.ultimo_rescan is not None
+            and novela.ultimo_rescan + timedelta(hours=settings.DISCOVERY_RESCAN_COMPLETO_HORAS) > ahora)
+
+
+async def _sincronizar_indice(db: AsyncSession, page, novela: NovelaPendiente, url: str, reglas: dict) -> Optional[list[int]]:
+    """
+    Lee el índice y da de alta los capítulos nuevos. Devuelve sus IDs (None si falla).
+
+    Entre rescans completos sólo se leen los enlaces posteriores al último capítulo
+    conocido (el "ancla"); si el ancla ya no aparece se hace un escaneo completo.
+    """
+    # Asegurarnos de que usamos la URL de índice para el scraping de capítulos
+    url = transformar_url(url, reglas["url_indice"])
+    ancla = novela.ultima_url if _lee_solo_la_cola(novela, datetime.utcnow()) else None
+
+    logger.info(f"🔍 Patrullando: {novela.titulo}" + (" (sólo cola)" if ancla else ""))
+
+    try:
+        inicio = time.monotonic()
+        perfil = perfil_de_carga(reglas, "indice")
+        plazo = Plazo(perfil["plazo_seg"])
+        await cargar(page, url, perfil, plazo)
+
+        # --- PASO 1: EXPANDIR (sólo si hace falta) ---
+        # Con el botón presente la lista visible está truncada (la parte a la vista es un
+        # prefijo), así que también en modo cola se expande antes de buscar el ancla
+        if reglas.get("boton_expandir"):
+            boton = page.locator(reglas["boton_expandir"])
+            if await boton.count() > 0:
+                logger.info("🖱️ Cargando capítulos ocultos...")
+                antes = await contar_enlaces(page, perfil)
+                await boton.first.click(force=True, timeout=plazo.ms())
+                # Hasta que la lista deje de crecer (o se acabe el plazo de la página)
+                await esperar_enlaces_estables(page, perfil, plazo, antes)
+
+        # Navegación + expansión del índice
+        NAVEGACION.labels("indice", "navegador").observe(time.monotonic() - inicio)
+
+        # --- PASO 2: LEER EN ORDEN VISUAL ---
+        # La lista (filtrada, sin duplicados y, con ancla, sólo la cola) llega en un solo round trip
+        logger.info("📡 Analizando lista por orden de aparición...")
+        with EXTRACCION.labels("indice", "navegador").time():
+            datos = await extraer_en_pagina(page, reglas, ("enlaces",), url, ancla)
+        enlaces = datos.get("enlaces") or []
+
+        completo = not ancla or not datos.get("posicion_ancla")
+        if ancla and completo:
+            logger.info("⚓ El último capítulo conocido ya no está en el índice: escaneo completo")
+        # La posición sale de la DB: en la página puede faltar la parte central sin expandir
+        primera = 1 if completo else novela.ultima_posicion + 1
+        logger.info(
+            f"🎯 Escaneo {'completo' if completo else 'de la cola'} finalizado: "
+            f"{len(enlaces)} capítulos en orden visual desde la posición {primera}."
         )
-        await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        page = await context.new_page()
-
-        for novela in novelas:
-            url = novela.fuente_scraping
 
-            # --- VISITAR LA PORTADA PRIMERO: extraer metadata útil ---
-            try:
-                if "index.html" in url:
-                    portada_url = url.replace('/index.html', '.html')
-                else:
-                    portada_url = url
-
-                # Sólo intentamos si cover distinto o faltan datos
-                await page.goto(portada_url, timeout=60000, wait_until="networkidle")
-                await asyncio.sleep(1)
-
-                # Intento específico para twkan.com (más fiable para portada)
-                titulo = autor = descripcion = portada_img = genero = fecha_text = None
-                if "twkan.com" in portada_url:
-                    try:
-                        # título
-                        t_el = await page.query_selector("div.booknav2 h1 a")
-                        if t_el:
-                            titulo = (await t_el.inner_text()).strip()
-
-                        # autor
-                        a_el = await page.query_selector("div.booknav2 p:has-text('作者') a")
-                        if a_el:
-                            autor = (await a_el.inner_text()).strip()
-
-                        # categoría
-                        c_el = await page.query_selector("div.booknav2 p:has-text('分類') a")
-                        categoria = (await c_el.inner_text()).strip() if c_el else None
-
-                        # fecha (línea que contiene '更新')
-                        f_el = await page.query_selector("div.booknav2 p:has-text('更新')")
-                        if f_el:
-                            fecha_text = (await f_el.inner_text()).strip()
-
-                        # Extraer el ID de la novela de la URL
-                        novel_id_match = re.search(r'/book/(\d+)', portada_url)
-                        portada_img = None
-                        if novel_id_match:
-                            novel_id = novel_id_match.group(1)
-                            # Buscar imagen cuyo src contenga el ID de la novela
-                            img_el = await page.query_selector(f'img[src*="{novel_id}"]')
-                            if img_el:
-                                portada_img = await img_el.get_attribute('src')
-                        
-                        # Fallback: buscar por alt con el título
-                        if not portada_img and titulo:
-                            img_el = await page.query_selector(f'img[alt="{titulo}"]')
-                            if img_el:
-                                portada_img = await img_el.get_attribute('src')
-
-                        # descripción: se muestra al clicar '#li_info' (twkan)
-                        descripcion = None
-                        try:
-                            info_btn = await page.query_selector('#li_info')
-                            if info_btn:
-                                try:
-                                    await info_btn.click()
-                                    await asyncio.sleep(0.4)
-                                except Exception:
-                                    pass
-
-                            # buscar párrafo principal dentro de .navtxt (evita el <font> de palabras clave)
-                            nav_p = await page.query_selector('div.navtxt p')
-                            if nav_p:
-                                descripcion = (await nav_p.inner_text()).strip()
-                            else:
-                                # fallback a selectores generales
-                                desc_candidates = ["#intro", ".intro", ".book-intro", ".description", ".summary"]
-                                for s in desc_candidates:
-                                    d_el = await page.query_selector(s)
-                                    if d_el:
-                                        descripcion = (await d_el.inner_text()).strip()
-                                        break
-                        except Exception:
-                            descripcion = None
-
-                        # Normalizar campos y forzar actualización para reflejar la portada
-                        dirty = False
-                        if titulo and novela.titulo_original != titulo:
-                            novela.titulo_original = titulo
-                            dirty = True
-                        if autor and novela.autor_original != autor:
-                            novela.autor_original = autor
-                            dirty = True
-                        if descripcion is not None and novela.descripcion_original != descripcion:
-                            novela.descripcion_original = descripcion
-                            dirty = True
-                        if portada_img:
-                            full_cover = urljoin(portada_url, portada_img)
-                            if novela.portada_url != full_cover:
-                                novela.portada_url = full_cover
-                                dirty = True
-
-                        # fecha: extraer YYYY-MM-DD desde el texto (ej: '更新：2026-02-16')
-                        if fecha_text:
-                            m = re.search(r'(\d{4}-\d{2}-\d{2})', fecha_text)
-                            if m:
-                                try:
-                                    fecha_dt = datetime.strptime(m.group(1), '%Y-%m-%d').date()
-                                    if novela.fecha_publicacion_original != fecha_dt:
-                                        novela.fecha_publicacion_original = fecha_dt
-                                        dirty = True
-                                except Exception:
-                                    pass
-
-                        # Si tenemos autor, buscar/crear en tabla de autores y asignar id_autor
-                        if autor:
-                            try:
-                                nombre_aut = autor.strip()
-                                existente = db.query(AutoresNovelas).filter(AutoresNovelas.nombre_autor == nombre_aut).first()
-                                if existente:
-                                    if novela.id_autor != existente.id_autor:
-                                        novela.id_autor = existente.id_autor
-                                        dirty = True
-                                else:
-                                    nuevo_aut = AutoresNovelas(nombre_autor=nombre_aut)
-                                    db.add(nuevo_aut)
-                                    db.commit()
-                                    db.refresh(nuevo_aut)
-                                    novela.id_autor = nuevo_aut.id_autor
-                                    dirty = True
-                            except Exception as e:
-                                logger.debug(f"Error al buscar/crear autor: {e}")
-                                try:
-                                    db.rollback()
-                                except Exception:
-                                    pass
-
-                        if dirty:
-                            try:
-                                db.add(novela)
-                                db.commit()
-                            except Exception as e:
-                                logger.warning(f"No se pudo guardar metadata de portada: {e}")
-                                db.rollback()
-                    except Exception as e:
-                        logger.debug(f"Error extrayendo metadata de twkan: {e}")
-                else:
-                    # Fallback genérico previo (sin sobrescribir campos existentes)
-                    title_selectors = ["h1", "h1.book-name", "#info h1", ".book-title", ".novel-title"]
-                    author_selectors = [".author a", "#info .writer", ".book-author a", ".author", "a.writer"]
-                    genre_selectors = [".tags a", ".tag", ".category a", ".book-tags a", ".genre a"]
-                    desc_selectors = [".intro", "#intro", ".book-intro", ".description", ".summary"]
-                    cover_selectors = ["img#cover", ".book-cover img", ".novel-cover img", ".cover img"]
-
-                    async def extract_first(selectors, attr=None):
-                        for s in selectors:
-                            try:
-                                el = await page.query_selector(s)
-                                if not el: continue
-                                if attr:
-                                    val = await el.get_attribute(attr)
-                                else:
-                                    val = (await el.inner_text()) if hasattr(el, 'inner_text') else None
-                                if val:
-                                    return val.strip()
-                            except Exception:
-                                continue
-                        return None
-                    titulo = await extract_first(title_selectors)
-                    autor = await extract_first(author_selectors)
-
-                    # Intentar mostrar descripción clicando '#li_info' antes de fallback
-                    descripcion = None
-                    try:
-                        info_btn = await page.query_selector('#li_info')
-                        if info_btn:
-                            try:
-                                await info_btn.click()
-                                await asyncio.sleep(0.4)
-                            except Exception:
-                                pass
-
-                        nav_p = await page.query_selector('div.navtxt p')
-                        if nav_p:
-                            descripcion = (await nav_p.inner_text()).strip()
-                        else:
-                            descripcion = await extract_first(desc_selectors)
-                    except Exception:
-                        descripcion = await extract_first(desc_selectors)
-                    portada_img = await extract_first(cover_selectors, attr="src")
-
-                    # género: recoger varios tags si existen
-                    genero = None
-                    try:
-                        tags = await page.query_selector_all(','.join(genre_selectors))
-                        if tags and len(tags) > 0:
-                            nombres = []
-                            for t in tags:
-                                try:
-                                    tx = (await t.inner_text()).strip()
-                                    if tx:
-                                        nombres.append(tx)
-                                except Exception:
-                                    continue
-                            if nombres:
-                                genero = ', '.join(dict.fromkeys(nombres))
-                    except Exception:
-                        genero = None
-
-                    # Normalizar y guardar sólo si faltan en DB
-                    dirty = False
-                    if titulo and (not getattr(novela, 'titulo_original', None)):
-                        novela.titulo_original = titulo
-                        dirty = True
-                    if autor and (not getattr(novela, 'autor_original', None)):
-                        novela.autor_original = autor
-                        dirty = True
-                    if descripcion and (not getattr(novela, 'descripcion_original', None)):
-                        novela.descripcion_original = descripcion
-                        dirty = True
-                    if portada_img and (not getattr(novela, 'portada_url', None)):
-                        novela.portada_url = urljoin(portada_url, portada_img)
-                        dirty = True
-
-                    # Si hay género y no existe campo específico, añadimos al principio de la descripción si está vacía
-                    if genero and (not getattr(novela, 'descripcion_original', None)):
-                        novela.descripcion_original = f"Género: {genero}\n" + (novela.descripcion_original or "")
-                        dirty = True
-
-                    # Si tenemos autor, buscar/crear en tabla de autores y asignar id_autor
-                    if autor:
-                        try:
-                            nombre_aut = autor.strip()
-                            existente = db.query(AutoresNovelas).filter(AutoresNovelas.nombre_autor == nombre_aut).first()
-                            if existente:
-                                if novela.id_autor != existente.id_autor:
-                                    novela.id_autor = existente.id_autor
-                                    dirty = True
-                            else:
-                                nuevo_aut = AutoresNovelas(nombre_autor=nombre_aut)
-                                db.add(nuevo_aut)
-                                db.commit()
-                                db.refresh(nuevo_aut)
-                                novela.id_autor = nuevo_aut.id_autor
-                                dirty = True
-                        except Exception as e:
-                            logger.debug(f"Error al buscar/crear autor: {e}")
-                            try:
-                                db.rollback()
-                            except Exception:
-                                pass
-
-                    if dirty:
-                        try:
-                            db.add(novela)
-                            db.commit()
-                        except Exception as e:
-                            logger.warning(f"No se pudo guardar metadata de portada: {e}")
-                            db.rollback()
-            except Exception as e:
-                logger.debug(f"No se pudo acceder a la portada ({url}): {e}")
-
-            # Asegurarnos de que usamos la URL de índice para el scraping de capítulos
-            if "twkan.com" in url and "index.html" not in url:
-                url = url.replace(".html", "/index.html")
-
-            logger.info(f"🔍 Patrullando: {novela.titulo_original}")
-            
+        # --- PASO 3: SINCRONIZAR ---
+        nuevos_ids = await db.run_sync(_registrar_capitulos, novela.id_novela, enlaces, primera, completo)
+        CAPITULOS_DESCUBIERTOS.labels(novela.fuente.nombre_fuente if novela.fuente else "sin_fuente").inc(len(nuevos_ids))
+        logger.info(f"✅ Proceso terminado: {len(nuevos_ids)} capítulos nuevos añadidos.")
+        return nuevos_ids
+
+    except Exception as e:
+        logger.error(f"❌ Error: {e}")
+        await db.rollback()
+        return None
+
+
+_t = Capitulo.__table__
+_ACTUALIZAR_POSICION = update(_t).where(_t.c.id_capitulo == bindparam("b_id")).values(
+    numero_capitulo=bindparam("b_posicion"),
+    orden_capitulo=bindparam("b_posicion")
+)
+
+
+def _registrar_capitulos(db: Session, id_novela: int, enlaces: list[dict], primera: int, completo: bool) -> list[int]:
+    """
+    Da de alta los capítulos de `enlaces` que no estén en la DB. `enlaces` va en orden
+    visual y el primero ocupa la posición `primera` del índice; numero_capitulo y
+    orden_capitulo son siempre esa posición, se lea el índice entero o sólo la cola.
+
+    En modo cola sólo se buscan en la DB las URLs leídas (en toda la novela: un
+    enlace de la cola puede ser un capítulo antiguo que se ha movido); en un escaneo
+    completo se leen todas y se corrigen las posiciones de los capítulos que se
+    hayan movido.
+    """
+    posiciones = {cap["url"]: primera + i for i, cap in enumerate(enlaces)}
+    columnas = (Capitulo.id_capitulo, Capitulo.fuente_url, Capitulo.orden_capitulo)
+    if completo:
+        en_db = {fila.fuente_url: fila for fila in db.query(*columnas).filter(Capitulo.id_novela == id_novela)}
+    else:
+        urls = list(posiciones)
+        en_db = {}
+        for inicio in range(0, len(urls), settings.DB_BATCH_SIZE):
+            en_db.update((fila.fuente_url, fila) for fila in db.query(*columnas).filter(
+                Capitulo.id_novela == id_novela, Capitulo.fuente_url.in_(urls[inicio:inicio + settings.DB_BATCH_SIZE])
+            ))
+
+    filas_nuevas = [
+        {
+            "id_novela": id_novela,
+            "numero_capitulo": posiciones[cap["url"]], # El orden lo define la posición en la página
+            "orden_capitulo": posiciones[cap["url"]],
+            "titulo_original": cap["titulo"],
+            "fuente_url": cap["url"],
+            "contenido_original": None,
+            "estado_pipeline": "descubierto"
+        }
+        for cap in enlaces
+        if cap["url"] not in en_db
+    ]
+    nuevos_ids = _insertar_capitulos(db, id_novela, filas_nuevas)
+
+    if completo:
+        movidos = [
+            {"b_id": fila.id_capitulo, "b_posicion": posiciones[url_cap]}
+            for url_cap, fila in en_db.items()
+            if url_cap in posiciones and fila.orden_capitulo != posiciones[url_cap]
+        ]
+        for inicio in range(0, len(movidos), settings.DB_BATCH_SIZE):
+            db.execute(_ACTUALIZAR_POSICION, movidos[inicio:inicio + settings.DB_BATCH_SIZE])
+        if movidos:
+            logger.info(f"🔀 {len(movidos)} capítulos cambiaron de posición en el índice")
+
+    # Nueva ancla: el último enlace leído (si la cola venía vacía, se conserva la anterior)
+    if enlaces:
+        valores = {
+            "ultimo_capitulo_url": enlaces[-1]["url"],
+            "ultimo_capitulo_posicion": primera + len(enlaces) - 1
+        }
+        if completo:
+            valores["ultimo_rescan_completo"] = datetime.utcnow()
+        db.execute(
+            update(Novela).where(Novela.id_novela == id_novela).values(**valores),
+            execution_options={"synchronize_session": False}
+        )
+    db.commit()
+    return nuevos_ids
+
+
+def _insertar_capitulos(db: Session, id_novela: int, filas: list[dict]) -> list[int]:
+    """
+    INSERT en bloques de DB_BATCH_SIZE filas (executemany) y recuperación de los IDs
+    con una consulta por bloque, en lugar de un round trip por capítulo.
+
+    Sólo se devuelven las filas recién insertadas: las de la novela con id mayor que
+    el último que tenía (la novela está reclamada, nadie más le añade capítulos), así
+    que un capítulo antiguo con la misma URL no se cuenta como nuevo.
+    """
+    if not filas:
+        return []
+    ultimo_id = db.query(func.max(Capitulo.id_capitulo)).filter(Capitulo.id_novela == id_novela).scalar() or 0
+    nuevos_ids = []
+    for inicio in range(0, len(filas), settings.DB_BATCH_SIZE):
+        bloque = filas[inicio:inicio + settings.DB_BATCH_SIZE]
+        db.execute(insert(Capitulo), bloque)
+        urls = [fila["fuente_url"] for fila in bloque]
+        nuevos_ids.extend(
+            id_cap for (id_cap,) in db.query(Capitulo.id_capitulo).filter(
+                Capitulo.id_novela == id_novela, Capitulo.id_capitulo > ultimo_id, Capitulo.fuente_url.in_(urls)
+            ).order_by(Capitulo.id_capitulo).all()
+        )
+    return nuevos_ids
+
+
+def _aplicar_metadata(db: Session, id_novela: int, campos: dict, portada_url: str, modo: str):
+    """
+    Vuelca los campos extraídos en la novela. Con modo "sobrescribir" la DB refleja
+    siempre la portada; con "completar" sólo se rellenan los campos vacíos.
+    """
+    novela = db.get(Novela, id_novela)
+    if novela is None:
+        return
+    dirty = False
+
+    def asignar(atributo, valor):
+        nonlocal dirty
+        if valor is None or valor == "":
+            return
+        actual = getattr(novela, atributo)
+        if modo == "completar" and actual:
+            return
+        if actual != valor:
+            setattr(novela, atributo, valor)
+            dirty = True
+
+    asignar("titulo_original", campos.get("titulo"))
+    asignar("autor_original", campos.get("autor"))
+    asignar("descripcion_original", campos.get("descripcion"))
+    if campos.get("portada"):
+        asignar("portada_url", urljoin(portada_url, campos["portada"]))
+
+    # fecha: extraer YYYY-MM-DD desde el texto (ej: '更新：2026-02-16')
+    if campos.get("fecha"):
+        m = re.search(r'(\d{4}-\d{2}-\d{2})', campos["fecha"])
+        if m:
             try:
-                await page.goto(url, timeout=60000, wait_until="networkidle")
-                await asyncio.sleep(2)
-
-                # --- PASO 1: EXPANDIR TODO (Igual que antes) ---
-                boton = page.locator("#loadmore, .more-btn, a:has-text('點擊展開')")
-                if await boton.count() > 0:
-                    logger.info("🖱️ Cargando capítulos ocultos...")
-                    await boton.first.click(force=True)
-                    
-                    links_cuenta = 0
-                    for _ in range(15):
-                        await asyncio.sleep(1)
-                        nueva_cuenta = await page.locator("a").count()
-                        if nueva_cuenta > links_cuenta:
-                            links_cuenta = nueva_cuenta
-                        else:
-                            break 
-                
-                # --- PASO 2: LEER EN ORDEN VISUAL (Cambio clave aquí) ---
-                logger.info("📡 Analizando lista por orden de aparición...")
-                enlaces_raw = await page.query_selector_all("a")
-                
-                match_id = re.search(r'/(\d+)', url)
-                novel_id = match_id.group(1) if match_id else None
-                
-                lista_final = []
-                urls_vistas = set() # Para no duplicar si un link sale dos veces
-
-                for el in enlaces_raw:
-                    href = await el.get_attribute("href")
-                    text = await el.inner_text()
-                    if not href or not text: continue
-                    
-                    full_url = urljoin(url, href)
-                    
-                    # Filtro de seguridad
-                    if "/txt/" in full_url and (novel_id in full_url if novel_id else True):
-                        if full_url not in urls_vistas:
-                            # Guardamos tal cual aparece en el HTML
-                            lista_final.append({
-                                "titulo": text.strip(),
-                                "url": full_url
-                            })
-                            urls_vistas.add(full_url)
-
-                total_detectados = len(lista_final)
-                logger.info(f"🎯 Escaneo finalizado. Se encontraron {total_detectados} capítulos en orden visual.")
-
-                # --- PASO 3: SINCRONIZAR ---
-                nuevos_en_db = 0
-                urls_en_db = {c.fuente_url for c in db.query(Capitulo.fuente_url).filter(Capitulo.id_novela == novela.id_novela).all()}
-
-                for i, cap in enumerate(lista_final):
-                    if cap["url"] not in urls_en_db:
-                        nuevo_cap = Capitulo(
-                            id_novela=novela.id_novela,
-                            numero_capitulo=i + 1, # El orden lo define la posición en la página
-                            titulo_original=cap["titulo"],
-                            fuente_url=cap["url"],
-                            contenido_original=None
-                        )
-                        db.add(nuevo_cap)
-                        nuevos_en_db += 1
-
-                db.commit()
-                logger.info(f"✅ Proceso terminado: {nuevos_en_db} capítulos nuevos añadidos.")
-
-            except Exception as e:
-                logger.error(f"❌ Error: {e}")
-                db.rollback()
-
-        await browser.close()
\ No newline at end of file
+                asignar("fecha_publicacion_original", datetime.strptime(m.group(1), '%Y-%m-%d').date())
+            except ValueError:
+                pass
+
+    # Si hay género y no hay descripción, lo añadimos al principio de la descripción
+    if modo == "completar" and campos.get("genero") and not novela.descripcion_original:
+        novela.descripcion_original = f"Género: {campos['genero']}\n" + (novela.descripcion_original or "")
+        dirty = True
+
+    # Si tenemos autor, asignar su id_autor (caché en proceso + upsert por nombre)
+    if campos.get("autor"):
+        try:
+            id_aut = id_autor(db, campos["autor"])
+            if novela.id_autor != id_aut:
+                novela.id_autor = id_aut
+                dirty = True
+        except Exception as e:
+            logger.debug(f"Error al buscar/crear autor: {e}")
+            olvidar_autor(campos["autor"])
+
+    if dirty:
+        try:
+            db.add(novela)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"No se pudo guardar metadata de portada: {e}")
+            db.rollback()
+            if campos.get("autor"):
+                olvidar_autor(campos["autor"])
@@ -0,0 +1,291 @@
+"""
+Exportación de novelas completas (original y/o traducción) en JSONL o EPUB.
+
+Los capítulos se leen en `orden_capitulo` con un cursor de servidor (`yield_per`)
+y se escriben según llegan, así que la memoria no depende del tamaño de la novela
+(el EPUB sólo guarda el título de cada capítulo para el índice final).
+
+Uso: python -m app.services.exportacion <id_novela> [--formato jsonl|epub]
+     [--texto original|traduccion|ambos] [--salida fichero]
+"""
+import argparse
+import json
+import logging
+import sys
+import zipfile
+from datetime import datetime
+from html import escape
+from typing import AsyncIterator, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, aliased
+from app.core.config import settings
+from app.db.compresion import descomprimir, precargar_diccionarios
+from app.db.models import Novela, Capitulo, TraduccionCapitulo
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("jsonl", "epub")
+TEXTOS = ("original", "traduccion", "ambos")
+
+
+# ---------------------------------------------------------
+# LECTURA
+# ---------------------------------------------------------
+
+def datos_novela(db: Session, id_novela: int) -> Optional[dict]:
+    novela = db.query(
+        Novela.id_novela, Novela.titulo_original, Novela.autor_original, Novela.descripcion_original
+    ).filter(Novela.id_novela == id_novela).first()
+    return dict(novela._mapping) if novela else None
+
+
+def consulta_capitulos(id_novela: int, texto: str):
+    """
+    Capítulos de la novela en orden, sólo con las columnas que se exportan. Con
+    traducción se une la más reciente completada de cada capítulo; con
+    texto="traduccion" se omiten los capítulos sin traducir.
+    """
+    columnas = [
+        Capitulo.id_capitulo, Capitulo.numero_capitulo, Capitulo.orden_capitulo, Capitulo.titulo_original,
+    ]
+    if texto != "traduccion":
+        columnas += [Capitulo.contenido_original, Capitulo.contenido_comprimido]
+    consulta = select(*columnas).where(Capitulo.id_novela == id_novela)
+
+    if texto != "original":
+        reciente = aliased(TraduccionCapitulo)
+        ultima = select(func.max(reciente.id_traduccion_capitulo_es)).where(
+            reciente.id_capitulo == Capitulo.id_capitulo,
+            reciente.estado_traduccion == 'completado'
+        ).scalar_subquery()
+        condicion = TraduccionCapitulo.id_traduccion_capitulo_es == ultima
+        consulta = consulta.add_columns(
+            TraduccionCapitulo.titulo_traducido,
+            TraduccionCapitulo.contenido_traducido,
+            TraduccionCapitulo.contenido_comprimido.label("traduccion_comprimida")
+        )
+        consulta = (consulta.join(TraduccionCapitulo, condicion) if texto == "traduccion"
+                    else consulta.outerjoin(TraduccionCapitulo, condicion))
+
+    return consulta.order_by(Capitulo.orden_capitulo, Capitulo.id_capitulo).execution_options(
+        yield_per=settings.EXPORTACION_LOTE
+    )
+
+
+def _texto(plano: Optional[str], comprimido: Optional[bytes]) -> Optional[str]:
+    # Los diccionarios ya están en memoria: no se consulta la DB con el cursor abierto
+    return descomprimir(comprimido) if comprimido is not None else plano
+
+
+def capitulo_de_fila(fila) -> dict:
+    m = fila._mapping
+    return {
+        "id_capitulo": m["id_capitulo"],
+        "numero": m["numero_capitulo"],
+        "orden": m["orden_capitulo"],
+        "titulo": m["titulo_original"],
+        "titulo_traducido": m.get("titulo_traducido"),
+        "original": _texto(m["contenido_original"], m["contenido_comprimido"]) if "contenido_original" in m else None,
+        "traduccion": _texto(m["contenido_traducido"], m["traduccion_comprimida"]) if "contenido_traducido" in m else None,
+    }
+
+
+# ---------------------------------------------------------
+# ESCRITURA
+# ---------------------------------------------------------
+
+class Tubo:
+    """
+    Destino en memoria para respuestas HTTP en streaming: acumula lo escrito
+    hasta que se recoge con `vaciar()`. No admite seek, así que zipfile escribe
+    el EPUB con descriptores de datos.
+    """
+
+    def __init__(self):
+        self._pendiente = bytearray()
+
+    def write(self, datos: bytes) -> int:
+        self._pendiente += datos
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = bytes(self._pendiente)
+        self._pendiente.clear()
+        return datos
+
+
+class EscritorJSONL:
+    """Una línea con la novela y después una línea por capítulo."""
+
+    extension = "jsonl"
+    media_type = "application/x-ndjson"
+
+    def __init__(self, salida, novela: dict, texto: str):
+        self.salida = salida
+        self.novela = novela
+        self.texto = texto
+
+    def _linea(self, objeto: dict):
+        self.salida.write(json.dumps(objeto, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def inicio(self):
+        self._linea({"tipo": "novela", **self.novela})
+
+    def capitulo(self, cap: dict) -> bool:
+        if self.texto == "original":
+            cap.pop("traduccion"), cap.pop("titulo_traducido")
+        elif self.texto == "traduccion":
+            cap.pop("original")
+        self._linea({"tipo": "capitulo", **cap})
+        return True
+
+    def fin(self):
+        pass
+
+
+class EscritorEpub:
+    """
+    EPUB 3 escrito entrada a entrada: cada capítulo va al zip según llega y el
+    paquete (content.opf) y el índice se escriben al final.
+    """
+
+    extension = "epub"
+    media_type = "application/epub+zip"
+
+    def __init__(self, salida, novela: dict, texto: str):
+        # Un EPUB es de un solo idioma: "ambos" exporta la traducción
+        self.traduccion = texto != "original"
+        self.novela = novela
+        self.zip = zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED)
+        self.capitulos: list[tuple[str, str]] = []  # (fichero, título) para el índice
+
+    @property
+    def idioma(self) -> str:
+        return "es" if self.traduccion else "zh"
+
+    def inicio(self):
+        # "mimetype" tiene que ser la primera entrada y sin comprimir
+        self.zip.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self.zip.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+            '</container>'
+        ))
+
+    def _xhtml(self, titulo: str, cuerpo: str) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><!DOCTYPE html>'
+            f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+            f'xml:lang="{self.idioma}" lang="{self.idioma}">'
+            f'<head><meta charset="utf-8"/><title>{escape(titulo)}</title></head><body>{cuerpo}</body></html>'
+        )
+
+    def capitulo(self, cap: dict) -> bool:
+        texto = cap["traduccion"] if self.traduccion else cap["original"]
+        if not texto:
+            return False
+        titulo = (cap["titulo_traducido"] if self.traduccion else None) or cap["titulo"] or f"Capítulo {cap['numero']}"
+        fichero = f"capitulo_{len(self.capitulos) + 1:05d}.xhtml"
+        parrafos = "".join(f"<p>{escape(linea)}</p>" for linea in texto.split("\n") if linea.strip())
+        self.zip.writestr(f"OEBPS/{fichero}", self._xhtml(titulo, f"<h1>{escape(titulo)}</h1>{parrafos}"))
+        self.capitulos.append((fichero, titulo))
+        return True
+
+    def fin(self):
+        titulo = escape(self.novela.get("titulo_original") or "")
+        autor = escape(self.novela.get("autor_original") or "")
+        enlaces = "".join(f'<li><a href="{f}">{escape(t)}</a></li>' for f, t in self.capitulos)
+        self.zip.writestr("OEBPS/nav.xhtml", self._xhtml(
+            titulo, f'<nav epub:type="toc" id="toc"><h1>{titulo}</h1><ol>{enlaces}</ol></nav>'
+        ))
+        manifiesto = "".join(
+            f'<item id="c{i}" href="{f}" media-type="application/xhtml+xml"/>' for i, (f, _) in enumerate(self.capitulos, 1)
+        )
+        orden = "".join(f'<itemref idref="c{i}"/>' for i in range(1, len(self.capitulos) + 1))
+        self.zip.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="id">urn:novelagent:novela:{self.novela["id_novela"]}:{self.idioma}</dc:identifier>'
+            f'<dc:title>{titulo}</dc:title><dc:creator>{autor}</dc:creator><dc:language>{self.idioma}</dc:language>'
+            f'<meta property="dcterms:modified">{datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")}</meta>'
+            '</metadata>'
+            f'<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>{manifiesto}</manifest>'
+            f'<spine>{orden}</spine>'
+            '</package>'
+        ))
+        self.zip.close()
+
+
+ESCRITORES = {"jsonl": EscritorJSONL, "epub": EscritorEpub}
+
+
+# ---------------------------------------------------------
+# EXPORTAR
+# ---------------------------------------------------------
+
+def exportar_a_fichero(db: Session, id_novela: int, formato: str, texto: str, ruta: str) -> int:
+    """Escribe la novela en `ruta` y devuelve cuántos capítulos se exportaron."""
+    novela = datos_novela(db, id_novela)
+    if novela is None:
+        raise ValueError(f"No existe la novela {id_novela}")
+    precargar_diccionarios(db, id_novela)
+
+    exportados = 0
+    with open(ruta, "wb") as salida:
+        escritor = ESCRITORES[formato](salida, novela, texto)
+        escritor.inicio()
+        for fila in db.execute(consulta_capitulos(id_novela, texto)):
+            exportados += escritor.capitulo(capitulo_de_fila(fila))
+        escritor.fin()
+    return exportados
+
+
+async def exportar_en_flujo(novela: dict, formato: str, texto: str) -> AsyncIterator[bytes]:
+    """
+    Lo mismo para una respuesta HTTP: va entregando los bytes de cada capítulo.
+    Usa su propia sesión, que vive lo que dura la respuesta.
+    """
+    from app.db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(precargar_diccionarios, novela["id_novela"])
+        tubo = Tubo()
+        escritor = ESCRITORES[formato](tubo, novela, texto)
+        escritor.inicio()
+        yield tubo.vaciar()
+
+        # AsyncSession.stream abre un cursor de servidor: las filas llegan de EXPORTACION_LOTE en EXPORTACION_LOTE
+        resultado = await db.stream(consulta_capitulos(novela["id_novela"], texto))
+        async for fila in resultado:
+            escritor.capitulo(capitulo_de_fila(fila))
+            datos = tubo.vaciar()
+            if datos:
+                yield datos
+        escritor.fin()
+        yield tubo.vaciar()
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Exporta una novela completa")
+    parser.add_argument("id_novela", type=int)
+    parser.add_argument("--formato", choices=FORMATOS, default="jsonl")
+    parser.add_argument("--texto", choices=TEXTOS, default="ambos")
+    parser.add_argument("--salida", help="fichero de destino (por defecto novela_<id>.<formato>)")
+    args = parser.parse_args()
+
+    ruta = args.salida or f"novela_{args.id_novela}.{ESCRITORES[args.formato].extension}"
+    with SessionLocal() as db:
+        try:
+            total = exportar_a_fichero(db, args.id_novela, args.formato, args.texto, ruta)
+        except ValueError as e:
+            logger.error(f"❌ {e}")
+            sys.exit(1)
+    logger.info(f"📦 {total} capítulos exportados en {ruta}")
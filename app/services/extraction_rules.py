@@ -0,0 +1,319 @@
+import copy
+import logging
+import re
+from typing import Optional
+import lxml.html
+from app.db.models import FuenteScraping
+from app.services.fuentes import leer_configuracion
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# REGLAS DE EXTRACCIÓN POR FUENTE
+# ---------------------------------------------------------
+# Cada fuente se describe con un dict. Las reglas integradas se pueden
+# sobrescribir (o definir para sitios nuevos) en
+# `fuentes_scraping.configuracion_scraper.reglas`, con la misma estructura.
+#
+# Regla de campo:
+#   selectores     -> lista de selectores CSS, se prueban en orden
+#                     (admiten {id_novela} y {<campo ya extraído>})
+#   contiene_texto -> sólo elementos cuyo texto contenga esta cadena
+#   hijo           -> selector dentro del elemento encontrado
+#   atributo       -> leer un atributo en lugar del texto visible
+#   multiple       -> unir todos los valores distintos con ", "
+
+SELECTORES_ANUNCIOS = ['.txtad', '.exo-native-widget', '[class*="adv"]', '[id*="adv"]']
+
+# Redes de anuncios y analítica que nunca aportan contenido
+URLS_BLOQUEADAS = [
+    "exoclick", "exosrv", "exdynsrv", "exo-native", "magsrv", "popads", "juicyads",
+    "googletagmanager", "google-analytics", "googlesyndication", "doubleclick",
+    "hm.baidu.com", "cnzz.com", "histats", "clarity.ms",
+]
+
+REGLAS_GENERICAS = {
+    # "completar": sólo rellena campos vacíos en DB; "sobrescribir": refleja siempre la portada
+    "modo_metadata": "completar",
+    "url_portada": [{"reemplazar": ["/index.html", ".html"], "si_contiene": "index.html"}],
+    "url_indice": [],
+    "id_novela_regex": r"/(\d+)",
+    # Huella barata de la portada (se guarda en novelas.hash_metadata). Si no cambia,
+    # se omite la pasada de metadata; con "huella_cubre_indice" también el índice
+    # (sólo si la huella cambia con cada capítulo publicado).
+    "huella": None,
+    "huella_cubre_indice": False,
+    # Se pulsan antes de leer la portada (ver page_loader.pulsar_antes_de_extraer)
+    "clic_antes": ["#li_info"],
+    "campos": {
+        "titulo": {"selectores": ["h1", "h1.book-name", "#info h1", ".book-title", ".novel-title"]},
+        "autor": {"selectores": [".author a", "#info .writer", ".book-author a", ".author", "a.writer"]},
+        "genero": {"selectores": [".tags a", ".tag", ".category a", ".book-tags a", ".genre a"], "multiple": True},
+        "descripcion": {"selectores": ["div.navtxt p", ".intro", "#intro", ".book-intro", ".description", ".summary"]},
+        "portada": {"selectores": ["img#cover", ".book-cover img", ".novel-cover img", ".cover img"], "atributo": "src"},
+    },
+    "boton_expandir": "#loadmore, .more-btn, a:has-text('點擊展開')",
+    "enlaces": {
+        "selector": "a",
+        "contiene": ["/txt/"],
+        "excluye": [],
+        "patron": None,
+        "requiere_id_novela": True,
+    },
+    "contenido": {
+        "eliminar": SELECTORES_ANUNCIOS,
+        "selectores": ["#txtcontent0", '.txtnav div[id^="txtcontent"]'],
+        "hijo_de": {"selector": ".txtnav", "indice": 3},
+    },
+    # Perfil de carga en Chromium (ver page_loader): qué no se descarga, a qué se
+    # espera en cada tipo de página y el plazo máximo por página
+    "carga": {
+        "bloquear_tipos": ["image", "media", "font", "stylesheet"],
+        "bloquear_urls": URLS_BLOQUEADAS,
+        "plazo_seg": 30,
+        "enlaces_estables_ms": 800,
+        "portada": {},
+        "indice": {},
+        "capitulo": {"min_caracteres": 50},
+    },
+}
+
+REGLAS_INTEGRADAS = {
+    "twkan.com": {
+        "modo_metadata": "sobrescribir",
+        "url_indice": [{"reemplazar": [".html", "/index.html"], "si_no_contiene": "index.html"}],
+        "id_novela_regex": r"/book/(\d+)",
+        # La línea '更新：YYYY-MM-DD' sólo cambia de un día para otro: vale para saltarse
+        # la portada, pero no el índice (se perderían los capítulos publicados ese mismo día)
+        "huella": {"selectores": ["div.booknav2 p"], "contiene_texto": "更新"},
+        "huella_cubre_indice": False,
+        "campos": {
+            "titulo": {"selectores": ["div.booknav2 h1 a"]},
+            "autor": {"selectores": ["div.booknav2 p"], "contiene_texto": "作者", "hijo": "a"},
+            "categoria": {"selectores": ["div.booknav2 p"], "contiene_texto": "分類", "hijo": "a"},
+            "fecha": {"selectores": ["div.booknav2 p"], "contiene_texto": "更新"},
+            "descripcion": {"selectores": ["div.navtxt p", "#intro", ".intro", ".book-intro", ".description", ".summary"]},
+            "portada": {"selectores": ['img[src*="{id_novela}"]', 'img[alt="{titulo}"]'], "atributo": "src"},
+        },
+    },
+}
+
+# Un único script para todas las fuentes: recibe las reglas compiladas y
+# devuelve campos, enlaces y contenido en una sola llamada a page.evaluate.
+EXTRACTOR_JS = """(reglas) => {
+    const limpiar = (t) => (t || '').trim();
+    const ctx = { id_novela: reglas.id_novela || '' };
+    const plantilla = (sel) => sel.replace(/\\{(\\w+)\\}/g, (_, k) => ctx[k] !== undefined ? ctx[k] : '');
+    const todos = (sel, raiz) => {
+        try { return Array.from((raiz || document).querySelectorAll(sel)); } catch (e) { return []; }
+    };
+    const resultado = {};
+
+    if (reglas.campos) {
+        resultado.campos = {};
+        for (const [nombre, regla] of Object.entries(reglas.campos)) {
+            const valores = [];
+            for (const selector of (regla.selectores || [])) {
+                let els = todos(plantilla(selector));
+                if (regla.contiene_texto) els = els.filter(el => (el.innerText || '').includes(regla.contiene_texto));
+                for (let el of els) {
+                    if (regla.hijo) { el = el.querySelector(regla.hijo); if (!el) continue; }
+                    const v = limpiar(regla.atributo ? el.getAttribute(regla.atributo) : el.innerText);
+                    if (v) valores.push(v);
+                    if (v && !regla.multiple) break;
+                }
+                if (valores.length && !regla.multiple) break;
+            }
+            const valor = valores.length ? (regla.multiple ? [...new Set(valores)].join(', ') : valores[0]) : null;
+            resultado.campos[nombre] = valor;
+            ctx[nombre] = valor || '';
+        }
+    }
+
+    if (reglas.enlaces) {
+        const r = reglas.enlaces;
+        const vistos = new Set();
+        const patron = r.patron ? new RegExp(r.patron) : null;
+        resultado.enlaces = [];
+        for (const a of todos(r.selector || 'a')) {
+            const href = a.getAttribute('href');
+            const texto = limpiar(a.innerText);
+            if (!href || !texto) continue;
+            let url;
+            try { url = new URL(href, document.baseURI).href; } catch (e) { continue; }
+            if (!(r.contiene || []).every(c => url.includes(c))) continue;
+            if ((r.excluye || []).some(c => url.includes(c))) continue;
+            if (patron && !patron.test(url)) continue;
+            if (r.requiere_id_novela && reglas.id_novela && !url.includes(reglas.id_novela)) continue;
+            if (vistos.has(url)) continue;
+            vistos.add(url);
+            resultado.enlaces.push({ titulo: texto, url: url });
+        }
+        // Discovery incremental: sólo viajan los enlaces posteriores al último conocido
+        if (reglas.ancla) {
+            const posicion = resultado.enlaces.findIndex(e => e.url === reglas.ancla);
+            resultado.total_enlaces = resultado.enlaces.length;
+            resultado.posicion_ancla = posicion >= 0 ? posicion + 1 : null;
+            if (posicion >= 0) resultado.enlaces = resultado.enlaces.slice(posicion + 1);
+        }
+    }
+
+    if (reglas.contenido) {
+        const c = reglas.contenido;
+        if ((c.eliminar || []).length) todos(c.eliminar.join(', ')).forEach(el => el.remove());
+        resultado.contenido = { texto: '', estrategia: null };
+        for (const sel of (c.selectores || [])) {
+            const el = todos(sel)[0];
+            const texto = el ? limpiar(el.innerText) : '';
+            if (texto) { resultado.contenido = { texto: texto, estrategia: sel }; break; }
+        }
+        if (!resultado.contenido.texto && c.hijo_de) {
+            const padre = todos(c.hijo_de.selector)[0];
+            const hijo = padre ? padre.children[c.hijo_de.indice] : null;
+            if (hijo) resultado.contenido = { texto: limpiar(hijo.innerText), estrategia: c.hijo_de.selector };
+        }
+    }
+
+    return resultado;
+}"""
+
+
+def _fusionar(base: dict, extra: dict) -> dict:
+    resultado = copy.deepcopy(base)
+    for clave, valor in (extra or {}).items():
+        if isinstance(valor, dict) and isinstance(resultado.get(clave), dict):
+            resultado[clave] = _fusionar(resultado[clave], valor)
+        else:
+            resultado[clave] = copy.deepcopy(valor)
+    return resultado
+
+
+def reglas_para(url: str, fuente: Optional[FuenteScraping] = None) -> dict:
+    """
+    Reglas efectivas para una URL: genéricas + integradas del dominio + las de la fuente en DB.
+    """
+    reglas = REGLAS_GENERICAS
+    for dominio, integradas in REGLAS_INTEGRADAS.items():
+        if url and dominio in url:
+            reglas = _fusionar(reglas, integradas)
+            break
+
+    config = leer_configuracion(fuente)
+    if isinstance(config.get("reglas"), dict):
+        reglas = _fusionar(reglas, config["reglas"])
+    else:
+        reglas = copy.deepcopy(reglas)
+
+    # Compatibilidad: 'selector_texto' de configuraciones antiguas tiene prioridad
+    if config.get("selector_texto"):
+        reglas["contenido"]["selectores"] = [config["selector_texto"]] + reglas["contenido"]["selectores"]
+    return reglas
+
+
+def transformar_url(url: str, transformaciones: list) -> str:
+    for t in transformaciones or []:
+        viejo, nuevo = t["reemplazar"]
+        if t.get("si_contiene") and t["si_contiene"] not in url:
+            continue
+        if t.get("si_no_contiene") and t["si_no_contiene"] in url:
+            continue
+        url = url.replace(viejo, nuevo)
+    return url
+
+
+def id_novela_de_url(url: str, reglas: dict) -> Optional[str]:
+    match = re.search(reglas.get("id_novela_regex") or r"/(\d+)", url or "")
+    return match.group(1) if match else None
+
+
+def compilar(reglas: dict, secciones: tuple, url: str = None, ancla: str = None) -> dict:
+    """
+    Prepara el argumento de EXTRACTOR_JS con sólo las secciones pedidas
+    ("campos", "enlaces", "contenido") para que el navegador haga el mínimo trabajo.
+    Con `ancla` (URL de un capítulo) sólo se devuelven los enlaces posteriores a ella.
+    """
+    compiladas = {"id_novela": id_novela_de_url(url, reglas) if url else None, "ancla": ancla}
+    if "campos" in secciones:
+        compiladas["campos"] = reglas.get("campos", {})
+    if "enlaces" in secciones:
+        compiladas["enlaces"] = reglas.get("enlaces")
+    if "contenido" in secciones:
+        compiladas["contenido"] = reglas.get("contenido")
+    return compiladas
+
+
+async def extraer_en_pagina(page, reglas: dict, secciones: tuple, url: str = None, ancla: str = None) -> dict:
+    """Ejecuta las reglas en la página con un único round trip."""
+    return await page.evaluate(EXTRACTOR_JS, compilar(reglas, secciones, url, ancla))
+
+
+# ---------------------------------------------------------
+# MISMAS REGLAS DE CONTENIDO SOBRE HTML ESTÁTICO (lxml)
+# ---------------------------------------------------------
+
+def _texto_visible(elemento) -> str:
+    """
+    Aproximación de `innerText`: saltos de línea en <br> y bloques, sin scripts.
+    """
+    for basura in elemento.xpath(".//script | .//style"):
+        basura.drop_tree()
+    for br in elemento.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    for bloque in elemento.iter("p", "div"):
+        bloque.tail = "\n" + (bloque.tail or "")
+    lineas = (linea.strip() for linea in elemento.text_content().splitlines())
+    return "\n".join(linea for linea in lineas if linea)
+
+
+def _seleccionar(raiz, selector: str) -> list:
+    try:
+        return raiz.cssselect(selector)
+    except Exception:
+        logger.debug(f"Selector no soportado por lxml: {selector}")
+        return []
+
+
+def extraer_campo_lxml(html: str, regla: dict) -> Optional[str]:
+    """Versión lxml de una regla de campo (primer valor encontrado)."""
+    if not html or not regla:
+        return None
+    doc = lxml.html.document_fromstring(html)
+    for selector in regla.get("selectores") or []:
+        for el in _seleccionar(doc, selector):
+            if regla.get("contiene_texto") and regla["contiene_texto"] not in el.text_content():
+                continue
+            if regla.get("hijo"):
+                hijos = _seleccionar(el, regla["hijo"])
+                if not hijos:
+                    continue
+                el = hijos[0]
+            valor = el.get(regla["atributo"]) if regla.get("atributo") else _texto_visible(el)
+            if valor and valor.strip():
+                return valor.strip()
+    return None
+
+
+def extraer_contenido_lxml(html: str, reglas_contenido: dict) -> str:
+    if not html:
+        return ""
+    doc = lxml.html.document_fromstring(html)
+
+    for selector in reglas_contenido.get("eliminar") or []:
+        for anuncio in _seleccionar(doc, selector):
+            anuncio.drop_tree()
+
+    for selector in reglas_contenido.get("selectores") or []:
+        encontrados = _seleccionar(doc, selector)
+        if encontrados:
+            texto = _texto_visible(encontrados[0])
+            if texto:
+                return texto
+
+    hijo_de = reglas_contenido.get("hijo_de")
+    if hijo_de:
+        padres = _seleccionar(doc, hijo_de["selector"])
+        if padres:
+            hijos = [h for h in padres[0] if isinstance(h.tag, str)]
+            if len(hijos) > hijo_de["indice"]:
+                return _texto_visible(hijos[hijo_de["indice"]])
+    return ""
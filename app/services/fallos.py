@@ -0,0 +1,174 @@
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlparse
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metricas import FUENTE_BLOQUEADA, FUENTE_TASA_EXITO
+from app.db.models import FuenteScraping
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# FALLOS DE LECTURA POR FUENTE
+# ---------------------------------------------------------
+# Cada capítulo fallido se reintenta con espera exponencial (SCRAPE_REINTENTO_*)
+# hasta SCRAPE_MAX_INTENTOS. Cada fuente lleva además un circuito:
+#
+#   cerrado  -> se lee con normalidad; la tasa de éxito de las últimas
+#               FUENTE_VENTANA_EXITO lecturas se guarda en fuentes_scraping.tasa_exito
+#   abierto  -> tras FUENTE_FALLOS_PARA_BLOQUEAR fallos seguidos: estado='bloqueada'
+#               y no se gasta navegador en ella; sus capítulos se aplazan
+#   sonda    -> pasada la espera (que se duplica en cada apertura) se deja pasar
+#               una sola lectura: si sale bien la fuente vuelve a 'activa'
+
+
+def retraso_reintento(intentos: int, base_seg: Optional[int] = None, max_seg: Optional[int] = None) -> timedelta:
+    """
+    Espera antes de volver a intentar un capítulo que ha fallado `intentos` veces
+    (por defecto con los tiempos del scraping, SCRAPE_REINTENTO_*).
+    """
+    base_seg = settings.SCRAPE_REINTENTO_BASE_SEG if base_seg is None else base_seg
+    max_seg = settings.SCRAPE_REINTENTO_MAX_SEG if max_seg is None else max_seg
+    return timedelta(seconds=min(base_seg * 2 ** max(0, intentos - 1), max_seg))
+
+
+class Circuito:
+    """Estado de una fuente en este proceso."""
+
+    def __init__(self, nombre: str, id_fuente: Optional[int], bloqueada: bool = False):
+        self.nombre = nombre
+        self.id_fuente = id_fuente
+        self.resultados: deque[bool] = deque(maxlen=max(1, settings.FUENTE_VENTANA_EXITO))
+        self.fallos_seguidos = 0
+        self.aperturas = 0  # Aperturas seguidas sin una sonda buena (para la espera)
+        self.abierto_hasta: Optional[float] = None
+        self.sondeando = False
+        self.sonda_desde = 0.0
+        self.pendiente = False  # Tasa o estado sin guardar en la DB
+        self.cambio_estado = False
+        self.ultima_escritura = 0.0
+        if bloqueada:
+            # Bloqueada por otro worker o antes de reiniciar: la primera lectura hace de sonda
+            self.aperturas = 1
+            self.abierto_hasta = time.monotonic()
+
+    @property
+    def abierto(self) -> bool:
+        return self.abierto_hasta is not None
+
+    @property
+    def tasa_exito(self) -> float:
+        if not self.resultados:
+            return 100.0
+        return 100.0 * sum(self.resultados) / len(self.resultados)
+
+    def segundos_para_sonda(self) -> float:
+        return max(0.0, (self.abierto_hasta or 0) - time.monotonic())
+
+    def permite(self) -> bool:
+        """¿Se puede leer ahora de la fuente? Con el circuito abierto sólo pasa la sonda."""
+        if not self.abierto:
+            return True
+        ahora = time.monotonic()
+        # Una sonda que no ha vuelto (p. ej. la tarea murió) no bloquea para siempre
+        sonda_en_curso = self.sondeando and ahora - self.sonda_desde < settings.FUENTE_BLOQUEO_BASE_SEG
+        if sonda_en_curso or ahora < self.abierto_hasta:
+            return False
+        self.sondeando = True
+        self.sonda_desde = ahora
+        logger.info(f"🩺 Probando si {self.nombre} ha vuelto")
+        return True
+
+    def registrar(self, ok: bool):
+        self.resultados.append(ok)
+        self.pendiente = True
+        FUENTE_TASA_EXITO.labels(self.nombre).set(self.tasa_exito)
+        if ok:
+            self.fallos_seguidos = 0
+            if self.abierto:
+                self._cerrar()
+            return
+        self.fallos_seguidos += 1
+        if self.sondeando:
+            self._abrir()
+        elif not self.abierto and self.fallos_seguidos >= settings.FUENTE_FALLOS_PARA_BLOQUEAR:
+            self._abrir()
+
+    def _abrir(self):
+        self.aperturas += 1
+        espera = min(settings.FUENTE_BLOQUEO_BASE_SEG * 2 ** (self.aperturas - 1), settings.FUENTE_BLOQUEO_MAX_SEG)
+        self.abierto_hasta = time.monotonic() + espera
+        self.sondeando = False
+        self.cambio_estado = True
+        FUENTE_BLOQUEADA.labels(self.nombre).set(1)
+        logger.warning(
+            f"🚧 Fuente {self.nombre} bloqueada tras {self.fallos_seguidos} fallos seguidos: "
+            f"nueva prueba en {espera:.0f} s"
+        )
+
+    def _cerrar(self):
+        self.aperturas = 0
+        self.abierto_hasta = None
+        self.sondeando = False
+        self.cambio_estado = True
+        FUENTE_BLOQUEADA.labels(self.nombre).set(0)
+        logger.info(f"✅ Fuente {self.nombre} desbloqueada")
+
+
+_circuitos: dict[str, Circuito] = {}
+
+
+def circuito_para(fuente: Optional[FuenteScraping], url: str) -> Circuito:
+    """Circuito de la fuente (o del dominio si la URL no tiene fuente registrada)."""
+    if fuente is not None:
+        clave, nombre, id_fuente = f"fuente:{fuente.id_fuente}", fuente.nombre_fuente, fuente.id_fuente
+    else:
+        dominio = urlparse(url).netloc
+        clave, nombre, id_fuente = f"dominio:{dominio}", dominio, None
+
+    circuito = _circuitos.get(clave)
+    if circuito is None:
+        circuito = Circuito(nombre, id_fuente, bloqueada=fuente is not None and fuente.estado == 'bloqueada')
+        _circuitos[clave] = circuito
+    return circuito
+
+
+_ACTUALIZAR_FUENTE = update(FuenteScraping.__table__).where(
+    FuenteScraping.__table__.c.id_fuente == bindparam("b_id")
+).values(
+    tasa_exito=bindparam("b_tasa"),
+    estado=bindparam("b_estado")
+)
+
+
+def guardar_estado_fuentes(db: Session):
+    """
+    Escribe tasa_exito y estado de las fuentes que han cambiado: al momento si el
+    circuito se ha abierto o cerrado, y la tasa como mucho cada FUENTE_TASA_CADA_SEG.
+    No hace commit: va con la escritura de los capítulos.
+    """
+    ahora = time.monotonic()
+    filas = []
+    for circuito in _circuitos.values():
+        if circuito.id_fuente is None or not circuito.pendiente:
+            continue
+        if not circuito.cambio_estado and ahora - circuito.ultima_escritura < settings.FUENTE_TASA_CADA_SEG:
+            continue
+        filas.append({
+            "b_id": circuito.id_fuente,
+            "b_tasa": round(circuito.tasa_exito, 2),
+            "b_estado": 'bloqueada' if circuito.abierto else 'activa'
+        })
+        circuito.pendiente = circuito.cambio_estado = False
+        circuito.ultima_escritura = ahora
+    if filas:
+        db.execute(_ACTUALIZAR_FUENTE, filas)
+
+
+def aplazamiento(circuito: Circuito) -> datetime:
+    """Hasta cuándo se aparta un capítulo de una fuente bloqueada."""
+    return datetime.utcnow() + timedelta(seconds=max(1.0, circuito.segundos_para_sonda()))
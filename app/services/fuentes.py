@@ -0,0 +1,67 @@
+import json
+import logging
+import time
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import FuenteScraping
+
+logger = logging.getLogger(__name__)
+
+
+def leer_configuracion(fuente: Optional[FuenteScraping]) -> dict:
+    """
+    Devuelve `configuracion_scraper` como dict (la columna JSON puede llegar como texto).
+    """
+    if fuente is None or not fuente.configuracion_scraper:
+        return {}
+    config = fuente.configuracion_scraper
+    if isinstance(config, dict):
+        return config
+    if isinstance(config, str):
+        try:
+            config_dict = json.loads(config)
+            if isinstance(config_dict, dict):
+                return config_dict
+        except ValueError:
+            logger.debug(f"configuracion_scraper inválida en fuente {fuente.id_fuente}")
+    return {}
+
+
+def cargar_fuentes_activas(db: Session) -> list[FuenteScraping]:
+    # Las 'bloqueadas' las bloquea el circuito (app/services/fallos.py) y siguen
+    # haciendo falta para sus reglas y para la sonda que las reactiva
+    return db.query(FuenteScraping).filter(FuenteScraping.estado.in_(('activa', 'bloqueada'))).all()
+
+
+_cache_fuentes: tuple[float, list[FuenteScraping]] | None = None
+
+
+def fuentes_cacheadas(db: Session) -> list[FuenteScraping]:
+    """
+    Fuentes activas cargadas como mucho una vez cada FUENTES_CACHE_SEG (un ciclo del worker).
+    Se devuelven desvinculadas de la sesión: son de sólo lectura, para escribir
+    en fuentes_scraping hay que usar un UPDATE explícito.
+    """
+    global _cache_fuentes
+    if _cache_fuentes and time.monotonic() - _cache_fuentes[0] < settings.FUENTES_CACHE_SEG:
+        return _cache_fuentes[1]
+    fuentes = cargar_fuentes_activas(db)
+    for fuente in fuentes:
+        db.expunge(fuente)
+    _cache_fuentes = (time.monotonic(), fuentes)
+    return fuentes
+
+
+def invalidar_fuentes():
+    global _cache_fuentes
+    _cache_fuentes = None
+
+
+def fuente_para_url(url: str, fuentes: list[FuenteScraping]) -> Optional[FuenteScraping]:
+    if not url:
+        return None
+    for fuente in fuentes:
+        if fuente.url_base and fuente.url_base in url:
+            return fuente
+    return None
@@ -0,0 +1,121 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import GlosarioNovela
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """
+    Autómata Aho-Corasick: encuentra en una sola pasada sobre el texto todos los
+    patrones que aparecen, sin importar cuántos términos tenga el glosario.
+    """
+
+    def __init__(self, patrones: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fallo: list[int] = [0]
+        self._salida: list[list[int]] = [[]]
+
+        for indice, patron in enumerate(patrones):
+            if not patron:
+                continue
+            estado = 0
+            for caracter in patron:
+                siguiente = self._goto[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._goto)
+                    self._goto[estado][caracter] = siguiente
+                    self._goto.append({})
+                    self._fallo.append(0)
+                    self._salida.append([])
+                estado = siguiente
+            self._salida[estado].append(indice)
+
+        # Enlaces de fallo en anchura (BFS)
+        cola = deque(self._goto[0].values())
+        while cola:
+            estado = cola.popleft()
+            for caracter, siguiente in self._goto[estado].items():
+                cola.append(siguiente)
+                fallo = self._fallo[estado]
+                while fallo and caracter not in self._goto[fallo]:
+                    fallo = self._fallo[fallo]
+                destino = self._goto[fallo].get(caracter, 0)
+                self._fallo[siguiente] = destino if destino != siguiente else 0
+                self._salida[siguiente] = self._salida[siguiente] + self._salida[self._fallo[siguiente]]
+
+    def buscar(self, texto: str) -> set[int]:
+        """Índices de los patrones que aparecen en el texto."""
+        encontrados = set()
+        estado = 0
+        goto, fallo, salida = self._goto, self._fallo, self._salida
+        for caracter in texto:
+            while estado and caracter not in goto[estado]:
+                estado = fallo[estado]
+            estado = goto[estado].get(caracter, 0)
+            if salida[estado]:
+                encontrados.update(salida[estado])
+        return encontrados
+
+
+@dataclass
+class EntradaGlosario:
+    original: str
+    traducido: str
+    notas: str | None = None
+
+
+class Glosario:
+    """Glosario de una novela con su autómata ya construido."""
+
+    def __init__(self, entradas: list[EntradaGlosario]):
+        self.entradas = entradas
+        self._automata = AhoCorasick([e.original for e in entradas])
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def coincidencias(self, texto: str) -> list[EntradaGlosario]:
+        """Sólo las entradas cuyo término original aparece en el texto."""
+        if not self.entradas:
+            return []
+        return [self.entradas[i] for i in sorted(self._automata.buscar(texto))]
+
+
+_cache: dict[int, tuple[float, Glosario]] = {}
+
+
+def glosario_para(db: Session, id_novela: int) -> Glosario:
+    """
+    Glosario de la novela, cacheado en memoria durante GLOSARIO_TTL_SEG.
+    """
+    en_cache = _cache.get(id_novela)
+    if en_cache and time.monotonic() - en_cache[0] < settings.GLOSARIO_TTL_SEG:
+        return en_cache[1]
+
+    filas = db.query(
+        GlosarioNovela.termino_original, GlosarioNovela.termino_traducido, GlosarioNovela.notas
+    ).filter(GlosarioNovela.id_novela == id_novela).all()
+    glosario = Glosario([EntradaGlosario(original, traducido, notas) for original, traducido, notas in filas])
+    _cache[id_novela] = (time.monotonic(), glosario)
+    if filas:
+        logger.info(f"📚 Glosario de la novela {id_novela} cargado ({len(filas)} términos)")
+    return glosario
+
+
+def invalidar_glosario(id_novela: int):
+    _cache.pop(id_novela, None)
+
+
+def formatear_para_prompt(entradas: list[EntradaGlosario]) -> str:
+    lineas = []
+    for e in entradas:
+        linea = f"- {e.original} → {e.traducido}"
+        if e.notas:
+            linea += f" ({e.notas})"
+        lineas.append(linea)
+    return "\n".join(lineas)
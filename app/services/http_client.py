@@ -0,0 +1,38 @@
+import logging
+import httpx
+from app.core.config import settings
+from app.services.browser_pool import USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido (keep-alive + HTTP/2). Se crea en el primer uso.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SEGUNDOS),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONEXIONES,
+                max_keepalive_connections=settings.HTTP_MAX_CONEXIONES
+            ),
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.6"
+            }
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("🌐 Cliente HTTP cerrado")
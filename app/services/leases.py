@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Identificador único de este proceso: host:pid:aleatorio
+WORKER_ID = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _pk(modelo):
+    return modelo.__mapper__.primary_key[0]
+
+
+def _expiracion() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.LEASE_TTL_SEGUNDOS)
+
+
+def reclamar(db: Session, modelo, filtros: list, limite: int, orden: list = None, valores: dict = None) -> list[int]:
+    """
+    Reclama hasta `limite` filas libres (o con lease caducado) para este worker.
+    `valores` se escriben en las filas reclamadas en el mismo UPDATE (p. ej. el estado).
+
+    Usa SELECT ... FOR UPDATE SKIP LOCKED para que varios workers puedan reclamar
+    a la vez sin bloquearse ni llevarse las mismas filas.
+    """
+    # lease_owner y lease_expira se ponen y se quitan juntos: basta con mirar lease_expira
+    return _reclamar(db, modelo, [*filtros, _sin_lease_vigente(modelo, datetime.utcnow())], limite, orden, valores)
+
+
+def reclamar_por_estado(db: Session, modelo, nuevo: str, en_curso: str, filtros: list, limite: int,
+                        orden: list = None, valores: dict = None) -> list[int]:
+    """
+    Como `reclamar`, para las colas de `estado_pipeline`. Cada consulta compara el
+    estado por igualdad para que idx_capitulos_pipeline sirva el orden y el LIMIT
+    corte en cuanto tiene filas (un IN de dos estados obliga a ordenar todo el
+    conjunto y SKIP LOCKED lo bloquearía entero):
+
+      1. filas `nuevo` sin lease, en el orden del índice;
+      2. filas `nuevo` con el lease caducado (las que se quedó otra fase, p. ej. la revisión);
+      3. filas `en_curso` sin lease vigente: un worker las soltó o murió a medias.
+    """
+    ahora = datetime.utcnow()
+    estado = modelo.estado_pipeline
+    ids = []
+    for condiciones in (
+        [estado == nuevo, modelo.lease_expira == None],
+        [estado == nuevo, modelo.lease_expira < ahora],
+        [estado == en_curso, _sin_lease_vigente(modelo, ahora)],
+    ):
+        if len(ids) >= limite:
+            break
+        ids += _reclamar(db, modelo, [*condiciones, *filtros], limite - len(ids), orden, valores)
+    return ids
+
+
+def _sin_lease_vigente(modelo, ahora: datetime):
+    return or_(modelo.lease_expira == None, modelo.lease_expira < ahora)
+
+
+def _reclamar(db: Session, modelo, filtros: list, limite: int, orden: list = None, valores: dict = None) -> list[int]:
+    pk = _pk(modelo)
+    consulta = db.query(pk, modelo.lease_owner).filter(*filtros)
+    if orden:
+        consulta = consulta.order_by(*orden)
+    filas = consulta.limit(limite).with_for_update(skip_locked=True).all()
+
+    ids = [fila[0] for fila in filas]
+    if ids:
+        db.query(modelo).filter(pk.in_(ids)).update(
+            {modelo.lease_owner: WORKER_ID, modelo.lease_expira: _expiracion(), **(valores or {})},
+            synchronize_session=False
+        )
+    db.commit()
+
+    recuperados = sum(1 for fila in filas if fila[1] is not None)
+    if recuperados:
+        logger.info(f"🪦 Recuperadas {recuperados} filas de {modelo.__tablename__} con lease caducado")
+    if ids:
+        latido.registrar(modelo, ids)
+    return ids
+
+
+def sigue_siendo_mio(db: Session, modelo, id_fila: int) -> bool:
+    """
+    Renueva el lease de una fila sólo si sigue a nombre de este worker.
+    Se usa justo antes de escribir resultados caros (p. ej. una traducción).
+    """
+    pk = _pk(modelo)
+    actualizadas = db.query(modelo).filter(pk == id_fila, modelo.lease_owner == WORKER_ID).update(
+        {modelo.lease_expira: _expiracion()},
+        synchronize_session=False
+    )
+    return actualizadas == 1
+
+
+def liberar(db: Session, modelo, ids: list[int]):
+    """Suelta los leases propios (no hace commit: va con la escritura del resultado)."""
+    if not ids:
+        return
+    pk = _pk(modelo)
+    db.query(modelo).filter(pk.in_(ids), modelo.lease_owner == WORKER_ID).update(
+        {modelo.lease_owner: None, modelo.lease_expira: None},
+        synchronize_session=False
+    )
+    latido.soltar(modelo, ids)
+
+
+class Heartbeat:
+    """
+    Renueva periódicamente los leases que tiene este worker para que no caduquen
+    mientras el trabajo sigue en marcha. Si el proceso muere, dejan de renovarse
+    y otro worker los recupera al caducar.
+    """
+
+    def __init__(self):
+        self._activos: dict = {}
+        self._tarea: asyncio.Task | None = None
+
+    def registrar(self, modelo, ids: list[int]):
+        self._activos.setdefault(modelo, set()).update(ids)
+
+    def soltar(self, modelo, ids: list[int]):
+        self._activos.get(modelo, set()).difference_update(ids)
+
+    def start(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._loop(), name="heartbeat-leases")
+            logger.info(f"💓 Heartbeat de leases iniciado ({WORKER_ID})")
+
+    async def stop(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        # Al salir limpiamente soltamos todo para no esperar a la caducidad
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.run_sync(self._liberar_todo)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudieron liberar los leases al salir: {e}")
+
+    def _liberar_todo(self, db: Session):
+        for modelo, ids in list(self._activos.items()):
+            liberar(db, modelo, list(ids))
+        db.commit()
+
+    def _renovar(self, db: Session):
+        for modelo, ids in self._activos.items():
+            if not ids:
+                continue
+            pk = _pk(modelo)
+            db.query(modelo).filter(pk.in_(list(ids)), modelo.lease_owner == WORKER_ID).update(
+                {modelo.lease_expira: _expiracion()},
+                synchronize_session=False
+            )
+        db.commit()
+
+    async def renovar(self):
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.run_sync(self._renovar)
+            except Exception as e:
+                logger.warning(f"⚠️ Error renovando leases: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(max(1, settings.LEASE_TTL_SEGUNDOS // 3))
+            await self.renovar()
+
+
+latido = Heartbeat()
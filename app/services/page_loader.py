@@ -0,0 +1,185 @@
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# PERFILES DE CARGA DEL NAVEGADOR
+# ---------------------------------------------------------
+# En lugar de esperar a `networkidle` y dormir unos segundos fijos, cada tipo de
+# página ("portada", "indice", "capitulo") espera a que aparezca lo que se va a
+# extraer, con un plazo máximo por página. El perfil sale de `reglas["carga"]`
+# (ver extraction_rules) y se puede ajustar por fuente:
+#
+#   bloquear_tipos      -> resource_type de Playwright que no se descargan
+#   bloquear_urls       -> fragmentos de URL bloqueados (anuncios, trackers)
+#   plazo_seg           -> tiempo máximo por página (navegación + esperas)
+#   enlaces_estables_ms -> el índice está completo cuando el nº de enlaces no cambia en este tiempo
+#   <tipo>.esperar      -> selectores a esperar; por defecto, los de la regla que se va a extraer
+#   <tipo>.min_caracteres -> texto mínimo en el elemento esperado
+#   portada.tras_clic   -> selectores a esperar tras pulsar `clic_antes`; por defecto, los de la descripción
+#   portada.tras_clic_ms -> espera máxima tras el clic (si la novela no tiene descripción)
+
+# Evalúa en la página si alguno de los selectores tiene ya texto suficiente
+_HAY_CONTENIDO_JS = """([selectores, minimo]) => selectores.some((sel) => {
+    let el = null;
+    try { el = document.querySelector(sel); } catch (e) { return false; }
+    return !!el && ((el.innerText || el.getAttribute('src') || '').trim().length >= minimo);
+})"""
+
+# Pulsa los elementos de `clic_antes` que existan; devuelve cuántos se pulsaron
+_PULSAR_JS = """(selectores) => selectores.filter((sel) => {
+    let el = null;
+    try { el = document.querySelector(sel); } catch (e) { return false; }
+    if (!el) return false;
+    try { el.click(); } catch (e) { return false; }
+    return true;
+}).length"""
+
+# Cierto cuando el número de enlaces lleva `estableMs` sin cambiar. Si aún no ha
+# crecido respecto a `antes` (la petición del botón no ha vuelto) se espera 5 veces más.
+_ENLACES_ESTABLES_JS = """([selector, estableMs, antes]) => {
+    const n = document.querySelectorAll(selector).length;
+    const ahora = performance.now();
+    const e = window.__novelagentEnlaces || (window.__novelagentEnlaces = { n: -1, desde: ahora });
+    if (n !== e.n) { e.n = n; e.desde = ahora; return false; }
+    return ahora - e.desde >= (n > antes ? estableMs : estableMs * 5);
+}"""
+
+
+class Plazo:
+    """Tiempo restante de una página, compartido por todas sus esperas."""
+
+    def __init__(self, segundos: float):
+        self.fin = time.monotonic() + segundos
+
+    def ms(self) -> float:
+        return max(1.0, (self.fin - time.monotonic()) * 1000)
+
+
+def _selectores_de_campo(reglas: dict, campo: str) -> list[str]:
+    regla = (reglas.get("campos") or {}).get(campo) or {}
+    # Los selectores con plantilla ({id_novela}...) sólo se resuelven al extraer
+    return [s for s in regla.get("selectores") or [] if "{" not in s]
+
+
+def _selectores_por_defecto(reglas: dict, tipo: str) -> list[str]:
+    if tipo == "portada":
+        return _selectores_de_campo(reglas, "titulo")
+    if tipo == "indice":
+        enlaces = reglas.get("enlaces") or {}
+        contiene = "".join(f'[href*="{c}"]' for c in enlaces.get("contiene") or [])
+        return [f"{enlaces.get('selector') or 'a'}{contiene}"]
+    if tipo == "capitulo":
+        contenido = reglas.get("contenido") or {}
+        selectores = list(contenido.get("selectores") or [])
+        # El extractor recurre a `hijo_de` si no encaja ningún selector: también vale como señal
+        hijo_de = contenido.get("hijo_de")
+        if hijo_de:
+            selectores.append(f"{hijo_de['selector']} > :nth-child({hijo_de['indice'] + 1})")
+        return selectores
+    return []
+
+
+def perfil_de_carga(reglas: dict, tipo: str) -> dict:
+    """Perfil efectivo de un tipo de página: opciones comunes + las del tipo."""
+    carga = reglas.get("carga") or {}
+    perfil = {clave: valor for clave, valor in carga.items() if not isinstance(valor, dict)}
+    perfil.update(carga.get(tipo) or {})
+    perfil.setdefault("plazo_seg", 30)
+    perfil.setdefault("min_caracteres", 1)
+    if not perfil.get("esperar"):
+        perfil["esperar"] = _selectores_por_defecto(reglas, tipo)
+    if tipo == "indice":
+        perfil["selector_enlaces"] = _selectores_por_defecto(reglas, "indice")[0]
+    if tipo == "portada":
+        perfil["clic_antes"] = list(reglas.get("clic_antes") or [])
+        perfil.setdefault("tras_clic_ms", 2000)
+        if not perfil.get("tras_clic"):
+            perfil["tras_clic"] = _selectores_de_campo(reglas, "descripcion")
+    return perfil
+
+
+async def bloquear_recursos(page, perfil: dict):
+    """
+    Aborta las peticiones de los tipos y URLs del perfil. Se llama una vez por
+    página prestada, antes de la primera navegación.
+    """
+    tipos = set(perfil.get("bloquear_tipos") or [])
+    urls = tuple(perfil.get("bloquear_urls") or [])
+    if not tipos and not urls:
+        return
+
+    async def filtrar(route):
+        peticion = route.request
+        if peticion.resource_type in tipos or any(fragmento in peticion.url for fragmento in urls):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", filtrar)
+
+
+async def cargar(page, url: str, perfil: dict, plazo: Optional[Plazo] = None) -> bool:
+    """
+    Navega a `url` y espera a que el contenido del perfil tenga texto. Devuelve False
+    si se agotó el plazo esperando (la extracción se intenta de todos modos); los
+    errores de navegación que no son de tiempo se propagan.
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    plazo = plazo or Plazo(perfil["plazo_seg"])
+    try:
+        await page.goto(url, timeout=plazo.ms(), wait_until="domcontentloaded")
+        if perfil["esperar"]:
+            await page.wait_for_function(
+                _HAY_CONTENIDO_JS, arg=[perfil["esperar"], perfil["min_caracteres"]],
+                timeout=plazo.ms(), polling=100
+            )
+        return True
+    except PlaywrightTimeoutError:
+        logger.warning(f"⏱️ Plazo agotado esperando {perfil['esperar']} en {url}")
+        return False
+
+
+async def pulsar_antes_de_extraer(page, perfil: dict, plazo: Plazo) -> bool:
+    """
+    Pulsa los elementos de `clic_antes` (p. ej. la pestaña de información de twkan) y
+    espera a que lo que muestran tenga texto, como mucho `tras_clic_ms`.
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    if not perfil.get("clic_antes") or not await page.evaluate(_PULSAR_JS, perfil["clic_antes"]):
+        return False
+    if perfil["tras_clic"]:
+        try:
+            await page.wait_for_function(
+                _HAY_CONTENIDO_JS, arg=[perfil["tras_clic"], 1],
+                timeout=min(plazo.ms(), perfil["tras_clic_ms"]), polling=100
+            )
+        except PlaywrightTimeoutError:
+            logger.debug(f"Nada en {perfil['tras_clic']} tras pulsar {perfil['clic_antes']}")
+    return True
+
+
+async def contar_enlaces(page, perfil: dict) -> int:
+    return await page.locator(perfil["selector_enlaces"]).count()
+
+
+async def esperar_enlaces_estables(page, perfil: dict, plazo: Plazo, antes: int = 0) -> bool:
+    """
+    Espera a que deje de crecer la lista de enlaces (p. ej. tras pulsar 「點擊展開」).
+    `antes` es el número de enlaces que había antes del clic.
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    try:
+        await page.wait_for_function(
+            _ENLACES_ESTABLES_JS, arg=[perfil["selector_enlaces"], perfil.get("enlaces_estables_ms", 800), antes],
+            timeout=plazo.ms(), polling=100
+        )
+        return True
+    except PlaywrightTimeoutError:
+        logger.warning("⏱️ Plazo agotado esperando a que el índice terminara de cargar")
+        return False
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from app.core.config import settings
+from app.core.metricas import COLAS
+from app.db.database import AsyncSessionLocal
+from app.db.models import Capitulo
+from app.services.discovery import discover_new_chapters
+from app.services.fuentes import fuentes_cacheadas
+from app.services.leases import liberar
+from app.services.scraper import scrape_capitulo, reclamar_pendientes_scrape
+
+logger = logging.getLogger(__name__)
+
+
+async def _soltar(db, id_capitulo: int):
+    """Tras un error, suelta el lease del capítulo para que se pueda reintentar."""
+    try:
+        await db.rollback()
+        await db.run_sync(liberar, Capitulo, [id_capitulo])
+        await db.commit()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo soltar el lease del capítulo {id_capitulo}: {e}")
+        await db.rollback()
+
+
+class Pipeline:
+    """
+    Modo pipeline del worker: discovery, scraping y traducción corren a la vez
+    como etapas de larga duración unidas por colas acotadas (backpressure).
+
+    discovery ──► cola_scrape ──► N scrapers ──► cola_traduccion ──► M traductores
+
+    Un alimentador periódico encola además el trabajo pendiente que ya estaba
+    en la DB (capítulos de ciclos anteriores o reintentos). Con REVISION_ACTIVA
+    otra etapa relee los capítulos recientes (ver revision.py).
+    """
+
+    def __init__(self):
+        self.traduccion_activa = settings.AGENT_TRADUCCION_ACTIVA
+        self.cola_scrape: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_COLA_MAX)
+        self.cola_traduccion: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_COLA_MAX)
+        # IDs encolados o en proceso, para no meter dos veces el mismo capítulo
+        self._en_vuelo_scrape: set[int] = set()
+        self._en_vuelo_traduccion: set[int] = set()
+        COLAS.labels("scrape").set_function(self.cola_scrape.qsize)
+        COLAS.labels("traduccion").set_function(self.cola_traduccion.qsize)
+
+    async def run(self):
+        logger.info(
+            f"🧵 Pipeline: {settings.PIPELINE_SCRAPERS} scrapers, "
+            f"{settings.PIPELINE_TRADUCTORES if self.traduccion_activa else 0} traductores, "
+            f"colas de {settings.PIPELINE_COLA_MAX}"
+        )
+        tareas = [
+            asyncio.create_task(self._etapa_discovery(), name="discovery"),
+            asyncio.create_task(self._alimentador(), name="alimentador"),
+        ]
+        tareas += [
+            asyncio.create_task(self._etapa_scrape(i), name=f"scraper-{i}")
+            for i in range(settings.PIPELINE_SCRAPERS)
+        ]
+        if settings.REVISION_ACTIVA:
+            tareas.append(asyncio.create_task(self._etapa_revision(), name="revision"))
+        if self.traduccion_activa:
+            tareas += [
+                asyncio.create_task(self._etapa_traduccion(i), name=f"traductor-{i}")
+                for i in range(settings.PIPELINE_TRADUCTORES)
+            ]
+        try:
+            await asyncio.gather(*tareas)
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+    # ---------------------------------------------------------
+    # ENCOLADO
+    # ---------------------------------------------------------
+
+    async def _encolar_scrape(self, id_capitulo: int):
+        if id_capitulo in self._en_vuelo_scrape:
+            return
+        self._en_vuelo_scrape.add(id_capitulo)
+        await self.cola_scrape.put(id_capitulo)
+
+    async def _encolar_traduccion(self, id_capitulo: int):
+        if not self.traduccion_activa or id_capitulo in self._en_vuelo_traduccion:
+            return
+        self._en_vuelo_traduccion.add(id_capitulo)
+        await self.cola_traduccion.put(id_capitulo)
+
+    @staticmethod
+    def _hueco(cola: asyncio.Queue) -> int:
+        return min(settings.SCRAPE_BATCH_SIZE, cola.maxsize - cola.qsize())
+
+    @staticmethod
+    async def _fuentes_activas(db):
+        # Las fuentes cambian poco: caché compartida del proceso (FUENTES_CACHE_SEG)
+        return await db.run_sync(fuentes_cacheadas)
+
+    # ---------------------------------------------------------
+    # ETAPAS
+    # ---------------------------------------------------------
+
+    async def _etapa_discovery(self):
+        while True:
+            async with AsyncSessionLocal() as db:
+                try:
+                    logger.info("🔍 [pipeline] Buscando actualizaciones en la web...")
+                    nuevos = await discover_new_chapters(db)
+                except Exception as e:
+                    logger.error(f"❌ [pipeline] Error en discovery: {e}")
+                    nuevos = []
+
+            for id_capitulo in nuevos:
+                await self._encolar_scrape(id_capitulo)
+            await asyncio.sleep(settings.AGENT_POLLING_INTERVAL)
+
+    async def _etapa_revision(self):
+        from app.services.revision import process_rechecks
+
+        while True:
+            async with AsyncSessionLocal() as db:
+                try:
+                    await process_rechecks(db)
+                except Exception as e:
+                    logger.error(f"❌ [pipeline] Error en la revisión de capítulos: {e}")
+            await asyncio.sleep(settings.AGENT_POLLING_INTERVAL)
+
+    async def _alimentador(self):
+        while True:
+            async with AsyncSessionLocal() as db:
+                try:
+                    # Sólo se reclama lo que cabe en las colas, para no acaparar leases
+                    ids_scrape = await db.run_sync(reclamar_pendientes_scrape, self._hueco(self.cola_scrape))
+                    ids_traduccion = []
+                    if self.traduccion_activa:
+                        from app.services.translator import reclamar_pendientes_traduccion
+                        ids_traduccion = await db.run_sync(reclamar_pendientes_traduccion, self._hueco(self.cola_traduccion))
+                except Exception as e:
+                    logger.error(f"❌ [pipeline] Error consultando pendientes: {e}")
+                    ids_scrape, ids_traduccion = [], []
+
+            for id_capitulo in ids_scrape:
+                await self._encolar_scrape(id_capitulo)
+            for id_capitulo in ids_traduccion:
+                await self._encolar_traduccion(id_capitulo)
+
+            logger.info(
+                f"📊 [pipeline] Colas: scrape={self.cola_scrape.qsize()}, "
+                f"traducción={self.cola_traduccion.qsize()}"
+            )
+            await asyncio.sleep(settings.PIPELINE_ALIMENTADOR_SEG)
+
+    async def _etapa_scrape(self, indice: int):
+        while True:
+            id_capitulo = await self.cola_scrape.get()
+            ok = False
+            try:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        ok = await scrape_capitulo(db, id_capitulo, await self._fuentes_activas(db))
+                    except Exception as e:
+                        logger.error(f"❌ [scraper-{indice}] Error en capítulo {id_capitulo}: {e}")
+                        await _soltar(db, id_capitulo)
+            finally:
+                self._en_vuelo_scrape.discard(id_capitulo)
+                self.cola_scrape.task_done()
+
+            # Lo recién scrapeado pasa directo a traducción
+            if ok:
+                await self._encolar_traduccion(id_capitulo)
+
+    async def _etapa_traduccion(self, indice: int):
+        from app.services.translator import translate_capitulo, fallo_traduccion
+
+        while True:
+            id_capitulo = await self.cola_traduccion.get()
+            try:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        await translate_capitulo(db, id_capitulo)
+                    except Exception as e:
+                        logger.error(f"❌ [traductor-{indice}] Error en capítulo {id_capitulo}: {e}")
+                        await fallo_traduccion(db, id_capitulo)
+            finally:
+                self._en_vuelo_traduccion.discard(id_capitulo)
+                self.cola_traduccion.task_done()
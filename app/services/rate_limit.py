@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlparse
+from app.core.config import settings
+from app.db.models import FuenteScraping
+from app.services.fuentes import leer_configuracion
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: `tasa_por_hora` tokens por hora con ráfagas de hasta `capacidad`.
+    """
+
+    def __init__(self, tasa_por_hora: int, capacidad: int):
+        self.tasa = max(1, tasa_por_hora) / 3600.0  # tokens por segundo
+        self.capacidad = max(1, capacidad)
+        self._tokens = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    async def acquire(self):
+        # El lock mantiene el orden de llegada entre las tareas que esperan
+        async with self._lock:
+            self._recargar()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.tasa)
+                self._recargar()
+            self._tokens -= 1
+
+
+class SourceLimiter:
+    """Limita una fuente por ritmo (token bucket) y por peticiones simultáneas."""
+
+    def __init__(self, nombre: str, limite_hora: int, concurrencia: int):
+        self.nombre = nombre
+        self.limite_hora = limite_hora
+        self.concurrencia = max(1, concurrencia)
+        self.bucket = TokenBucket(limite_hora, self.concurrencia)
+        self._semaforo = asyncio.Semaphore(self.concurrencia)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._semaforo:
+            await self.bucket.acquire()
+            yield
+
+
+_limitadores: dict[str, SourceLimiter] = {}
+
+
+def _concurrencia_de(fuente: FuenteScraping) -> int:
+    """`concurrencia_max` de la configuración de la fuente, normalizado a un entero >= 1."""
+    valor = leer_configuracion(fuente).get("concurrencia_max") or settings.SCRAPE_CONCURRENCIA_POR_FUENTE
+    try:
+        return max(1, int(valor))
+    except (TypeError, ValueError):
+        logger.debug(f"concurrencia_max inválida en fuente {fuente.id_fuente}: {valor!r}")
+        return max(1, settings.SCRAPE_CONCURRENCIA_POR_FUENTE)
+
+
+def limitador_para(fuente: Optional[FuenteScraping], url: str) -> SourceLimiter:
+    """
+    Devuelve el limitador de la fuente (o del dominio si la URL no tiene fuente registrada).
+    Se reconstruye si cambian los límites configurados en `fuentes_scraping`.
+    """
+    if fuente is not None:
+        clave = f"fuente:{fuente.id_fuente}"
+        nombre = fuente.nombre_fuente
+        limite_hora = fuente.limite_requests_hora or settings.SCRAPE_LIMITE_HORA_DEFAULT
+        concurrencia = _concurrencia_de(fuente)
+    else:
+        dominio = urlparse(url).netloc
+        clave = f"dominio:{dominio}"
+        nombre = dominio
+        limite_hora = settings.SCRAPE_LIMITE_HORA_DEFAULT
+        concurrencia = max(1, settings.SCRAPE_CONCURRENCIA_POR_FUENTE)
+
+    limitador = _limitadores.get(clave)
+    if limitador is None or limitador.limite_hora != limite_hora or limitador.concurrencia != concurrencia:
+        limitador = SourceLimiter(nombre, limite_hora, concurrencia)
+        _limitadores[clave] = limitador
+        logger.info(f"🚦 Limitador para {nombre}: {limite_hora} req/h, {limitador.concurrencia} simultáneas")
+    return limitador
@@ -0,0 +1,321 @@
+"""
+Revisión de capítulos ya scrapeados: los autores corrigen erratas o alargan
+capítulos después de publicarlos.
+
+Cada REVISION_INTERVALO_HORAS se vuelven a leer los capítulos de los últimos
+REVISION_DIAS y se comparan con `hash_contenido`. Si no han cambiado sólo cuesta
+la descarga. Si han cambiado se guarda el texto nuevo y, si ya estaba traducido,
+se hace un diff por párrafos contra el original anterior: los párrafos iguales
+conservan su traducción y sólo los nuevos o modificados van a Gemini. El
+resultado se guarda como una nueva fila de traducción con `version_traduccion + 1`.
+
+Uso: python worker.py recheck (una pasada), o REVISION_ACTIVA=true en el worker.
+"""
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from typing import Optional
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metricas import CAPITULOS_TRADUCIDOS, GEMINI_COSTO
+from app.db.database import AsyncSessionLocal
+from app.db.models import Capitulo, TraduccionCapitulo, Novela, FuenteScraping
+from app.services.avisos_api import avisar_cambios
+from app.services.fallos import circuito_para
+from app.services.glossary import glosario_para
+from app.services.fuentes import fuentes_cacheadas, fuente_para_url, leer_configuracion
+from app.services.leases import WORKER_ID, reclamar, liberar, sigue_siendo_mio
+from app.services.rate_limit import limitador_para
+from app.services.extraction_rules import reglas_para
+from app.services.scraper import leer_capitulo
+from app.services.translation_engine import ResultadoTraduccion
+from app.services.translation_memory import hash_texto, normalizar_parrafo, traducir_con_memoria
+
+logger = logging.getLogger(__name__)
+
+# Contadores del proceso: revisados, sin cambios, cambiados, párrafos reutilizados / retraducidos
+revision_stats = Counter()
+
+_COLUMNAS_REVISION = (
+    Capitulo.id_capitulo, Capitulo.id_novela, Capitulo.fuente_url, Capitulo.numero_capitulo,
+    Capitulo.hash_contenido, Capitulo.estado_pipeline
+)
+
+_t = Capitulo.__table__
+
+_MARCAR_REVISADO = update(_t).where(
+    _t.c.id_capitulo == bindparam("b_id"),
+    _t.c.lease_owner == WORKER_ID
+).values(revisado_en=bindparam("b_fecha"), lease_owner=None, lease_expira=None)
+
+
+# ---------------------------------------------------------
+# DIFF POR PÁRRAFOS
+# ---------------------------------------------------------
+
+def empalmar(original_anterior: str, traduccion_anterior: str, original_nuevo: str) -> Optional[list[Optional[str]]]:
+    """
+    Líneas de la nueva traducción, párrafo a párrafo con `original_nuevo`: los
+    párrafos sin cambios llevan su traducción anterior y los nuevos o modificados
+    quedan a None. Devuelve None si la traducción anterior no está alineada línea
+    a línea con su original (p. ej. Gemini juntó párrafos) y no se puede empalmar.
+    """
+    anteriores = original_anterior.split("\n")
+    traducidas = traduccion_anterior.split("\n")
+    if len(anteriores) != len(traducidas):
+        return None
+    nuevas = original_nuevo.split("\n")
+
+    comparador = SequenceMatcher(
+        None, [normalizar_parrafo(p) for p in anteriores], [normalizar_parrafo(p) for p in nuevas], autojunk=False
+    )
+    lineas: list[Optional[str]] = [None] * len(nuevas)
+    for operacion, i1, i2, j1, j2 in comparador.get_opcodes():
+        if operacion == "equal":
+            lineas[j1:j2] = traducidas[i1:i2]
+    return [("" if linea is None and not nuevas[j].strip() else linea) for j, linea in enumerate(lineas)]
+
+
+# ---------------------------------------------------------
+# RECLAMAR Y RELEER
+# ---------------------------------------------------------
+
+def _filtros_revision(ahora: datetime) -> list:
+    # revisado_en se rellena al scrapear (y la migración 0012 lo rellenó en los antiguos):
+    # sin COALESCE, idx_capitulos_revision sirve el filtro y el orden
+    return [
+        Capitulo.revisado_en <= ahora - timedelta(hours=settings.REVISION_INTERVALO_HORAS),
+        Capitulo.scrapeado_en >= ahora - timedelta(days=settings.REVISION_DIAS),
+        Capitulo.fuente_url != None
+    ]
+
+
+def reclamar_revisiones(db: Session, limite: int) -> list[int]:
+    """Reclama (lease) capítulos recientes que toca volver a leer; no cambia su estado."""
+    filtros = _filtros_revision(datetime.utcnow())
+    ids = []
+    # Un estado por consulta (igualdad) para que el índice dé las filas ya ordenadas
+    for estado in ('traducido', 'scrapeado'):
+        if len(ids) >= limite:
+            break
+        ids += reclamar(db, Capitulo, [Capitulo.estado_pipeline == estado, *filtros], limite - len(ids),
+                        orden=[Capitulo.revisado_en])
+    return ids
+
+
+async def _releer(cap, fuentes: list[FuenteScraping]) -> Optional[str]:
+    url = cap.fuente_url
+    fuente = fuente_para_url(url, fuentes)
+    circuito = circuito_para(fuente, url)
+    if not circuito.permite():
+        return None
+    modo = leer_configuracion(fuente).get("modo_fetch", settings.SCRAPE_MODO_FETCH)
+    async with limitador_para(fuente, url).slot():
+        texto, error = await leer_capitulo(url, modo=modo, reglas=reglas_para(url, fuente))
+    circuito.registrar(texto is not None)
+    if texto is None:
+        logger.debug(f"No se pudo releer el capítulo {cap.id_capitulo}: {error}")
+    return texto
+
+
+def _marcar_revisados(db: Session, ids: list[int]):
+    if ids:
+        ahora = datetime.utcnow()
+        db.execute(_MARCAR_REVISADO, [{"b_id": i, "b_fecha": ahora} for i in ids])
+    db.commit()
+
+
+async def process_rechecks(db: AsyncSession):
+    """
+    Relee un lote de capítulos recientes y actualiza los que han cambiado en la fuente.
+    """
+    ids = await db.run_sync(reclamar_revisiones, settings.REVISION_LOTE)
+    if not ids:
+        logger.info("💤 No hay capítulos que revisar.")
+        return
+    capitulos = (await db.execute(select(*_COLUMNAS_REVISION).where(Capitulo.id_capitulo.in_(ids)))).all()
+    fuentes = await db.run_sync(fuentes_cacheadas)
+    logger.info(f"🔁 Revisando {len(capitulos)} capítulos recientes en su fuente")
+
+    try:
+        textos = await asyncio.gather(*(_releer(cap, fuentes) for cap in capitulos), return_exceptions=True)
+        # Los que no se pudieron leer también esperan al siguiente intervalo
+        revisados, cambiados = [], []
+        for cap, texto in zip(capitulos, textos):
+            if isinstance(texto, Exception) or texto is None:
+                revision_stats["ilegibles"] += 1
+                revisados.append(cap.id_capitulo)
+            elif hash_texto(texto) == cap.hash_contenido:
+                revision_stats["sin_cambios"] += 1
+                revisados.append(cap.id_capitulo)
+            else:
+                cambiados.append((cap, texto))
+        await db.run_sync(_marcar_revisados, revisados)
+
+        resultados = await asyncio.gather(
+            *(_actualizar_en_sesion_propia(cap, texto) for cap, texto in cambiados), return_exceptions=True
+        )
+        for (cap, _), resultado in zip(cambiados, resultados):
+            if isinstance(resultado, Exception):
+                logger.error(f"❌ Error actualizando el capítulo revisado {cap.id_capitulo}: {resultado}")
+    finally:
+        await db.rollback()
+        await db.run_sync(liberar, Capitulo, ids)
+        await db.commit()
+    logger.info(f"📊 Revisión: {resumen_revision()}")
+
+
+def resumen_revision() -> str:
+    return (
+        f"{revision_stats['sin_cambios']} sin cambios, {revision_stats['cambiados']} actualizados, "
+        f"{revision_stats['ilegibles']} sin leer; párrafos reutilizados {revision_stats['parrafos_reutilizados']}, "
+        f"retraducidos {revision_stats['parrafos_retraducidos']}"
+    )
+
+
+# ---------------------------------------------------------
+# ACTUALIZAR UN CAPÍTULO CAMBIADO
+# ---------------------------------------------------------
+
+@dataclass
+class Anterior:
+    """Lo que hace falta del capítulo antes de cambiarlo, leído de una vez."""
+    texto: str
+    titulo_novela: str
+    id_traduccion_novela: Optional[int] = None
+    version: int = 1
+    titulo_traducido: Optional[str] = None
+    traduccion: Optional[str] = None
+
+
+def _leer_anterior(db: Session, id_capitulo: int) -> Optional[Anterior]:
+    cap = db.get(Capitulo, id_capitulo)
+    if cap is None:
+        return None
+    novela = db.get(Novela, cap.id_novela)
+    anterior = Anterior(cap.texto_original or "", novela.titulo_original if novela else "Novela en Proceso")
+    if cap.estado_pipeline == 'traducido':
+        traduccion = db.query(TraduccionCapitulo).filter(
+            TraduccionCapitulo.id_capitulo == id_capitulo,
+            TraduccionCapitulo.estado_traduccion == 'completado'
+        ).order_by(TraduccionCapitulo.version_traduccion.desc(), TraduccionCapitulo.id_traduccion_capitulo_es.desc()).first()
+        if traduccion is not None:
+            anterior.id_traduccion_novela = traduccion.id_traduccion_novela_es
+            anterior.version = traduccion.version_traduccion or 1
+            anterior.titulo_traducido = traduccion.titulo_traducido
+            anterior.traduccion = traduccion.texto_traducido
+    db.commit()
+    return anterior
+
+
+async def _retraducir(db: AsyncSession, cap, anterior: Anterior, texto: str) -> Optional[ResultadoTraduccion]:
+    from app.services.translator import CapituloATraducir, traducir_texto
+
+    glosario = await db.run_sync(glosario_para, cap.id_novela)
+    destino = CapituloATraducir(cap.id_capitulo, cap.id_novela, cap.numero_capitulo, anterior.titulo_novela, texto, None, glosario)
+    traducir = lambda fragmento: traducir_texto(destino, fragmento)
+
+    lineas = empalmar(anterior.texto, anterior.traduccion, texto)
+    if lineas is None:
+        logger.info(f"✂️ La traducción del capítulo {cap.id_capitulo} no está alineada por párrafos: se traduce entero")
+        return await traducir_con_memoria(db, texto, traducir, glosario)
+
+    nuevas = texto.split("\n")
+    pendientes = [j for j, linea in enumerate(lineas) if linea is None]
+    revision_stats["parrafos_reutilizados"] += sum(1 for j, linea in enumerate(lineas) if linea and nuevas[j].strip())
+    revision_stats["parrafos_retraducidos"] += len(pendientes)
+    resultado = None
+    if pendientes:
+        resultado = await traducir_con_memoria(db, "\n".join(nuevas[j] for j in pendientes), traducir, glosario)
+        if resultado is None:
+            return None
+        traducidas = resultado.texto.split("\n")
+        if len(traducidas) != len(pendientes):
+            return await traducir_con_memoria(db, texto, traducir, glosario)
+        for j, traducida in zip(pendientes, traducidas):
+            lineas[j] = traducida
+
+    ensamblado = "\n".join(lineas)
+    return ResultadoTraduccion(
+        texto=ensamblado,
+        segundos=resultado.segundos if resultado else 0.0,
+        palabras=len(ensamblado.split()),
+        tokens_entrada=resultado.tokens_entrada if resultado else 0,
+        tokens_salida=resultado.tokens_salida if resultado else 0,
+        fragmentos=resultado.fragmentos if resultado else 0
+    )
+
+
+def _guardar_revision(db: Session, id_capitulo: int, texto: str, anterior: Anterior,
+                      resultado: Optional[ResultadoTraduccion]) -> bool:
+    from app.services.translator import costo_estimado
+
+    if not sigue_siendo_mio(db, Capitulo, id_capitulo):
+        db.rollback()
+        return False
+    capitulo = db.get(Capitulo, id_capitulo)
+    capitulo.texto_original = texto
+    capitulo.hash_contenido = hash_texto(texto)
+    capitulo.revisado_en = datetime.utcnow()
+    if resultado is not None:
+        traduccion = TraduccionCapitulo(
+            id_capitulo=id_capitulo,
+            id_traduccion_novela_es=anterior.id_traduccion_novela,
+            titulo_traducido=anterior.titulo_traducido,
+            estado_traduccion='completado',
+            traductor_ia=settings.GEMINI_MODELO,
+            version_traduccion=anterior.version + 1,
+            palabras_traducidas=resultado.palabras,
+            tiempo_traduccion_segundos=round(resultado.segundos),
+            costo_traduccion=round(costo_estimado(resultado), 4),
+            hash_traduccion=hash_texto(resultado.texto)
+        )
+        traduccion.texto_traducido = resultado.texto
+        db.add(traduccion)
+    elif anterior.traduccion is not None and anterior.texto != texto:
+        # Sin traducción nueva, la anterior ya no corresponde: vuelve a la cola de traducción
+        capitulo.estado_pipeline = 'scrapeado'
+    liberar(db, Capitulo, [id_capitulo])
+    db.commit()
+    return True
+
+
+async def _actualizar_en_sesion_propia(cap, texto: str) -> bool:
+    from app.services.translator import costo_estimado
+
+    # Una AsyncSession no admite operaciones concurrentes: una por capítulo
+    async with AsyncSessionLocal() as db:
+        anterior = await db.run_sync(_leer_anterior, cap.id_capitulo)
+        if anterior is None:
+            return False
+
+        resultado = None
+        if anterior.texto == texto:
+            # Capítulos antiguos sin hash_contenido: sólo faltaba calcularlo
+            revision_stats["sin_cambios"] += 1
+        elif anterior.traduccion:
+            resultado = await _retraducir(db, cap, anterior, texto)
+            if resultado is None:
+                logger.warning(f"⚠️ No se pudo retraducir el capítulo {cap.id_capitulo}: queda pendiente de traducción")
+
+        if not await db.run_sync(_guardar_revision, cap.id_capitulo, texto, anterior, resultado):
+            logger.warning(f"⚠️ El capítulo {cap.id_capitulo} ya no es de este worker; se descarta la revisión")
+            return False
+
+    if anterior.texto == texto:
+        return True
+    revision_stats["cambiados"] += 1
+    avisar_cambios(novelas=[cap.id_novela], capitulos=[cap.id_capitulo])
+    if resultado is not None:
+        CAPITULOS_TRADUCIDOS.labels("revision").inc()
+        GEMINI_COSTO.inc(costo_estimado(resultado))
+        logger.info(f"📝 Capítulo {cap.numero_capitulo} cambiado en la fuente: traducción v{anterior.version + 1} guardada")
+    else:
+        logger.info(f"📝 Capítulo {cap.numero_capitulo} cambiado en la fuente: texto actualizado")
+    return True
+
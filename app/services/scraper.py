@@ -1,104 +1,317 @@
 import asyncio
+import hashlib
 import logging
-import json
+from collections import Counter
 from datetime import datetime
-from playwright.async_api import async_playwright
+from typing import Optional
+from sqlalchemy import update, bindparam, select, or_, Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 # Importamos tus modelos exactos de novelasia
-from app.db.models import Novela, Capitulo, FuenteScraping
+from app.db.models import Novela, Capitulo, FuenteScraping, ORDEN_PENDIENTES
+from app.db.compresion import columnas_texto
+from app.core.config import settings
+from app.core.metricas import NAVEGACION, EXTRACCION, CAPITULOS_SCRAPEADOS
+from app.services.browser_pool import browser_pool
+from app.services.http_client import get_http_client
+from app.services.fuentes import fuentes_cacheadas, fuente_para_url, leer_configuracion
+from app.services.rate_limit import limitador_para
+from app.services.avisos_api import avisar_cambios
+from app.services.leases import WORKER_ID, latido, reclamar_por_estado, liberar, sigue_siendo_mio
+from app.services.extraction_rules import reglas_para, extraer_en_pagina, extraer_contenido_lxml
+from app.services.page_loader import perfil_de_carga, bloquear_recursos, cargar
+from app.services.fallos import circuito_para, retraso_reintento, aplazamiento, guardar_estado_fuentes
 
 logger = logging.getLogger(__name__)
 
-async def scrape_chapter_content(url: str, selector_css: str = None):
+MIN_CARACTERES_CONTENIDO = 50
+MODOS_FETCH = ("auto", "http", "navegador")
+
+# Contadores del proceso: cuántas veces basta con HTTP y cuántas hay que abrir Chromium
+fetch_stats = Counter()
+
+# (texto, motivo del fallo): uno de los dos es None
+Lectura = tuple[Optional[str], Optional[str]]
+
+_TEXTO_CORTO = "Texto vacío o demasiado corto"
+
+
+def _es_texto_valido(texto: Optional[str]) -> bool:
+    return bool(texto) and len(texto.strip()) > MIN_CARACTERES_CONTENIDO
+
+
+def _motivo(e: Exception) -> str:
+    return (f"{type(e).__name__}: {e}".splitlines() or [""])[0][:255]
+
+
+async def _scrape_http(url: str, reglas_contenido: dict) -> Lectura:
+    try:
+        with NAVEGACION.labels("capitulo", "http").time():
+            respuesta = await get_http_client().get(url)
+        if respuesta.status_code >= 400:
+            logger.debug(f"HTTP {respuesta.status_code} en {url}")
+            return None, f"HTTP {respuesta.status_code}"
+        with EXTRACCION.labels("capitulo", "lxml").time():
+            texto = extraer_contenido_lxml(respuesta.text, reglas_contenido)
+        return (texto.strip(), None) if _es_texto_valido(texto) else (None, _TEXTO_CORTO)
+    except Exception as e:
+        logger.debug(f"Fallo en la vía HTTP para {url}: {e}")
+        return None, _motivo(e)
+
+
+async def scrape_chapter_content(url: str, selector_css: str = None, modo: str = "auto", reglas: dict = None):
     """
-    Usa el Chromium de Playwright para extraer el texto.
+    Extrae el texto de un capítulo. Primero intenta HTTP + lxml y sólo abre
+    Chromium si el resultado está vacío o es demasiado corto.
+
+    `modo` viene de `configuracion_scraper.modo_fetch`: "auto", "http" o "navegador".
+    `reglas` son las reglas de extracción de la fuente (ver extraction_rules).
     """
-    async with async_playwright() as p:
-        # ---------------------------------------------------------
-        # CONFIGURACIÓN ESTÁNDAR (CHROMIUM)
-        # ---------------------------------------------------------
-        # headless=False significa que VERÁS el navegador abrirse.
-        # Cambialo a True cuando ya confíes en el script.
-        browser = await p.chromium.launch(headless=False)
-        
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
-        page = await context.new_page()
-        
-        try:
-            # Optimización: Bloquear imágenes, fuentes y CSS para ir rápido
-            await page.route("**/*.{png,jpg,jpeg,gif,webp,svg,woff,woff2,ttf,css}", lambda route: route.abort())
+    texto, _ = await leer_capitulo(url, selector_css, modo, reglas)
+    return texto
+
+
+async def leer_capitulo(url: str, selector_css: str = None, modo: str = "auto", reglas: dict = None) -> Lectura:
+    """Como scrape_chapter_content, pero devuelve también el motivo del fallo."""
+    if modo not in MODOS_FETCH:
+        modo = "auto"
+    reglas = reglas or reglas_para(url)
+    reglas_contenido = dict(reglas["contenido"])
+    if selector_css and selector_css not in reglas_contenido["selectores"]:
+        reglas_contenido["selectores"] = [selector_css] + reglas_contenido["selectores"]
+
+    if modo != "navegador":
+        texto, error = await _scrape_http(url, reglas_contenido)
+        if texto:
+            fetch_stats["http_ok"] += 1
+            logger.info(f"⚡ Texto extraído por HTTP: {url}")
+            return texto, None
+        if modo == "http":
+            fetch_stats["http_fallido"] += 1
+            logger.error(f"❌ No se pudo extraer texto por HTTP (modo forzado): {url}")
+            return None, error
+        fetch_stats["fallback_navegador"] += 1
+    else:
+        fetch_stats["navegador_forzado"] += 1
+
+    perfil = perfil_de_carga({**reglas, "contenido": reglas_contenido}, "capitulo")
+    return await _scrape_navegador(url, reglas_contenido, perfil)
+
+
+def resumen_fetch() -> str:
+    total = sum(fetch_stats.values())
+    if not total:
+        return "sin peticiones"
+    fallback = fetch_stats["fallback_navegador"]
+    return (
+        f"HTTP ok: {fetch_stats['http_ok']}, fallback a navegador: {fallback} "
+        f"({fallback * 100 / total:.1f}%), navegador forzado: {fetch_stats['navegador_forzado']}, "
+        f"HTTP forzado fallido: {fetch_stats['http_fallido']}"
+    )
+
+async def _scrape_navegador(url: str, reglas_contenido: dict, perfil: dict) -> Lectura:
+    """
+    Usa una página del pool de Chromium compartido para extraer el texto.
+    """
+    # El lease va dentro del try: si Chromium no arranca (o hay que reiniciarlo) es un
+    # fallo de lectura más, que se cuenta en el circuito y devuelve el capítulo a la cola
+    try:
+        async with browser_pool.lease() as page:
+            # Sin imágenes, fuentes, CSS ni anuncios (según el perfil de carga de la fuente)
+            await bloquear_recursos(page, perfil)
 
             logger.info(f"🌐 Navegando a: {url}")
-            try:
-                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
-            except Exception as e:
-                logger.warning(f"⚠️ Tiempo de espera agotado, intentando recuperar texto de todos modos... {e}")
-
-            await asyncio.sleep(4) # Espera técnica para cargas dinámicas (JS)
-
-            texto_final = ""
-
-            # PASO 1: Eliminar anuncios antes de extraer (evita texto en inglés)
-            await page.evaluate("""() => {
-                // Eliminar todos los elementos publicitarios
-                const ads = document.querySelectorAll('.txtad, .exo-native-widget, [class*="adv"], [id*="adv"]');
-                ads.forEach(ad => ad.remove());
-            }""")
-            logger.info("🧹 Anuncios eliminados del DOM")
-
-            # PASO 2: Extraer texto limpio del contenido
-            # Estrategia A: Por ID específico (#txtcontent0)
-            try:
-                content_element = await page.query_selector("#txtcontent0")
-                if content_element:
-                    texto_final = await content_element.inner_text()
-                    logger.info("✅ Texto extraído usando ID #txtcontent0")
-            except:
-                pass
-
-            # Estrategia B: Por estructura DOM (fallback)
-            if not texto_final:
-                texto_final = await page.evaluate("""() => {
-                    const nav = document.querySelector('.txtnav');
-                    if (nav) {
-                        const contentDiv = nav.querySelector('div[id^="txtcontent"]');
-                        if (contentDiv) return contentDiv.innerText;
-                        
-                        const children = Array.from(nav.children);
-                        if (children.length >= 4) {
-                            return children[3].innerText;
-                        }
-                    }
-                    return "";
-                }""")
-                if texto_final:
-                    logger.info("✅ Texto extraído usando estructura DOM (.txtnav hijo #4)")
+            with NAVEGACION.labels("capitulo", "navegador").time():
+                # Se espera a que el contenido tenga texto; si se agota el plazo se intenta igual
+                cargada = await cargar(page, url, perfil)
+
+            # Quitar anuncios y extraer el texto en una sola llamada al navegador
+            with EXTRACCION.labels("capitulo", "navegador").time():
+                datos = await extraer_en_pagina(page, {"contenido": reglas_contenido}, ("contenido",))
+            texto_final = datos["contenido"]["texto"]
+            if texto_final:
+                logger.info(f"✅ Texto extraído usando {datos['contenido']['estrategia']}")
 
             # Validación final
-            if texto_final and len(texto_final.strip()) > 50:
-                return texto_final.strip()
+            if _es_texto_valido(texto_final):
+                return texto_final.strip(), None
             else:
                 logger.error("❌ No se pudo extraer texto válido (vacío o muy corto).")
-                return None
+                return None, _TEXTO_CORTO if cargada else f"Plazo agotado ({perfil['plazo_seg']} s)"
+    except Exception as e:
+        logger.error(f"❌ Error en scraping: {e}")
+        return None, _motivo(e)
 
-        except Exception as e:
-            logger.error(f"❌ Error en scraping: {e}")
-            return None
-        finally:
-            await browser.close()
+_t = Capitulo.__table__
 
-async def process_pending_scrapes(db: Session):
+# UPDATE por clave primaria para executemany; sólo pisa filas cuyo lease sigue siendo nuestro
+_ACTUALIZAR_SCRAPEADO = update(_t).where(
+    _t.c.id_capitulo == bindparam("b_id"),
+    _t.c.lease_owner == WORKER_ID
+).values(
+    contenido_original=bindparam("b_contenido"),
+    contenido_comprimido=bindparam("b_comprimido"),
+    hash_contenido=bindparam("b_hash"),
+    scrapeado_en=bindparam("b_fecha"),
+    # Recién leído cuenta como revisado (la revisión filtra y ordena por revisado_en)
+    revisado_en=bindparam("b_fecha"),
+    intentos_scraping=bindparam("b_intentos"),
+    ultimo_error_scraping=None,
+    reintentar_despues=None,
+    estado_pipeline='scrapeado',
+    lease_owner=None,
+    lease_expira=None
+)
+
+# Lectura fallida: se cuenta el intento y el capítulo vuelve a la cola tras la espera
+# (o queda como fallido). También aparta, sin contar intento, los de fuentes bloqueadas.
+_ACTUALIZAR_FALLIDO = update(_t).where(
+    _t.c.id_capitulo == bindparam("b_id"),
+    _t.c.lease_owner == WORKER_ID
+).values(
+    intentos_scraping=bindparam("b_intentos"),
+    estado_pipeline=bindparam("b_estado"),
+    ultimo_error_scraping=bindparam("b_error"),
+    reintentar_despues=bindparam("b_reintentar"),
+    lease_owner=None,
+    lease_expira=None
+)
+
+
+# Columnas que necesita el scraper: nunca se cargan los Text del capítulo
+_COLUMNAS_PENDIENTE = (
+    Capitulo.id_capitulo, Capitulo.id_novela, Capitulo.fuente_url,
+    Capitulo.numero_capitulo, Capitulo.intentos_scraping, Capitulo.estado_pipeline
+)
+
+
+class BufferEscritura:
     """
-    Busca capítulos sin contenido en la DB y los procesa.
+    Acumula los capítulos scrapeados y los escribe con un único UPDATE executemany
+    cada DB_BATCH_SIZE filas, en vez de un commit por capítulo.
     """
-    # 1. Buscar capítulos pendientes (contenido_original IS NULL)
-    pendientes = db.query(Capitulo).filter(
-        Capitulo.contenido_original == None,
-        Capitulo.fuente_url != None
-    ).limit(10).all()
+
+    def __init__(self, db: AsyncSession, tamano: int = None):
+        self.db = db
+        self.tamano = max(1, tamano or settings.DB_BATCH_SIZE)
+        self._filas: list[dict] = []
+        self._fallidos: list[dict] = []
+        # La AsyncSession no admite operaciones concurrentes: un volcado cada vez
+        self._lock = asyncio.Lock()
+
+    async def agregar(self, id_capitulo: int, id_novela: int, contenido: str, intentos: int):
+        self._filas.append({
+            "b_id": id_capitulo,
+            "id_novela": id_novela,
+            "contenido": contenido,
+            "b_hash": hashlib.sha256(contenido.encode("utf-8")).hexdigest(),
+            "b_fecha": datetime.utcnow(),
+            "b_intentos": intentos + 1
+        })
+        if len(self._filas) >= self.tamano:
+            await self.volcar()
+
+    async def fallar(self, id_capitulo: int, intentos: int, error: Optional[str]):
+        intentos += 1
+        agotado = intentos >= settings.SCRAPE_MAX_INTENTOS
+        await self._apartar({
+            "b_id": id_capitulo,
+            "b_intentos": intentos,
+            "b_estado": 'fallido' if agotado else 'descubierto',
+            "b_error": error,
+            "b_reintentar": None if agotado else datetime.utcnow() + retraso_reintento(intentos)
+        })
+
+    async def aplazar(self, id_capitulo: int, intentos: int, hasta: datetime, motivo: str):
+        """Devuelve el capítulo a la cola sin contar intento (su fuente está bloqueada)."""
+        await self._apartar({
+            "b_id": id_capitulo,
+            "b_intentos": intentos,
+            "b_estado": 'descubierto',
+            "b_error": motivo,
+            "b_reintentar": hasta
+        })
+
+    async def _apartar(self, fila: dict):
+        self._fallidos.append(fila)
+        if len(self._fallidos) >= self.tamano:
+            await self.volcar()
+
+    async def volcar(self):
+        async with self._lock:
+            if not self._filas and not self._fallidos:
+                return
+            filas, self._filas = self._filas, []
+            fallidos, self._fallidos = self._fallidos, []
+            novelas = {f["id_novela"] for f in filas}
+            await self.db.run_sync(_escribir_lote, filas, fallidos)
+        avisar_cambios(novelas=novelas, capitulos=[f["b_id"] for f in filas + fallidos])
+        latido.soltar(Capitulo, [f["b_id"] for f in filas + fallidos])
+        if filas:
+            logger.info(f"💾 Guardados en DB {len(filas)} capítulos")
+        descartados = sum(1 for f in fallidos if f["b_estado"] == 'fallido')
+        if descartados:
+            logger.warning(f"🚫 {descartados} capítulos marcados como fallidos tras {settings.SCRAPE_MAX_INTENTOS} intentos")
+
+
+def _escribir_lote(db: Session, filas: list[dict], fallidos: list[dict]):
+    for fila in filas:
+        fila["b_contenido"], fila["b_comprimido"] = columnas_texto(fila.pop("contenido"), db, fila.pop("id_novela"))
+    if filas:
+        db.execute(_ACTUALIZAR_SCRAPEADO, filas)
+    if fallidos:
+        db.execute(_ACTUALIZAR_FALLIDO, fallidos)
+    guardar_estado_fuentes(db)
+    db.commit()
+
+
+def _filtros_pendientes() -> list:
+    # reintentar_despues va al final de idx_capitulos_pipeline: se filtra sin leer la fila
+    return [or_(Capitulo.reintentar_despues == None, Capitulo.reintentar_despues <= datetime.utcnow())]
+
+
+def _reclamar_scrape(db: Session, filtros: list, limite: int, orden: list = None) -> list[int]:
+    # 'scrapeando' sin lease vigente = un worker lo soltó o murió a medias
+    return reclamar_por_estado(db, Capitulo, 'descubierto', 'scrapeando', filtros, limite,
+                               orden=orden, valores={Capitulo.estado_pipeline: 'scrapeando'})
+
+
+def reclamar_pendientes_scrape(db: Session, limite: int) -> list[int]:
+    """Reclama (lease) capítulos sin contenido para este worker."""
+    return _reclamar_scrape(db, _filtros_pendientes(), limite, orden=ORDEN_PENDIENTES)
+
+
+def _asegurar_lease(db: Session, id_capitulo: int) -> bool:
+    if sigue_siendo_mio(db, Capitulo, id_capitulo):
+        db.commit()
+        return True
+    return bool(_reclamar_scrape(db, [Capitulo.id_capitulo == id_capitulo] + _filtros_pendientes(), 1))
+
+
+async def scrape_capitulo(db: AsyncSession, id_capitulo: int, fuentes: list[FuenteScraping]) -> bool:
+    """
+    Scrapea un único capítulo por ID (lo usa el modo pipeline del worker).
+    """
+    if not await db.run_sync(_asegurar_lease, id_capitulo):
+        return False
+    cap = (await db.execute(select(*_COLUMNAS_PENDIENTE).where(Capitulo.id_capitulo == id_capitulo))).first()
+    if cap is None or cap.estado_pipeline != 'scrapeando':
+        return False
+    buffer = BufferEscritura(db, tamano=1)
+    return await _procesar_capitulo(cap, fuentes, buffer)
+
+
+async def process_pending_scrapes(db: AsyncSession):
+    """
+    Busca capítulos sin contenido en la DB y los procesa en paralelo,
+    respetando el límite de cada fuente.
+    """
+    # 1. Reclamar capítulos pendientes (estado 'descubierto') que no tenga otro worker
+    ids = await db.run_sync(reclamar_pendientes_scrape, settings.SCRAPE_BATCH_SIZE)
+    pendientes = (await db.execute(
+        select(*_COLUMNAS_PENDIENTE).where(Capitulo.id_capitulo.in_(ids))
+    )).all() if ids else []
 
     if not pendientes:
         logger.info("💤 No hay capítulos pendientes de scraping.")
@@ -106,44 +319,54 @@ async def process_pending_scrapes(db: Session):
 
     logger.info(f"🔄 Encontrados {len(pendientes)} capítulos para procesar.")
 
-    for cap in pendientes:
-        # 2. Intentar buscar configuración en la tabla fuentes_scraping
-        selector = None
-        
-        # Traemos todas las fuentes activas
-        fuentes = db.query(FuenteScraping).filter(FuenteScraping.estado == 'activa').all()
-        
-        for fuente in fuentes:
-            if fuente.url_base and fuente.url_base in cap.fuente_url:
-                if fuente.configuracion_scraper:
-                    config = fuente.configuracion_scraper
-                    # Manejo seguro del JSON
-                    if isinstance(config, dict):
-                        selector = config.get("selector_texto")
-                    elif isinstance(config, str):
-                        try:
-                            config_dict = json.loads(config)
-                            selector = config_dict.get("selector_texto")
-                        except:
-                            pass
-                break 
-
-        # 3. Ejecutar el scraping
-        logger.info(f"📖 Procesando Cap {cap.numero_capitulo}...")
-        contenido = await scrape_chapter_content(cap.fuente_url, selector)
-        
-        # 4. Guardar en la base de datos
-        if contenido:
-            cap.contenido_original = contenido
-            cap.scrapeado_en = datetime.utcnow()
-            
-            # Si tu modelo tiene columna 'intentos_scraping', la actualizamos
-            try:
-                cap.intentos_scraping = (cap.intentos_scraping or 0) + 1
-            except:
-                pass # Si la columna no existe en el modelo, no fallamos
-            
-            db.commit()
-            logger.info(f"💾 Guardado en DB: Capitulo {cap.numero_capitulo}")
-        else:
-            logger.warning(f"⚠️ Se salta el capítulo {cap.numero_capitulo} por fallo en lectura.")
\ No newline at end of file
+    # 2. Las fuentes activas se cargan como mucho una vez por ciclo
+    fuentes = await db.run_sync(fuentes_cacheadas)
+    buffer = BufferEscritura(db)
+
+    resultados = await asyncio.gather(
+        *(_procesar_capitulo(cap, fuentes, buffer) for cap in pendientes),
+        return_exceptions=True
+    )
+    for cap, resultado in zip(pendientes, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"❌ Error procesando capítulo {cap.id_capitulo}: {resultado}")
+
+    # Escribir lo que quede en el buffer y soltar los leases de los que fallaron
+    try:
+        await buffer.volcar()
+    except Exception as e:
+        logger.error(f"❌ Error guardando el lote de capítulos: {e}")
+    await db.rollback()
+    await db.run_sync(liberar, Capitulo, ids)
+    await db.commit()
+
+    logger.info(f"📊 Vías de extracción: {resumen_fetch()}")
+
+async def _procesar_capitulo(cap: Row, fuentes: list[FuenteScraping], buffer: BufferEscritura) -> bool:
+    id_capitulo, id_novela, url, numero = cap.id_capitulo, cap.id_novela, cap.fuente_url, cap.numero_capitulo
+    intentos = cap.intentos_scraping or 0
+    fuente = fuente_para_url(url, fuentes)
+    modo = leer_configuracion(fuente).get("modo_fetch", settings.SCRAPE_MODO_FETCH)
+    reglas = reglas_para(url, fuente)
+    nombre_fuente = fuente.nombre_fuente if fuente else "sin_fuente"
+
+    # 3. Ejecutar el scraping dentro del cupo de la fuente, salvo que esté bloqueada
+    circuito = circuito_para(fuente, url)
+    if not circuito.permite():
+        CAPITULOS_SCRAPEADOS.labels(nombre_fuente, "aplazado").inc()
+        await buffer.aplazar(id_capitulo, intentos, aplazamiento(circuito), f"Fuente bloqueada: {circuito.nombre}")
+        return False
+    async with limitador_para(fuente, url).slot():
+        logger.info(f"📖 Procesando Cap {numero}...")
+        contenido, error = await leer_capitulo(url, modo=modo, reglas=reglas)
+    circuito.registrar(contenido is not None)
+
+    # 4. Encolar la escritura (el UPDATE suelta también el lease)
+    CAPITULOS_SCRAPEADOS.labels(nombre_fuente, "ok" if contenido else "fallo").inc()
+    if contenido:
+        await buffer.agregar(id_capitulo, id_novela, contenido, intentos)
+        return True
+    else:
+        logger.warning(f"⚠️ Se salta el capítulo {numero} por fallo en lectura: {error}")
+        await buffer.fallar(id_capitulo, intentos, error)
+        return False
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from app.services.translation_engine import MotorTraduccion, ResultadoTraduccion, estimar_tokens
+
+logger = logging.getLogger(__name__)
+
+_MARCA = re.compile(r"^[ \t]*<<<[ \t]*(\d+)[ \t]*>>>[ \t]*$", re.MULTILINE)
+
+
+def marca_lote(numero: int) -> str:
+    """Línea que separa los textos de un lote (se pide a Gemini que la copie tal cual)."""
+    return f"<<<{numero}>>>"
+
+
+def _lineas(texto: str) -> int:
+    return sum(1 for linea in texto.split("\n") if linea.strip())
+
+
+def partir_respuesta(respuesta: str, cantidad: int) -> list[Optional[str]]:
+    """
+    Reparte la respuesta de un lote por sus marcas. Los textos cuya marca falta,
+    está repetida o fuera de orden quedan a None.
+    """
+    partes: list[Optional[str]] = [None] * cantidad
+    marcas = list(_MARCA.finditer(respuesta or ""))
+    for actual, siguiente in zip(marcas, marcas[1:] + [None]):
+        numero = int(actual.group(1))
+        if not 1 <= numero <= cantidad:
+            continue
+        fin = siguiente.start() if siguiente else len(respuesta)
+        if partes[numero - 1] is not None:
+            partes[numero - 1] = ""  # Marca repetida: no se sabe cuál es la buena
+            continue
+        partes[numero - 1] = respuesta[actual.end():fin].strip()
+
+    numeros = [int(m.group(1)) for m in marcas]
+    if numeros != sorted(numeros):
+        return [None] * cantidad
+    return [p or None for p in partes]
+
+
+class _Lote:
+    def __init__(self, contexto: Any):
+        self.contexto = contexto
+        self.textos: list[str] = []
+        self.futuros: list[asyncio.Future] = []
+        self.tokens = 0
+        self.temporizador: Optional[asyncio.TimerHandle] = None
+
+
+class EmpaquetadorLotes:
+    """
+    Junta en una sola petición a Gemini los textos cortos que se piden casi a la vez
+    con la misma clave (la novela), separados por marcas numeradas. Así los
+    capítulos de 1-2k caracteres no pagan cada uno la latencia y el prompt completos.
+
+    Cada parte de la respuesta se verifica (marca presente y mismo número de
+    párrafos que el original); las que no cuadran se traducen por separado con
+    `traducir_suelto`.
+    """
+
+    def __init__(
+        self,
+        motor: MotorTraduccion,
+        construir_prompt: Callable[[list[str], Any], str],
+        traducir_suelto: Callable[[str, Any], Awaitable[Optional[ResultadoTraduccion]]],
+        max_textos: int,
+        max_tokens: int,
+        espera_seg: float
+    ):
+        self.motor = motor
+        self.construir_prompt = construir_prompt
+        self.traducir_suelto = traducir_suelto
+        self.max_textos = max_textos
+        self.max_tokens = max_tokens
+        self.espera_seg = espera_seg
+        self._abiertos: dict[Hashable, _Lote] = {}
+        self._envios: set[asyncio.Task] = set()
+        self.stats = Counter()
+
+    def admite(self, texto: str) -> bool:
+        """Sólo se empaquetan los textos que dejan sitio para al menos otro igual."""
+        return self.max_textos > 1 and estimar_tokens(texto) <= self.max_tokens // 2
+
+    async def traducir(self, clave: Hashable, texto: str, contexto: Any) -> Optional[ResultadoTraduccion]:
+        tokens = estimar_tokens(texto)
+        lote = self._abiertos.get(clave)
+        if lote is not None and lote.tokens + tokens > self.max_tokens:
+            self._cerrar(clave, lote)
+            lote = None
+        if lote is None:
+            lote = _Lote(contexto)
+            self._abiertos[clave] = lote
+            lote.temporizador = asyncio.get_running_loop().call_later(self.espera_seg, self._cerrar, clave, lote)
+
+        futuro = asyncio.get_running_loop().create_future()
+        lote.textos.append(texto)
+        lote.futuros.append(futuro)
+        lote.tokens += tokens
+        if len(lote.textos) >= self.max_textos:
+            self._cerrar(clave, lote)
+        return await futuro
+
+    def _cerrar(self, clave: Hashable, lote: _Lote):
+        if self._abiertos.get(clave) is lote:
+            del self._abiertos[clave]
+        if lote.temporizador is None:
+            return  # Ya enviado
+        lote.temporizador.cancel()
+        lote.temporizador = None
+        envio = asyncio.create_task(self._enviar(lote))
+        self._envios.add(envio)
+        envio.add_done_callback(self._envios.discard)
+
+    async def _enviar(self, lote: _Lote):
+        try:
+            if len(lote.textos) == 1:
+                resultados = [await self.traducir_suelto(lote.textos[0], lote.contexto)]
+            else:
+                resultados = await self._enviar_lote(lote)
+            for futuro, resultado in zip(lote.futuros, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+        except Exception as e:
+            for futuro in lote.futuros:
+                if not futuro.done():
+                    futuro.set_exception(e)
+
+    async def _enviar_lote(self, lote: _Lote) -> list[Optional[ResultadoTraduccion]]:
+        textos = lote.textos
+        inicio = time.monotonic()
+        try:
+            respuesta = await self.motor.generar(self.construir_prompt(textos, lote.contexto))
+        except Exception as e:
+            logger.warning(f"📦 Falló el lote de {len(textos)} textos, se traducen por separado: {e}")
+            respuesta = None
+        segundos = time.monotonic() - inicio
+
+        partes = partir_respuesta(respuesta.text, len(textos)) if respuesta is not None else [None] * len(textos)
+        tokens_entrada, tokens_salida = self.motor.contabilizar([respuesta]) if respuesta is not None else (0, 0)
+        total = sum(len(t) for t in textos) or 1
+
+        resultados: list[Optional[ResultadoTraduccion]] = []
+        fallidos = []
+        for i, (texto, parte) in enumerate(zip(textos, partes)):
+            if parte is None or _lineas(parte) != _lineas(texto):
+                fallidos.append(i)
+                resultados.append(None)
+                continue
+            # Los tokens del lote se reparten en proporción al tamaño de cada texto
+            peso = len(texto) / total
+            resultados.append(ResultadoTraduccion(
+                texto=parte,
+                segundos=segundos,
+                palabras=len(parte.split()),
+                tokens_entrada=round(tokens_entrada * peso),
+                tokens_salida=round(tokens_salida * peso),
+                fragmentos=1
+            ))
+
+        self.stats["lotes"] += 1
+        self.stats["textos"] += len(textos)
+        self.stats["repartos_fallidos"] += len(fallidos)
+        if fallidos:
+            if respuesta is not None:
+                logger.warning(f"📦 {len(fallidos)}/{len(textos)} textos del lote no se pudieron separar: van por separado")
+            sueltos = await asyncio.gather(*(self.traducir_suelto(textos[i], lote.contexto) for i in fallidos))
+            for i, resultado in zip(fallidos, sueltos):
+                resultados[i] = resultado
+        return resultados
+
+    def resumen(self) -> str:
+        if not self.stats["lotes"]:
+            return "sin lotes"
+        return (
+            f"{self.stats['lotes']} lotes con {self.stats['textos']} textos "
+            f"(media {self.stats['textos'] / self.stats['lotes']:.1f}), "
+            f"{self.stats['repartos_fallidos']} traducidos aparte por fallo de reparto"
+        )
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from app.core.metricas import GEMINI_PETICIONES, GEMINI_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_FIN_FRASE = re.compile(r'(?<=[。！？!?….])')
+
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación rápida sin tokenizer: ~1 token por carácter CJK y ~4 caracteres
+    por token en el resto.
+    """
+    cjk = len(_CJK.findall(texto))
+    return cjk + (len(texto) - cjk) // 4 + 1
+
+
+def _partir_parrafo(parrafo: str, max_tokens: int) -> list[str]:
+    """Parte un párrafo demasiado largo por frases (o a la fuerza si no hay frases)."""
+    trozos, actual = [], ""
+    for frase in (f for f in _FIN_FRASE.split(parrafo) if f):
+        if actual and estimar_tokens(actual + frase) > max_tokens:
+            trozos.append(actual)
+            actual = ""
+        while estimar_tokens(frase) > max_tokens:
+            # Frase gigantesca sin puntuación: corte duro por caracteres
+            corte = max(1, len(frase) * max_tokens // estimar_tokens(frase))
+            trozos.append(frase[:corte])
+            frase = frase[corte:]
+        actual += frase
+    if actual:
+        trozos.append(actual)
+    return trozos
+
+
+def _dividir(texto: str, max_tokens: int) -> list[tuple[str, bool]]:
+    """(fragmento, sigue el párrafo del fragmento anterior) en orden."""
+    fragmentos, actual, tokens_actual = [], [], 0
+    for parrafo in texto.split("\n"):
+        tokens = estimar_tokens(parrafo)
+        if tokens > max_tokens:
+            if actual:
+                fragmentos.append(("\n".join(actual), False))
+                actual, tokens_actual = [], 0
+            trozos = [t for t in _partir_parrafo(parrafo, max_tokens) if t.strip()]
+            fragmentos.extend((trozo, i > 0) for i, trozo in enumerate(trozos))
+            continue
+        if actual and tokens_actual + tokens > max_tokens:
+            fragmentos.append(("\n".join(actual), False))
+            actual, tokens_actual = [], 0
+        actual.append(parrafo)
+        tokens_actual += tokens
+    if actual:
+        fragmentos.append(("\n".join(actual), False))
+    return [(f, sigue) for f, sigue in fragmentos if f.strip()]
+
+
+def dividir_en_fragmentos(texto: str, max_tokens: int) -> list[str]:
+    """
+    Divide un capítulo en fragmentos alineados a párrafos que no superan `max_tokens`.
+    """
+    return [f for f, _ in _dividir(texto, max_tokens)]
+
+
+def _una_linea(texto: str) -> str:
+    return " ".join(linea.strip() for linea in texto.split("\n") if linea.strip())
+
+
+def _reensamblar(fragmentos: list[tuple[str, bool]], traducciones: list[str]) -> str:
+    """
+    Une las traducciones en orden. Los trozos de un párrafo partido por frases
+    vuelven a ser una sola línea, así la traducción tiene tantos párrafos como el
+    original (la memoria de traducción cuenta con ello).
+    """
+    partes: list[str] = []
+    for i, ((_, sigue), traduccion) in enumerate(zip(fragmentos, traducciones)):
+        partido = sigue or (i + 1 < len(fragmentos) and fragmentos[i + 1][1])
+        if partido:
+            traduccion = _una_linea(traduccion)
+        if sigue and partes:
+            partes[-1] = f"{partes[-1]} {traduccion}"
+        else:
+            partes.append(traduccion)
+    return "\n".join(partes)
+
+
+class ConcurrenciaAdaptativa:
+    """
+    Semáforo AIMD: baja a la mitad con cada 429 y sube de uno en uno tras una
+    racha de respuestas correctas, sin pasar de `maximo`.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = max(1, maximo)
+        self.limite = self.maximo
+        self._en_curso = 0
+        self._exitos = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._en_curso < self.limite)
+            self._en_curso += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._en_curso -= 1
+            self._cond.notify_all()
+
+    def limitado(self):
+        nuevo = max(1, self.limite // 2)
+        if nuevo != self.limite:
+            logger.warning(f"🐢 Gemini devolvió 429: concurrencia {self.limite} → {nuevo}")
+        self.limite = nuevo
+        self._exitos = 0
+
+    def exito(self):
+        self._exitos += 1
+        if self.limite < self.maximo and self._exitos >= self.limite * 4:
+            self.limite += 1
+            self._exitos = 0
+
+
+@dataclass
+class ResultadoTraduccion:
+    texto: str
+    segundos: float
+    palabras: int
+    tokens_entrada: int = 0
+    tokens_salida: int = 0
+    fragmentos: int = 1
+
+
+class RespuestaIncompleta(Exception):
+    """Gemini respondió sin texto o cortó la respuesta (bloqueo de seguridad, MAX_TOKENS...)."""
+
+
+def motivo_incompleta(respuesta) -> Optional[str]:
+    """Por qué no sirve la respuesta de Gemini, o None si trae el texto completo."""
+    candidatos = getattr(respuesta, "candidates", None) or []
+    motivo = getattr(candidatos[0], "finish_reason", None) if candidatos else None
+    motivo = getattr(motivo, "name", motivo)
+    if motivo not in (None, "STOP", "FINISH_REASON_UNSPECIFIED"):
+        return f"finish_reason={motivo}"
+    if not (getattr(respuesta, "text", None) or "").strip():
+        bloqueo = getattr(getattr(respuesta, "prompt_feedback", None), "block_reason", None)
+        return "respuesta vacía" + (f" (block_reason={getattr(bloqueo, 'name', bloqueo)})" if bloqueo else "")
+    return None
+
+
+def _es_limite_de_ritmo(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def _es_reintentable(error: Exception) -> bool:
+    codigo = getattr(error, "code", None)
+    return (_es_limite_de_ritmo(error) or isinstance(error, RespuestaIncompleta)
+            or (isinstance(codigo, int) and codigo >= 500))
+
+
+class MotorTraduccion:
+    """
+    Traduce capítulos por fragmentos en paralelo a través del cliente async de Gemini.
+    El cliente se crea con `crear_cliente` en la primera petición.
+    """
+
+    def __init__(self, crear_cliente: Callable[[], Any], modelo: str, max_tokens: int, concurrencia: int, reintentos: int):
+        self._crear_cliente = crear_cliente
+        self._client = None
+        self.modelo = modelo
+        self.max_tokens = max_tokens
+        self.concurrencia = ConcurrenciaAdaptativa(concurrencia)
+        self.reintentos = reintentos
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._crear_cliente()
+        return self._client
+
+    async def generar(self, prompt: str):
+        """
+        Una petición a Gemini con reintentos ante 429/5xx y backoff exponencial.
+        Una respuesta vacía o cortada también se reintenta; si no se consigue una
+        completa se lanza RespuestaIncompleta (nunca se devuelve un texto a medias).
+        """
+        for intento in range(self.reintentos + 1):
+            async with self.concurrencia:
+                inicio = time.monotonic()
+                try:
+                    respuesta = await self.client.aio.models.generate_content(model=self.modelo, contents=prompt)
+                    motivo = motivo_incompleta(respuesta)
+                    if motivo:
+                        raise RespuestaIncompleta(motivo)
+                    GEMINI_PETICIONES.labels("ok").observe(time.monotonic() - inicio)
+                    self.concurrencia.exito()
+                    return respuesta
+                except Exception as e:
+                    limitado = _es_limite_de_ritmo(e)
+                    GEMINI_PETICIONES.labels("429" if limitado else "error").observe(time.monotonic() - inicio)
+                    if not _es_reintentable(e) or intento == self.reintentos:
+                        raise
+                    if limitado:
+                        self.concurrencia.limitado()
+                    espera = min(60, 2 ** intento) + random.uniform(0, 1)
+                    logger.warning(f"⏳ Reintento {intento + 1}/{self.reintentos} en {espera:.1f}s: {e}")
+            await asyncio.sleep(espera)
+
+    @staticmethod
+    def contabilizar(respuestas: list) -> tuple[int, int]:
+        """Tokens de entrada y salida de las respuestas (y su métrica)."""
+        tokens_entrada = tokens_salida = 0
+        for r in respuestas:
+            uso = getattr(r, "usage_metadata", None)
+            if uso is not None:
+                tokens_entrada += uso.prompt_token_count or 0
+                tokens_salida += uso.candidates_token_count or 0
+        GEMINI_TOKENS.labels("entrada").inc(tokens_entrada)
+        GEMINI_TOKENS.labels("salida").inc(tokens_salida)
+        return tokens_entrada, tokens_salida
+
+    async def traducir(self, texto: str, construir_prompt) -> ResultadoTraduccion:
+        """
+        `construir_prompt(fragmento)` devuelve el prompt de cada fragmento.
+        Los fragmentos se envían a la vez y se reensamblan en orden.
+        """
+        inicio = time.monotonic()
+        fragmentos = _dividir(texto, self.max_tokens)
+        respuestas = await asyncio.gather(*(self.generar(construir_prompt(f)) for f, _ in fragmentos))
+
+        # generar() sólo devuelve respuestas con texto: ningún fragmento se pierde en silencio
+        traducido = _reensamblar(fragmentos, [r.text.strip() for r in respuestas])
+        tokens_entrada, tokens_salida = self.contabilizar(respuestas)
+
+        return ResultadoTraduccion(
+            texto=traducido,
+            segundos=time.monotonic() - inicio,
+            palabras=len(traducido.split()),
+            tokens_entrada=tokens_entrada,
+            tokens_salida=tokens_salida,
+            fragmentos=len(fragmentos)
+        )
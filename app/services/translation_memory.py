@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import Capitulo, TraduccionCapitulo, MemoriaTraduccion
+from app.db.compresion import descomprimir
+from app.services.glossary import Glosario, formatear_para_prompt
+from app.services.translation_engine import ResultadoTraduccion, estimar_tokens
+
+logger = logging.getLogger(__name__)
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def normalizar_parrafo(parrafo: str) -> str:
+    """NFKC + espacios colapsados: el mismo párrafo de otro mirror da el mismo hash."""
+    return _ESPACIOS.sub(" ", unicodedata.normalize("NFKC", parrafo)).strip()
+
+
+def hash_parrafo(parrafo: str) -> str:
+    return hash_texto(normalizar_parrafo(parrafo))
+
+
+def hash_glosario(parrafo: str, glosario: Optional[Glosario]) -> str:
+    """
+    Huella de los términos del glosario que se imponen al traducir el párrafo ("" si
+    ninguno): la misma frase con otro glosario (otra novela, o el mismo editado) es
+    otra entrada de la memoria.
+    """
+    terminos = glosario.coincidencias(parrafo) if glosario else []
+    return hash_texto(formatear_para_prompt(terminos)) if terminos else ""
+
+
+# (hash_parrafo, hash_glosario)
+Clave = tuple[str, str]
+
+
+class MemoriaTraducciones:
+    """
+    Memoria de traducción por párrafo: LRU en proceso delante de la tabla
+    `memoria_traduccion`. Sólo los párrafos que no están en ninguna de las dos
+    se envían a Gemini.
+    """
+
+    def __init__(self, capacidad: int):
+        self.capacidad = max(1, capacidad)
+        self._lru: OrderedDict[Clave, str] = OrderedDict()
+        self.stats = Counter()
+
+    def _recordar(self, clave: Clave, traduccion: str):
+        self._lru[clave] = traduccion
+        self._lru.move_to_end(clave)
+        while len(self._lru) > self.capacidad:
+            self._lru.popitem(last=False)
+
+    def buscar(self, db: Session, claves: set[Clave]) -> dict[Clave, str]:
+        encontrados = {}
+        faltan = set()
+        for clave in claves:
+            if clave in self._lru:
+                self._lru.move_to_end(clave)
+                encontrados[clave] = self._lru[clave]
+            else:
+                faltan.add(clave)
+
+        if faltan:
+            # Por el prefijo de la clave primaria; el glosario se comprueba aquí
+            filas = db.query(
+                MemoriaTraduccion.hash_parrafo, MemoriaTraduccion.hash_glosario, MemoriaTraduccion.texto_traducido
+            ).filter(MemoriaTraduccion.hash_parrafo.in_({h for h, _ in faltan})).all()
+            for h, g, traduccion in filas:
+                if (h, g) in faltan:
+                    encontrados[(h, g)] = traduccion
+                    self._recordar((h, g), traduccion)
+        return encontrados
+
+    def guardar(self, db: Session, pares: dict[Clave, str]):
+        """Añade pares (hash, glosario)→traducción a la sesión (el commit lo hace quien llama)."""
+        if not pares:
+            return
+        prefijo = "IGNORE" if db.bind.dialect.name == "mysql" else "OR IGNORE"
+        db.execute(
+            insert(MemoriaTraduccion).prefix_with(prefijo),
+            [{"hash_parrafo": h, "hash_glosario": g, "texto_traducido": t} for (h, g), t in pares.items()]
+        )
+        for clave, t in pares.items():
+            self._recordar(clave, t)
+
+    def resumen(self) -> str:
+        total = self.stats["aciertos"] + self.stats["fallos"]
+        tasa = self.stats["aciertos"] * 100 / total if total else 0
+        return (
+            f"párrafos reutilizados {self.stats['aciertos']}/{total} ({tasa:.1f}%), "
+            f"capítulos idénticos {self.stats['capitulos_identicos']}, "
+            f"~{self.stats['tokens_ahorrados']} tokens ahorrados"
+        )
+
+
+memoria = MemoriaTraducciones(settings.TM_CACHE_MAX)
+
+
+def traduccion_de_capitulo_identico(db: Session, cap: Capitulo) -> Optional[str]:
+    """
+    Primer nivel: si otro capítulo con el mismo `hash_contenido` ya está traducido
+    (p. ej. el mismo capítulo desde otro mirror) se reutiliza entera.
+    """
+    if not cap.hash_contenido:
+        return None
+    fila = db.query(TraduccionCapitulo.contenido_traducido, TraduccionCapitulo.contenido_comprimido).join(
+        Capitulo, Capitulo.id_capitulo == TraduccionCapitulo.id_capitulo
+    ).filter(
+        Capitulo.hash_contenido == cap.hash_contenido,
+        Capitulo.id_capitulo != cap.id_capitulo,
+        TraduccionCapitulo.estado_traduccion == 'completado'
+    ).first()
+    if fila and (fila[0] or fila[1]):
+        memoria.stats["capitulos_identicos"] += 1
+        memoria.stats["tokens_ahorrados"] += estimar_tokens(cap.texto_original or "")
+        return descomprimir(fila[1], db) if fila[1] is not None else fila[0]
+    return None
+
+
+async def traducir_con_memoria(
+    db: AsyncSession,
+    texto: str,
+    traducir: Callable[[str], Awaitable[Optional[ResultadoTraduccion]]],
+    glosario: Optional[Glosario] = None
+) -> Optional[ResultadoTraduccion]:
+    """
+    Traduce `texto` reutilizando los párrafos ya conocidos. `traducir` se llama sólo
+    con los párrafos que faltan (uno por línea, sin repetir). `glosario` es el que
+    usa `traducir`: forma parte de la clave de cada párrafo.
+    """
+    parrafos = texto.split("\n")
+    hashes = {i: (hash_parrafo(p), hash_glosario(p, glosario)) for i, p in enumerate(parrafos) if p.strip()}
+    conocidos = await db.run_sync(memoria.buscar, set(hashes.values()))
+    # La consulta abre una transacción: no se deja abierta (ni la conexión fuera del
+    # pool) mientras se espera a Gemini
+    await db.commit()
+
+    faltan = list(dict.fromkeys(h for h in hashes.values() if h not in conocidos))
+    texto_de = {h: parrafos[i] for i, h in hashes.items()}
+    aciertos = [i for i, h in hashes.items() if h in conocidos]
+    memoria.stats["aciertos"] += len(aciertos)
+    memoria.stats["fallos"] += len(hashes) - len(aciertos)
+
+    resultado = None
+    if faltan:
+        resultado = await traducir("\n".join(texto_de[h] for h in faltan))
+        if resultado is None:
+            return None
+        lineas = [linea.strip() for linea in resultado.texto.split("\n") if linea.strip()]
+        if len(lineas) != len(faltan):
+            # Gemini no respetó los párrafos: no se puede repartir por párrafo
+            logger.debug(f"Memoria de traducción: {len(lineas)} líneas para {len(faltan)} párrafos")
+            # Si se omitió algo (aciertos o párrafos repetidos) hay que traducir el texto entero
+            return resultado if len(faltan) == len(hashes) else await traducir(texto)
+        nuevos = dict(zip(faltan, lineas))
+        # Se guarda aunque luego no se guarde la traducción: Gemini ya está pagado
+        await db.run_sync(memoria.guardar, nuevos)
+        await db.commit()
+        conocidos.update(nuevos)
+
+    memoria.stats["tokens_ahorrados"] += sum(estimar_tokens(parrafos[i]) for i in aciertos)
+    ensamblado = "\n".join(conocidos[hashes[i]] if i in hashes else "" for i in range(len(parrafos)))
+    return ResultadoTraduccion(
+        texto=ensamblado,
+        segundos=resultado.segundos if resultado else 0.0,
+        palabras=len(ensamblado.split()),
+        tokens_entrada=resultado.tokens_entrada if resultado else 0,
+        tokens_salida=resultado.tokens_salida if resultado else 0,
+        fragmentos=resultado.fragmentos if resultado else 0
+    )
@@ -1,75 +1,323 @@
-from google import genai
+import asyncio
+import logging
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.models import Capitulo, TraduccionCapitulo
+from app.db.database import AsyncSessionLocal
+from app.db.models import Capitulo, TraduccionCapitulo, TraduccionNovela, Novela, ORDEN_PENDIENTES
 from app.core.config import settings
-import logging
+from app.core.metricas import CAPITULOS_TRADUCIDOS, GEMINI_COSTO
+from app.services.avisos_api import avisar_cambios
+from app.services.fallos import retraso_reintento
+from app.services.leases import WORKER_ID, reclamar_por_estado, liberar, sigue_siendo_mio
+from app.services.translation_engine import MotorTraduccion, ResultadoTraduccion
+from app.services.translation_batch import EmpaquetadorLotes, marca_lote
+from app.services.glossary import Glosario, glosario_para, formatear_para_prompt
+from app.services.translation_memory import memoria, hash_texto, traduccion_de_capitulo_identico, traducir_con_memoria
 
 logger = logging.getLogger(__name__)
 
-# Configuración con el nuevo SDK de Google GenAI
-# Asegúrate de que en tu .env la variable sea GEMINI_API_KEY
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+def _crear_cliente():
+    # Configuración con el nuevo SDK de Google GenAI (se importa al traducir por primera vez:
+    # cargarlo cuesta más que el resto del worker)
+    # Asegúrate de que en tu .env la variable sea GEMINI_API_KEY
+    from google import genai
+    return genai.Client(
+        api_key=settings.GEMINI_API_KEY,
+        http_options={"base_url": settings.GEMINI_BASE_URL} if settings.GEMINI_BASE_URL else None
+    )
+
+motor = MotorTraduccion(
+    _crear_cliente,
+    modelo=settings.GEMINI_MODELO,
+    max_tokens=settings.MAX_TOKENS_PER_CHUNK,
+    concurrencia=settings.GEMINI_CONCURRENCIA_MAX,
+    reintentos=settings.GEMINI_REINTENTOS
+)
+
+def _bloque_glosario(text: str, glosario: Optional[Glosario]) -> str:
+    # Sólo se inyectan los términos del glosario que aparecen en este fragmento
+    terminos = glosario.coincidencias(text) if glosario else []
+    return (
+        f"Usa obligatoriamente estas traducciones de nombres y términos:\n{formatear_para_prompt(terminos)}\n\n"
+        if terminos else ""
+    )
+
+def _construir_prompt(text: str, context_title: str, glosario: Optional[Glosario] = None) -> str:
+    return (
+        f"Actúa como un traductor experto en novelas ligeras de China. "
+        f"Traduce el siguiente texto al español, manteniendo el tono épico y la terminología de cultivo. "
+        f"Responde sólo con la traducción, conservando los saltos de párrafo. "
+        f"Novela: {context_title}\n\n"
+        f"{_bloque_glosario(text, glosario)}"
+        f"Texto a traducir:\n{text}"
+    )
+
+def _construir_prompt_lote(textos: list[str], contexto: tuple) -> str:
+    context_title, glosario = contexto
+    bloques = "\n".join(f"{marca_lote(i)}\n{texto}" for i, texto in enumerate(textos, 1))
+    bloque_glosario = _bloque_glosario("\n".join(textos), glosario)
+    return (
+        f"Actúa como un traductor experto en novelas ligeras de China. "
+        f"Traduce al español los {len(textos)} textos siguientes, manteniendo el tono épico y la terminología de cultivo. "
+        f"Cada texto empieza con una línea separadora como {marca_lote(1)}: cópiala tal cual antes de su traducción "
+        f"y no mezcles contenido de un texto en otro. "
+        f"Responde sólo con las traducciones, conservando los saltos de párrafo. "
+        f"Novela: {context_title}\n\n"
+        f"{bloque_glosario}"
+        f"Textos a traducir:\n{bloques}"
+    )
 
-async def translate_text_gemini(text: str, context_title: str):
+async def traducir_con_gemini(text: str, context_title: str, glosario: Optional[Glosario] = None) -> Optional[ResultadoTraduccion]:
     """
-    Envía el texto al modelo Gemini 2.0 para su traducción al español.
+    Envía el texto a Gemini para su traducción al español. Los capítulos largos se
+    dividen en fragmentos de hasta MAX_TOKENS_PER_CHUNK que se traducen en paralelo.
+    Devuelve también los tokens y el tiempo (ver costo_estimado).
     """
     try:
-        prompt = (
-            f"Actúa como un traductor experto en novelas ligeras de China. "
-            f"Traduce el siguiente texto al español, manteniendo el tono épico y la terminología de cultivo. "
-            f"Novela: {context_title}\n\n"
-            f"Texto a traducir:\n{text}"
-        )
-        
-        # Usamos gemini-2.0-flash para mayor velocidad y menor latencia
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt
-        )
-        
-        # El nuevo SDK usa .text directamente en la respuesta
-        return response.text
+        return await motor.traducir(text, lambda fragmento: _construir_prompt(fragmento, context_title, glosario))
     except Exception as e:
         logger.error(f"Error en la API de Gemini (SDK Nuevo): {e}")
         return None
 
-async def process_pending_translations(db: Session):
+async def translate_text_gemini(text: str, context_title: str, glosario: Optional[Glosario] = None) -> Optional[str]:
+    """
+    Envía el texto a Gemini para su traducción al español y devuelve sólo el texto
+    traducido (None si falla). Para tokens y coste, traducir_con_gemini.
+    """
+    resultado = await traducir_con_gemini(text, context_title, glosario)
+    return resultado.texto if resultado else None
+
+# Los capítulos cortos de una misma novela comparten petición a Gemini
+empaquetador = EmpaquetadorLotes(
+    motor,
+    construir_prompt=_construir_prompt_lote,
+    traducir_suelto=lambda texto, contexto: traducir_con_gemini(texto, *contexto),
+    max_textos=settings.TRADUCCION_LOTE_MAX_CAPITULOS,
+    max_tokens=settings.MAX_TOKENS_PER_CHUNK,
+    espera_seg=settings.TRADUCCION_LOTE_ESPERA_MS / 1000
+)
+
+async def traducir_texto(cap: "CapituloATraducir", texto: str) -> Optional[ResultadoTraduccion]:
+    contexto = (cap.titulo_novela, cap.glosario)
+    if empaquetador.admite(texto):
+        return await empaquetador.traducir(cap.id_novela, texto, contexto)
+    return await traducir_con_gemini(texto, *contexto)
+
+def _filtros_pendientes() -> list:
+    # Los que fallaron esperan a reintentar_despues (ver _registrar_fallo)
+    return [or_(Capitulo.reintentar_despues == None, Capitulo.reintentar_despues <= datetime.utcnow())]
+
+def _reclamar_traduccion(db: Session, filtros: list, limite: int, orden: list = None) -> list[int]:
+    # Capítulos ya scrapeados; 'traduciendo' sin lease vigente = traducción que quedó a medias
+    return reclamar_por_estado(db, Capitulo, 'scrapeado', 'traduciendo', filtros, limite,
+                               orden=orden, valores={Capitulo.estado_pipeline: 'traduciendo'})
+
+def reclamar_pendientes_traduccion(db: Session, limite: int) -> list[int]:
+    """Reclama (lease) capítulos sin traducir para este worker."""
+    return _reclamar_traduccion(db, _filtros_pendientes(), limite, orden=ORDEN_PENDIENTES)
+
+@dataclass
+class CapituloATraducir:
+    """Datos del capítulo leídos de una vez antes de llamar a Gemini."""
+    id_capitulo: int
+    id_novela: int
+    numero: int
+    titulo_novela: str
+    texto: str
+    identica: Optional[str]
+    glosario: Optional[Glosario]
+
+async def translate_capitulo(db: AsyncSession, id_capitulo: int) -> bool:
+    """
+    Traduce un único capítulo por ID (lo usa el modo pipeline del worker).
+    """
+    if not await db.run_sync(_asegurar_lease, id_capitulo):
+        return False
+    return await _traducir_capitulo(db, id_capitulo)
+
+def _asegurar_lease(db: Session, id_capitulo: int) -> bool:
+    if sigue_siendo_mio(db, Capitulo, id_capitulo):
+        db.commit()
+        return True
+    return bool(_reclamar_traduccion(db, [Capitulo.id_capitulo == id_capitulo] + _filtros_pendientes(), 1))
+
+async def process_pending_translations(db: AsyncSession):
     """
     Busca capítulos con contenido original pero sin traducción al español.
     """
-    # Buscamos capítulos que tengan contenido pero no tengan entrada en traducciones_capitulo
-    pendientes = db.query(Capitulo).outerjoin(
-        TraduccionCapitulo, Capitulo.id_capitulo == TraduccionCapitulo.id_capitulo
-    ).filter(
-        Capitulo.contenido_original != None,
-        TraduccionCapitulo.id_traduccion_capitulo == None
-    ).limit(3).all()
-
-    if not pendientes:
+    # Con lotes se reclaman suficientes capítulos para llenar uno
+    ids = await db.run_sync(reclamar_pendientes_traduccion, max(3, settings.TRADUCCION_LOTE_MAX_CAPITULOS))
+
+    if not ids:
         logger.info("No hay capítulos pendientes de traducción.")
         return
 
-    for cap in pendientes:
-        logger.info(f"Traduciendo con Gemini 2.0: Cap {cap.numero_capitulo} - ID: {cap.id_capitulo}")
-        
-        texto_traducido = await translate_text_gemini(cap.contenido_original, "Novela en Proceso")
-        
-        if texto_traducido:
-            try:
-                nueva_traduccion = TraduccionCapitulo(
-                    id_capitulo=cap.id_capitulo,
-                    idioma='es',
-                    contenido_traducido=texto_traducido,
-                    estado_traduccion='completado',
-                    traductor_ia='Gemini-2.0-Flash'
-                )
-                db.add(nueva_traduccion)
-                # Opcional: Marcar en la tabla capitulos que ya fue procesado
-                cap.enviado_traduccion = True
-                
-                db.commit()
-                logger.info(f"✅ Traducción guardada exitosamente para ID {cap.id_capitulo}")
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error guardando traducción en MySQL: {e}")
\ No newline at end of file
+    # Los capítulos van en paralelo; el motor limita las peticiones simultáneas a Gemini.
+    # Con return_exceptions un error no suelta los leases de los que siguen traduciendo
+    resultados = await asyncio.gather(
+        *(_traducir_en_sesion_propia(id_capitulo) for id_capitulo in ids),
+        return_exceptions=True
+    )
+    for id_capitulo, resultado in zip(ids, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"❌ Error traduciendo el capítulo {id_capitulo}: {resultado}")
+            await fallo_traduccion(db, id_capitulo)
+    logger.info(f"🧠 Memoria de traducción: {memoria.resumen()}")
+    logger.info(f"📦 Lotes de capítulos cortos: {empaquetador.resumen()}")
+
+async def _traducir_en_sesion_propia(id_capitulo: int) -> bool:
+    # Una AsyncSession no admite operaciones concurrentes: una por capítulo
+    async with AsyncSessionLocal() as db:
+        return await _traducir_capitulo(db, id_capitulo)
+
+_traducciones_novela: dict[int, int] = {}  # id_novela -> id_traduccion_novela_es
+
+def _id_traduccion_novela(db: Session, id_novela: int) -> int:
+    """
+    id de la fila de novelas_traduccion_espanol de la novela; si aún no tiene,
+    se crea (con el título original hasta que la plataforma ponga el traducido).
+    """
+    if id_novela in _traducciones_novela:
+        return _traducciones_novela[id_novela]
+    # Bloquear la novela evita que dos workers creen cada uno su traducción
+    titulo = db.query(Novela.titulo_original).filter(Novela.id_novela == id_novela).with_for_update().scalar()
+    id_traduccion = db.query(TraduccionNovela.id_traduccion_novela_es).filter(
+        TraduccionNovela.id_novela == id_novela
+    ).order_by(TraduccionNovela.id_traduccion_novela_es).limit(1).scalar()
+    if id_traduccion is not None:
+        _traducciones_novela[id_novela] = id_traduccion
+        return id_traduccion
+    # La nueva no se cachea hasta leerla de la DB: si falla el commit, se habrá deshecho
+    traduccion = TraduccionNovela(id_novela=id_novela, titulo_traducido=titulo)
+    db.add(traduccion)
+    db.flush()
+    logger.info(f"🆕 Creada la traducción al español de la novela {id_novela} ({traduccion.id_traduccion_novela_es})")
+    return traduccion.id_traduccion_novela_es
+
+def _preparar_traduccion(db: Session, id_capitulo: int) -> Optional[CapituloATraducir]:
+    cap = db.get(Capitulo, id_capitulo)
+    if cap is None or cap.estado_pipeline != 'traduciendo':
+        return None
+    titulo_novela = db.query(Novela.titulo_original).filter(Novela.id_novela == cap.id_novela).scalar()
+    # El texto (columnas diferidas) se carga aquí, sólo para este capítulo
+    texto_original = cap.texto_original
+
+    # Capítulos antiguos sin hash: lo calculamos para la memoria de traducción
+    if not cap.hash_contenido:
+        cap.hash_contenido = hash_texto(texto_original)
+
+    identica = traduccion_de_capitulo_identico(db, cap)
+    glosario = None if identica else glosario_para(db, cap.id_novela)
+    # No se deja la transacción abierta mientras se espera a Gemini
+    db.commit()
+    return CapituloATraducir(
+        id_capitulo=cap.id_capitulo,
+        id_novela=cap.id_novela,
+        numero=cap.numero_capitulo,
+        titulo_novela=titulo_novela or "Novela en Proceso",
+        texto=texto_original,
+        identica=identica,
+        glosario=glosario
+    )
+
+def costo_estimado(resultado: ResultadoTraduccion) -> float:
+    """Coste en USD según los tokens que devolvió Gemini (0 si se reutilizó la traducción)."""
+    return (
+        resultado.tokens_entrada * settings.GEMINI_PRECIO_ENTRADA_1M
+        + resultado.tokens_salida * settings.GEMINI_PRECIO_SALIDA_1M
+    ) / 1_000_000
+
+def _guardar_traduccion(db: Session, cap: CapituloATraducir, resultado: ResultadoTraduccion):
+    nueva_traduccion = TraduccionCapitulo(
+        id_capitulo=cap.id_capitulo,
+        id_traduccion_novela_es=_id_traduccion_novela(db, cap.id_novela),
+        estado_traduccion='completado',
+        traductor_ia=settings.GEMINI_MODELO,
+        palabras_traducidas=resultado.palabras,
+        tiempo_traduccion_segundos=round(resultado.segundos),
+        costo_traduccion=round(costo_estimado(resultado), 4),
+        hash_traduccion=hash_texto(resultado.texto)
+    )
+    nueva_traduccion.texto_traducido = resultado.texto
+    db.add(nueva_traduccion)
+    # Opcional: Marcar en la tabla capitulos que ya fue procesado (sin volver a cargar el capítulo)
+    db.query(Capitulo).filter(Capitulo.id_capitulo == cap.id_capitulo).update(
+        {Capitulo.enviado_traduccion: True, Capitulo.estado_pipeline: 'traducido'},
+        synchronize_session=False
+    )
+    liberar(db, Capitulo, [cap.id_capitulo])
+    db.commit()
+
+async def _traducir_capitulo(db: AsyncSession, id_capitulo: int) -> bool:
+    cap = await db.run_sync(_preparar_traduccion, id_capitulo)
+    if cap is None:
+        await db.run_sync(liberar, Capitulo, [id_capitulo])
+        await db.commit()
+        return False
+    logger.info(f"Traduciendo con {settings.GEMINI_MODELO}: Cap {cap.numero} - ID: {cap.id_capitulo}")
+
+    if cap.identica:
+        logger.info(f"♻️ Capítulo {cap.id_capitulo} idéntico a otro ya traducido: se reutiliza")
+        resultado = ResultadoTraduccion(texto=cap.identica, segundos=0.0, palabras=len(cap.identica.split()), fragmentos=0)
+    else:
+        resultado = await traducir_con_memoria(db, cap.texto, lambda texto: traducir_texto(cap, texto), cap.glosario)
+
+    # Si otro worker se quedó con el capítulo (lease caducado) no guardamos un duplicado
+    if resultado and not await db.run_sync(sigue_siendo_mio, Capitulo, cap.id_capitulo):
+        logger.warning(f"⚠️ El capítulo {cap.id_capitulo} ya no es de este worker; se descarta la traducción")
+        await db.rollback()
+        return False
+
+    if resultado and resultado.texto:
+        try:
+            await db.run_sync(_guardar_traduccion, cap, resultado)
+            avisar_cambios(novelas=[cap.id_novela], capitulos=[cap.id_capitulo])
+            CAPITULOS_TRADUCIDOS.labels("gemini" if resultado.fragmentos else "reutilizada").inc()
+            GEMINI_COSTO.inc(costo_estimado(resultado))
+            logger.info(
+                f"✅ Traducción guardada para ID {cap.id_capitulo} "
+                f"({resultado.fragmentos} fragmentos, {resultado.segundos:.1f}s)"
+            )
+            return True
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error guardando traducción en MySQL: {e}")
+    await fallo_traduccion(db, cap.id_capitulo)
+    return False
+
+def _registrar_fallo(db: Session, id_capitulo: int):
+    """
+    Devuelve el capítulo a 'scrapeado' con espera exponencial antes del siguiente
+    intento (cada uno vuelve a costar Gemini), o lo da por 'fallido' tras
+    TRADUCCION_MAX_INTENTOS. Sólo si el lease sigue siendo de este worker.
+    """
+    fila = db.query(Capitulo.intentos_traduccion).filter(
+        Capitulo.id_capitulo == id_capitulo, Capitulo.lease_owner == WORKER_ID
+    ).first()
+    if fila is None:
+        return
+    intentos = (fila[0] or 0) + 1
+    agotado = intentos >= settings.TRADUCCION_MAX_INTENTOS
+    db.query(Capitulo).filter(Capitulo.id_capitulo == id_capitulo).update({
+        Capitulo.intentos_traduccion: intentos,
+        Capitulo.estado_pipeline: 'fallido' if agotado else 'scrapeado',
+        Capitulo.reintentar_despues: None if agotado else datetime.utcnow() + retraso_reintento(
+            intentos, settings.TRADUCCION_REINTENTO_BASE_SEG, settings.TRADUCCION_REINTENTO_MAX_SEG
+        )
+    }, synchronize_session=False)
+    liberar(db, Capitulo, [id_capitulo])
+    db.commit()
+    if agotado:
+        logger.warning(f"🚫 Capítulo {id_capitulo} marcado como fallido tras {intentos} intentos de traducción")
+
+async def fallo_traduccion(db: AsyncSession, id_capitulo: int):
+    """Registra una traducción fallida y suelta el lease del capítulo."""
+    try:
+        await db.rollback()
+        await db.run_sync(_registrar_fallo, id_capitulo)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar el fallo del capítulo {id_capitulo}: {e}")
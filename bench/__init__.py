@@ -0,0 +1,6 @@
+"""
+Benchmark offline del agente: un sitio falso con la estructura de twkan.com,
+un Gemini falso y una base de datos de usar y tirar.
+
+Uso: python -m bench.run --help
+"""
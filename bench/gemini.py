@@ -0,0 +1,90 @@
+"""
+Gemini falso: responde a `models/{modelo}:generateContent` con el mismo formato
+que la API real, con latencia configurable y una fracción de respuestas 429.
+
+La "traducción" devuelve el texto del prompt (lo que va tras "Texto a traducir:")
+línea a línea con un prefijo, así que conserva los párrafos y las marcas de los
+lotes igual que el modelo.
+"""
+import asyncio
+import random
+import re
+from dataclasses import dataclass
+from fastapi import FastAPI, Body
+from fastapi.responses import JSONResponse
+
+MARCAS_TEXTO = ("Texto a traducir:\n", "Textos a traducir:\n")  # Capítulo suelto / lote
+_SEPARADOR_LOTE = re.compile(r"^<<<\d+>>>$")
+
+
+@dataclass
+class ConfigGemini:
+    latencia_ms: float = 300.0
+    tasa_429: float = 0.0  # Fracción de peticiones que responden RESOURCE_EXHAUSTED
+
+
+@dataclass
+class EstadisticasGemini:
+    peticiones: int = 0
+    limitadas: int = 0
+    tokens_entrada: int = 0
+    tokens_salida: int = 0
+
+
+def traduccion_falsa(prompt: str) -> str:
+    texto = prompt
+    for marca in MARCAS_TEXTO:
+        if marca in prompt:
+            texto = prompt.split(marca, 1)[1]
+            break
+    return "\n".join(
+        f"[es] {linea}" if linea.strip() and not _SEPARADOR_LOTE.match(linea.strip()) else linea
+        for linea in texto.split("\n")
+    )
+
+
+def _tokens(texto: str) -> int:
+    # Aproximación: ~1 token por carácter (el texto es casi todo CJK)
+    return max(1, len(texto))
+
+
+def crear_gemini(config: ConfigGemini, estadisticas: EstadisticasGemini) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+
+    @app.post("/{version}/models/{modelo}:generateContent")
+    async def generate_content(version: str, modelo: str, cuerpo: dict = Body(...)):
+        estadisticas.peticiones += 1
+        await asyncio.sleep(config.latencia_ms / 1000 * random.uniform(0.8, 1.2))
+
+        if random.random() < config.tasa_429:
+            estadisticas.limitadas += 1
+            return JSONResponse({"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED"
+            }}, status_code=429)
+
+        prompt = "".join(
+            parte.get("text", "")
+            for contenido in cuerpo.get("contents", [])
+            for parte in contenido.get("parts", [])
+        )
+        respuesta = traduccion_falsa(prompt)
+        entrada, salida = _tokens(prompt), _tokens(respuesta)
+        estadisticas.tokens_entrada += entrada
+        estadisticas.tokens_salida += salida
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": respuesta}]},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": entrada,
+                "candidatesTokenCount": salida,
+                "totalTokenCount": entrada + salida
+            },
+            "modelVersion": modelo
+        }
+
+    return app
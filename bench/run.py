@@ -0,0 +1,412 @@
+"""
+Mide discovery, scraping y traducción contra el sitio y el Gemini falsos.
+
+Por cada fase informa de capítulos/s, latencia p50/p95 por unidad de trabajo
+(novela en discovery, capítulo en scraping y traducción) y pico de RSS. Con
+`--json` se guarda el resultado para comparar antes y después de un cambio.
+
+Uso:
+    python -m bench.run --novelas 3 --capitulos 100 --latencia-gemini-ms 300 --tasa-429 0.05
+    python -m bench.run --db-url mysql+pymysql://root@127.0.0.1/novelagent_bench --json antes.json
+
+La base de datos se crea desde los modelos. Por defecto es un SQLite temporal;
+con `--db-url` se puede usar un MySQL vacío (las tablas se borran al terminar).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+import uvicorn
+from bench.sitio import ConfigSitio, EstadisticasSitio, crear_sitio, ids_novelas, titulo_novela
+from bench.gemini import ConfigGemini, EstadisticasGemini, crear_gemini
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("bench")
+
+
+# ---------------------------------------------------------
+# SERVIDORES LOCALES
+# ---------------------------------------------------------
+
+class _Servidor(uvicorn.Server):
+    """uvicorn dentro del event loop del benchmark, sin tocar las señales del proceso."""
+
+    def install_signal_handlers(self):
+        pass
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _arrancar(app, puerto: int) -> tuple[_Servidor, asyncio.Task]:
+    servidor = _Servidor(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning", access_log=False))
+    tarea = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        if tarea.done():
+            tarea.result()
+        await asyncio.sleep(0.05)
+    return servidor, tarea
+
+
+# ---------------------------------------------------------
+# MEDICIÓN
+# ---------------------------------------------------------
+
+def _percentil(valores: list[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+
+def _rss_maximo_proceso() -> Optional[int]:
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+class MedidorMemoria:
+    """
+    Pico de RSS durante una fase. Con psutil se muestrea el proceso y sus hijos
+    (los Chromium de Playwright); sin él, el máximo del propio proceso (ru_maxrss).
+    """
+
+    def __init__(self, intervalo: float = 0.1):
+        self.intervalo = intervalo
+        self.pico: Optional[int] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def _muestra(self) -> int:
+        proceso = psutil.Process()
+        total = proceso.memory_info().rss
+        for hijo in proceso.children(recursive=True):
+            try:
+                total += hijo.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    async def _muestrear(self):
+        while True:
+            self.pico = max(self.pico or 0, self._muestra())
+            await asyncio.sleep(self.intervalo)
+
+    async def __aenter__(self):
+        if psutil is not None:
+            self._tarea = asyncio.create_task(self._muestrear())
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self.pico = max(self.pico or 0, self._muestra())
+        else:
+            self.pico = _rss_maximo_proceso()
+
+
+def cronometrar(modulo, nombre: str, muestras: list[float]):
+    """Sustituye la corrutina `modulo.nombre` por una que anota su duración en `muestras`."""
+    original = getattr(modulo, nombre)
+
+    async def medida(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return await original(*args, **kwargs)
+        finally:
+            muestras.append(time.perf_counter() - inicio)
+
+    setattr(modulo, nombre, medida)
+
+
+@dataclass
+class ResultadoFase:
+    fase: str
+    unidad: str  # A qué corresponde cada muestra de latencia
+    capitulos: int
+    segundos: float
+    latencias: list[float] = field(default_factory=list)
+    rss_pico: Optional[int] = None
+
+    def resumen(self) -> dict:
+        return {
+            "fase": self.fase,
+            "unidad_latencia": self.unidad,
+            "capitulos": self.capitulos,
+            "segundos": round(self.segundos, 3),
+            "capitulos_por_segundo": round(self.capitulos / self.segundos, 3) if self.segundos else None,
+            "p50_ms": round(_percentil(self.latencias, 50) * 1000, 1) if self.latencias else None,
+            "p95_ms": round(_percentil(self.latencias, 95) * 1000, 1) if self.latencias else None,
+            "muestras": len(self.latencias),
+            "rss_pico_mb": round(self.rss_pico / 2**20, 1) if self.rss_pico else None,
+        }
+
+
+# ---------------------------------------------------------
+# ENTORNO Y DATOS
+# ---------------------------------------------------------
+
+def _preparar_entorno(args, url_db: str, url_gemini: str):
+    """
+    Configuración del agente para el benchmark. Tiene que hacerse antes de
+    importar `app`, porque `settings` se lee al importar.
+    """
+    os.environ.update({
+        "DB_URL": url_db,
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_BASE_URL": url_gemini,
+        "METRICAS_PUERTO_WORKER": "0",
+        "API_URL_INVALIDACION": "",
+        "FUENTES_CACHE_SEG": "3600",
+    })
+    for clave in ("DB_USER", "DB_PASSWORD", "DB_NAME"):
+        os.environ.setdefault(clave, "bench")
+    if args.modo_fetch:
+        os.environ["SCRAPE_MODO_FETCH"] = args.modo_fetch
+
+
+def _crear_datos(config: ConfigSitio, url_sitio: str, modo_fetch: Optional[str], concurrencia: int):
+    from app.db.database import engine, Base, SessionLocal
+    from app.db.models import Novela, FuenteScraping
+    from app.services.extraction_rules import REGLAS_INTEGRADAS
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.add(FuenteScraping(
+            nombre_fuente="bench",
+            url_base=url_sitio,
+            estado="activa",
+            intervalo_scraping_min=1,
+            limite_requests_hora=10_000_000,
+            # Las reglas de twkan, como se configuraría un sitio nuevo
+            configuracion_scraper={
+                "reglas": REGLAS_INTEGRADAS["twkan.com"],
+                "concurrencia_max": concurrencia,
+                **({"modo_fetch": modo_fetch} if modo_fetch else {}),
+            },
+        ))
+        for id_novela in ids_novelas(config):
+            db.add(Novela(
+                id_novela=id_novela,
+                titulo_original=titulo_novela(id_novela),
+                fuente_scraping=f"{url_sitio}/book/{id_novela}.html",
+            ))
+        db.commit()
+
+
+def _borrar_datos():
+    from app.db.database import engine, Base
+    Base.metadata.drop_all(engine)
+
+
+async def _contar(estados: tuple) -> int:
+    from sqlalchemy import select, func
+    from app.db.database import AsyncSessionLocal
+    from app.db.models import Capitulo
+
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(Capitulo).where(Capitulo.estado_pipeline.in_(estados)))
+
+
+# ---------------------------------------------------------
+# FASES
+# ---------------------------------------------------------
+
+async def _fase_discovery() -> ResultadoFase:
+    from app.db.database import AsyncSessionLocal
+    from app.services import discovery
+
+    latencias: list[float] = []
+    cronometrar(discovery, "_procesar_novela", latencias)
+    async with MedidorMemoria() as memoria:
+        inicio = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            nuevos = await discovery.discover_new_chapters(db)
+        segundos = time.perf_counter() - inicio
+    return ResultadoFase("discover_new_chapters", "novela", len(nuevos), segundos, latencias, memoria.pico)
+
+
+async def _repetir_hasta_vaciar(ciclo, pendientes: tuple, rondas_sin_avance: int = 3):
+    """Llama a `ciclo()` mientras queden capítulos en `pendientes` y el número baje."""
+    restantes, sin_avance = await _contar(pendientes), 0
+    while restantes and sin_avance < rondas_sin_avance:
+        await ciclo()
+        ahora = await _contar(pendientes)
+        sin_avance = sin_avance + 1 if ahora >= restantes else 0
+        restantes = ahora
+
+
+async def _fase_scraping() -> ResultadoFase:
+    from app.db.database import AsyncSessionLocal
+    from app.services import scraper
+
+    latencias: list[float] = []
+    cronometrar(scraper, "_procesar_capitulo", latencias)
+    antes = await _contar(("scrapeado",))
+
+    async def ciclo():
+        async with AsyncSessionLocal() as db:
+            await scraper.process_pending_scrapes(db)
+
+    async with MedidorMemoria() as memoria:
+        inicio = time.perf_counter()
+        await _repetir_hasta_vaciar(ciclo, ("descubierto", "scrapeando"))
+        segundos = time.perf_counter() - inicio
+    hechos = await _contar(("scrapeado",)) - antes
+    return ResultadoFase("process_pending_scrapes", "capitulo", hechos, segundos, latencias, memoria.pico)
+
+
+async def _fase_traduccion() -> ResultadoFase:
+    from app.db.database import AsyncSessionLocal
+    from app.services import translator
+
+    latencias: list[float] = []
+    cronometrar(translator, "_traducir_capitulo", latencias)
+    antes = await _contar(("traducido",))
+
+    async def ciclo():
+        async with AsyncSessionLocal() as db:
+            await translator.process_pending_translations(db)
+
+    async with MedidorMemoria() as memoria:
+        inicio = time.perf_counter()
+        await _repetir_hasta_vaciar(ciclo, ("scrapeado", "traduciendo"))
+        segundos = time.perf_counter() - inicio
+    hechos = await _contar(("traducido",)) - antes
+    return ResultadoFase("translator", "capitulo", hechos, segundos, latencias, memoria.pico)
+
+
+# ---------------------------------------------------------
+# INFORME
+# ---------------------------------------------------------
+
+def _imprimir(resumenes: list[dict], sitio: EstadisticasSitio, gemini: EstadisticasGemini):
+    def celda(valor):
+        return "-" if valor is None else str(valor)
+
+    columnas = ["fase", "capitulos", "segundos", "capitulos_por_segundo", "unidad_latencia", "p50_ms", "p95_ms", "rss_pico_mb"]
+    filas = [columnas] + [[celda(r[c]) for c in columnas] for r in resumenes]
+    anchos = [max(len(fila[i]) for fila in filas) for i in range(len(columnas))]
+    print()
+    for fila in filas:
+        print("  ".join(valor.ljust(ancho) for valor, ancho in zip(fila, anchos)))
+    print()
+    print(f"Sitio falso: {sum(sitio.peticiones.values())} peticiones {dict(sitio.peticiones)}")
+    print(f"Gemini falso: {gemini.peticiones} peticiones, {gemini.limitadas} respondidas con 429")
+    if psutil is None:
+        print("(sin psutil: el RSS es el máximo del proceso desde el arranque, sin contar Chromium)")
+
+
+async def _main(args) -> list[dict]:
+    config_sitio = ConfigSitio(
+        novelas=args.novelas,
+        capitulos=args.capitulos,
+        visibles=args.visibles,
+        latencia_ms=args.latencia_sitio_ms,
+        fraccion_js=args.fraccion_js,
+        grabaciones=Path(args.grabaciones) if args.grabaciones else None,
+    )
+    stats_sitio, stats_gemini = EstadisticasSitio(), EstadisticasGemini()
+    puerto_sitio, puerto_gemini = _puerto_libre(), _puerto_libre()
+    url_sitio = f"http://127.0.0.1:{puerto_sitio}"
+
+    temporal = None
+    url_db = args.db_url
+    if url_db is None:
+        temporal = tempfile.TemporaryDirectory(prefix="novelagent-bench-")
+        url_db = f"sqlite:///{Path(temporal.name) / 'bench.db'}"
+    _preparar_entorno(args, url_db, f"http://127.0.0.1:{puerto_gemini}/")
+
+    servidores = [
+        await _arrancar(crear_sitio(config_sitio, stats_sitio), puerto_sitio),
+        await _arrancar(crear_gemini(ConfigGemini(args.latencia_gemini_ms, args.tasa_429), stats_gemini), puerto_gemini),
+    ]
+
+    from app.db.database import engine, async_engine
+    from app.services.browser_pool import browser_pool
+    from app.services.http_client import close_http_client
+
+    _crear_datos(config_sitio, url_sitio, args.modo_fetch, args.concurrencia)
+    resultados = []
+    try:
+        # Chromium se lanza antes de medir, como hace el worker al arrancar
+        if "discover" in args.fases or args.modo_fetch != "http":
+            await browser_pool.start()
+        fases = {"discover": _fase_discovery, "scrape": _fase_scraping, "translate": _fase_traduccion}
+        for nombre in args.fases:
+            logger.info(f"⏱️ Fase {nombre}")
+            resultados.append((await fases[nombre]()).resumen())
+    finally:
+        await browser_pool.close()
+        await close_http_client()
+        for servidor, tarea in servidores:
+            servidor.should_exit = True
+            await tarea
+        if temporal is None:
+            _borrar_datos()
+        await async_engine.dispose()
+        engine.dispose()
+        if temporal is not None:
+            temporal.cleanup()
+
+    _imprimir(resultados, stats_sitio, stats_gemini)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de discovery, scraping y traducción")
+    parser.add_argument("--novelas", type=int, default=3)
+    parser.add_argument("--capitulos", type=int, default=100, help="capítulos por novela")
+    parser.add_argument("--visibles", type=int, default=30, help="capítulos en el índice antes de pulsar 「點擊展開」")
+    parser.add_argument("--latencia-sitio-ms", type=float, default=50.0)
+    parser.add_argument("--fraccion-js", type=float, default=0.0,
+                        help="fracción de capítulos cuyo texto sólo se ve con JS (obliga a usar el navegador)")
+    parser.add_argument("--grabaciones", help="directorio con páginas guardadas que sustituyen a las sintéticas")
+    parser.add_argument("--latencia-gemini-ms", type=float, default=300.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="fracción de peticiones a Gemini que devuelven 429")
+    parser.add_argument("--modo-fetch", choices=["auto", "http", "navegador"])
+    parser.add_argument("--concurrencia", type=int, default=4, help="concurrencia_max de la fuente falsa")
+    parser.add_argument("--db-url", help="base de datos vacía a usar (por defecto, un SQLite temporal)")
+    parser.add_argument("--fases", nargs="+", choices=["discover", "scrape", "translate"],
+                        default=["discover", "scrape", "translate"])
+    parser.add_argument("--json", help="fichero donde guardar los resultados")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    logger.setLevel(logging.INFO)
+
+    resultados = asyncio.run(_main(args))
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "parametros": vars(args),
+            "fases": resultados,
+        }, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Sitio falso con la estructura de twkan.com: portada, índice (con anuncios y el
+botón 「點擊展開」 que carga el resto de capítulos por JS) y páginas de capítulo.
+
+Los textos son sintéticos y deterministas: la misma novela y el mismo número de
+capítulo generan siempre el mismo texto. Con `grabaciones` se sirven tal cual
+las páginas guardadas en disco cuya ruta coincida con la pedida
+(p. ej. `grabaciones/book/1001.html`).
+"""
+import asyncio
+import json
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from html import escape
+from pathlib import Path
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, FileResponse
+
+# Primeros versos del Qianziwen: suficientes caracteres distintos para un texto creíble
+_CARACTERES = (
+    "天地玄黃宇宙洪荒日月盈昃辰宿列張寒來暑往秋收冬藏閏餘成歲律呂調陽雲騰致雨露結為霜"
+    "金生麗水玉出崑岡劍號巨闕珠稱夜光果珍李柰菜重芥薑海鹹河淡鱗潛羽翔龍師火帝鳥官人皇"
+    "始制文字乃服衣裳推位讓國有虞陶唐弔民伐罪周發殷湯坐朝問道垂拱平章愛育黎首臣伏戎羌"
+    "遐邇壹體率賓歸王鳴鳳在竹白駒食場化被草木賴及萬方蓋此身髮四大五常恭惟鞠養豈敢毀傷"
+)
+# Párrafo que se repite en todos los capítulos (como los avisos de los sitios reales)
+PARRAFO_COMUN = "天才一秒記住本站地址，最快更新最新章節。"
+
+_GIF_VACIO = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+)
+
+_ANUNCIO = '<div class="txtad">精品小說推薦，點擊免費閱讀全文</div>'
+_ANUNCIO_NATIVO = '<div class="exo-native-widget"><a href="/ads/1">熱門手遊，立即下載</a></div>'
+
+
+@dataclass
+class ConfigSitio:
+    novelas: int = 3
+    capitulos: int = 100  # Capítulos por novela
+    visibles: int = 30  # Capítulos en el HTML del índice; el resto llega al pulsar 「點擊展開」
+    latencia_ms: float = 50.0
+    fraccion_js: float = 0.0  # Capítulos cuyo texto sólo aparece tras ejecutar JS (fuerza el navegador)
+    grabaciones: Optional[Path] = None
+    primer_id: int = 1001
+
+
+@dataclass
+class EstadisticasSitio:
+    peticiones: Counter = field(default_factory=Counter)
+
+
+def ids_novelas(config: ConfigSitio) -> list[int]:
+    return list(range(config.primer_id, config.primer_id + config.novelas))
+
+
+def titulo_novela(id_novela: int) -> str:
+    return f"測試小說{id_novela}"
+
+
+def titulo_capitulo(numero: int) -> str:
+    return f"第{numero}章 {_CARACTERES[numero % 40:numero % 40 + 4]}"
+
+
+def texto_capitulo(id_novela: int, numero: int) -> str:
+    """Entre 30 y 60 párrafos de 20-80 caracteres, siempre iguales para (novela, capítulo)."""
+    aleatorio = random.Random(id_novela * 100_000 + numero)
+    parrafos = [titulo_capitulo(numero)]
+    for _ in range(aleatorio.randint(30, 60)):
+        frases = [
+            "".join(aleatorio.choices(_CARACTERES, k=aleatorio.randint(6, 20)))
+            for _ in range(aleatorio.randint(2, 4))
+        ]
+        parrafos.append("，".join(frases) + "。")
+    parrafos.append(PARRAFO_COMUN)
+    return "\n".join(parrafos)
+
+
+def _solo_js(config: ConfigSitio, id_novela: int, numero: int) -> bool:
+    return random.Random(id_novela * 7 + numero).random() < config.fraccion_js
+
+
+def _pagina(titulo: str, cuerpo: str) -> str:
+    return (
+        f'<!DOCTYPE html><html lang="zh-TW"><head><meta charset="utf-8"><title>{escape(titulo)}</title></head>'
+        f"<body>{cuerpo}</body></html>"
+    )
+
+
+def _portada(id_novela: int) -> str:
+    titulo = escape(titulo_novela(id_novela))
+    return _pagina(titulo_novela(id_novela), (
+        f'<div class="booknav2"><h1><a href="/book/{id_novela}.html">{titulo}</a></h1>'
+        f'<p>作者：<a href="/author/{id_novela}">作者{id_novela}</a></p>'
+        f'<p>分類：<a href="/sort/1">玄幻</a></p>'
+        f"<p>更新：2026-02-16</p></div>"
+        f'<img src="/files/article/image/{id_novela}/{id_novela}s.jpg" alt="{titulo}">'
+        f"{_ANUNCIO_NATIVO}"
+        f'<div class="navtxt"><p>{escape(texto_capitulo(id_novela, 0)[:200])}</p></div>'
+        f'<ul class="tabs"><li id="li_info">作品信息</li><li><a href="/book/{id_novela}/index.html">目錄</a></li></ul>'
+    ))
+
+
+def _enlace(id_novela: int, numero: int) -> str:
+    return f'<li><a href="/txt/{id_novela}/{numero}.html">{escape(titulo_capitulo(numero))}</a></li>'
+
+
+def _indice(config: ConfigSitio, id_novela: int) -> str:
+    visibles = min(config.visibles, config.capitulos)
+    enlaces = "".join(_enlace(id_novela, n) for n in range(1, visibles + 1))
+    boton = ""
+    if visibles < config.capitulos:
+        # Igual que en twkan: el resto de la lista se pide por XHR al pulsar el botón
+        boton = (
+            '<a id="loadmore" class="more-btn" href="javascript:void(0)">點擊展開</a>'
+            "<script>"
+            "document.getElementById('loadmore').addEventListener('click', async function () {"
+            f"  const r = await fetch('/book/{id_novela}/capitulos.json');"
+            "  const lista = document.getElementById('chapterList');"
+            "  for (const c of await r.json()) {"
+            "    const li = document.createElement('li'); const a = document.createElement('a');"
+            "    a.href = c.url; a.textContent = c.titulo; li.appendChild(a); lista.appendChild(li);"
+            "  }"
+            "  this.remove();"
+            "});"
+            "</script>"
+        )
+    return _pagina(f"{titulo_novela(id_novela)} 目錄", (
+        f'<div class="booknav2"><h1><a href="/book/{id_novela}.html">{escape(titulo_novela(id_novela))}</a></h1></div>'
+        f"{_ANUNCIO_NATIVO}{_ANUNCIO}"
+        f'<ul id="chapterList">{enlaces}</ul>'
+        f"{boton}"
+        f'<div class="advbox"><a href="/ads/2">廣告</a></div>'
+    ))
+
+
+def _capitulo(config: ConfigSitio, id_novela: int, numero: int) -> str:
+    texto = texto_capitulo(id_novela, numero)
+    if _solo_js(config, id_novela, numero):
+        contenido = ""
+        script = (
+            "<script>setTimeout(function () {"
+            f"document.getElementById('txtcontent0').innerText = {json.dumps(texto, ensure_ascii=False)};"
+            "}, 200);</script>"
+        )
+    else:
+        contenido = "<br><br>".join(escape(p) for p in texto.split("\n"))
+        script = ""
+    return _pagina(titulo_capitulo(numero), (
+        '<div class="txtnav">'
+        f"<h1>{escape(titulo_capitulo(numero))}</h1>"
+        f'<div class="txtinfo"><span>作者：作者{id_novela}</span></div>'
+        f"{_ANUNCIO}"
+        f'<div id="txtcontent0">{contenido}</div>'
+        f"{_ANUNCIO}"
+        "</div>"
+        f"{script}"
+    ))
+
+
+def crear_sitio(config: ConfigSitio, estadisticas: EstadisticasSitio) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    existentes = set(ids_novelas(config))
+
+    @app.middleware("http")
+    async def latencia_y_grabaciones(request: Request, call_next):
+        estadisticas.peticiones[request.url.path.split("/")[1] or "raiz"] += 1
+        if config.latencia_ms:
+            await asyncio.sleep(config.latencia_ms / 1000 * random.uniform(0.8, 1.2))
+        if config.grabaciones:
+            fichero = config.grabaciones / request.url.path.lstrip("/")
+            if fichero.is_file():
+                return FileResponse(fichero)
+        return await call_next(request)
+
+    def _no_existe() -> Response:
+        return HTMLResponse(_pagina("404", "<h1>404 Not Found</h1>"), status_code=404)
+
+    @app.get("/book/{id_novela}.html")
+    async def portada(id_novela: int):
+        return HTMLResponse(_portada(id_novela)) if id_novela in existentes else _no_existe()
+
+    @app.get("/book/{id_novela}/index.html")
+    async def indice(id_novela: int):
+        return HTMLResponse(_indice(config, id_novela)) if id_novela in existentes else _no_existe()
+
+    @app.get("/book/{id_novela}/capitulos.json")
+    async def resto_del_indice(id_novela: int):
+        if id_novela not in existentes:
+            return _no_existe()
+        return JSONResponse([
+            {"url": f"/txt/{id_novela}/{n}.html", "titulo": titulo_capitulo(n)}
+            for n in range(config.visibles + 1, config.capitulos + 1)
+        ])
+
+    @app.get("/txt/{id_novela}/{numero}.html")
+    async def capitulo(id_novela: int, numero: int):
+        if id_novela not in existentes or not 1 <= numero <= config.capitulos:
+            return _no_existe()
+        return HTMLResponse(_capitulo(config, id_novela, numero))
+
+    @app.get("/files/article/image/{id_novela}/{fichero}")
+    async def portada_imagen(id_novela: int, fichero: str):
+        return Response(_GIF_VACIO, media_type="image/gif")
+
+    return app
@@ -0,0 +1,9 @@
+"""
+Configuración común de los tests: una SQLite en memoria en lugar del MySQL de
+producción (como bench/), para que importar `app` no necesite un .env.
+"""
+import os
+
+os.environ.setdefault("DB_URL", "sqlite://")
+for clave in ("DB_USER", "DB_PASSWORD", "DB_NAME", "GEMINI_API_KEY"):
+    os.environ.setdefault(clave, "test")
@@ -0,0 +1,68 @@
+import random
+import pytest
+from app.core.config import settings
+from app.db import compresion
+from app.db.comprimir import comprimir_existentes
+from app.db.compresion import comprimir, descomprimir, id_diccionario_de
+from app.db.database import engine, SessionLocal
+from app.db.models import Capitulo, DiccionarioCompresion, Novela, TraduccionCapitulo, TraduccionNovela
+
+TABLAS = [Novela.__table__, Capitulo.__table__, DiccionarioCompresion.__table__, TraduccionNovela.__table__,
+          TraduccionCapitulo.__table__]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    for nombre in ("_diccionarios", "_diccionario_novela", "_sin_diccionario", "_compresores", "_descompresores"):
+        monkeypatch.setattr(compresion, nombre, type(getattr(compresion, nombre))())
+    monkeypatch.setattr(settings, "COMPRESION_ACTIVA", True)
+    monkeypatch.setattr(settings, "COMPRESION_MIN_MUESTRAS", 20)
+    monkeypatch.setattr(settings, "COMPRESION_TAMANO_DICCIONARIO", 4096)
+    for tabla in TABLAS:
+        tabla.create(engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+        for tabla in reversed(TABLAS):
+            tabla.drop(engine)
+
+
+def _capitulo(aleatorio: random.Random, i: int) -> str:
+    frases = ["林动握紧了拳头。", "岩城的夜色很深。", "青阳镇外，风声阵阵。", "他缓缓睁开双眼。", "天地元力涌入体内。"]
+    return f"第{i}章\n" + "\n".join(aleatorio.choice(frases) * aleatorio.randint(1, 4) for _ in range(60))
+
+
+def test_novela_nueva_comprimida_sin_diccionario_se_entrena_y_se_recomprime(db):
+    aleatorio = random.Random(3)
+    db.add(Novela(id_novela=1, titulo_original="武动乾坤"))
+    textos = {i: _capitulo(aleatorio, i) for i in range(1, 31)}
+    # Como los guarda el worker: comprimidos desde el principio y sin diccionario
+    for i, texto in textos.items():
+        db.add(Capitulo(id_capitulo=i, id_novela=1, numero_capitulo=i, orden_capitulo=i,
+                        contenido_comprimido=comprimir(texto)))
+    db.commit()
+
+    comprimir_existentes(db)
+
+    assert db.query(DiccionarioCompresion).filter_by(id_novela=1).count() == 1
+    for id_capitulo, plano, comprimido in db.query(
+        Capitulo.id_capitulo, Capitulo.contenido_original, Capitulo.contenido_comprimido
+    ):
+        assert plano is None
+        assert id_diccionario_de(comprimido) != 0
+        assert descomprimir(comprimido, db) == textos[id_capitulo]
+
+
+def test_novela_con_pocos_capitulos_sigue_sin_diccionario(db):
+    db.add(Novela(id_novela=1, titulo_original="短篇"))
+    db.add(Capitulo(id_capitulo=1, id_novela=1, numero_capitulo=1, orden_capitulo=1, contenido_original="第一章"))
+    db.commit()
+
+    comprimir_existentes(db)
+
+    assert db.query(DiccionarioCompresion).count() == 0
+    plano, comprimido = db.query(Capitulo.contenido_original, Capitulo.contenido_comprimido).one()
+    assert plano is None
+    assert descomprimir(comprimido) == "第一章"
@@ -0,0 +1,51 @@
+import pytest
+from app.db.database import engine, SessionLocal
+from app.db.models import Capitulo, Novela
+from app.services.discovery import _registrar_capitulos
+
+TABLAS = [Novela.__table__, Capitulo.__table__]
+
+
+@pytest.fixture
+def db():
+    for tabla in TABLAS:
+        tabla.create(engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+        for tabla in reversed(TABLAS):
+            tabla.drop(engine)
+
+
+def _enlaces(*urls):
+    return [{"url": url, "titulo": url} for url in urls]
+
+
+def _urls(db):
+    return [fila[0] for fila in db.query(Capitulo.fuente_url).order_by(Capitulo.id_capitulo)]
+
+
+def test_escaneo_completo_inserta_los_nuevos_y_corrige_posiciones(db):
+    db.add(Novela(id_novela=1, titulo_original="n"))
+    db.commit()
+    assert len(_registrar_capitulos(db, 1, _enlaces("a", "b"), 1, True)) == 2
+    nuevos = _registrar_capitulos(db, 1, _enlaces("x", "a", "b", "c"), 1, True)
+    assert _urls(db) == ["a", "b", "x", "c"]
+    assert nuevos == [3, 4]
+    posiciones = dict(db.query(Capitulo.fuente_url, Capitulo.orden_capitulo))
+    assert posiciones == {"x": 1, "a": 2, "b": 3, "c": 4}
+
+
+def test_cola_no_duplica_capitulos_antiguos_fuera_de_la_ventana(db):
+    db.add(Novela(id_novela=1, titulo_original="n"))
+    db.commit()
+    _registrar_capitulos(db, 1, _enlaces(*(f"c{i}" for i in range(1, 501))), 1, True)
+
+    # La cola trae de nuevo el capítulo 1 (movido al final del índice) y uno nuevo
+    nuevos = _registrar_capitulos(db, 1, _enlaces("c1", "c501"), 501, False)
+    assert len(nuevos) == 1
+    assert db.get(Capitulo, nuevos[0]).fuente_url == "c501"
+    assert _urls(db).count("c1") == 1
+    assert db.query(Novela.ultimo_capitulo_url, Novela.ultimo_capitulo_posicion).one() == ("c501", 502)
@@ -0,0 +1,160 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import pytest
+from app.core.config import settings
+from app.db.database import engine, SessionLocal
+from app.db.models import FuenteScraping
+from app.services import fallos
+from app.services.fallos import Circuito, circuito_para, guardar_estado_fuentes, retraso_reintento
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self) -> float:
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(fallos.time, "monotonic", reloj.monotonic)
+    monkeypatch.setattr(settings, "FUENTE_FALLOS_PARA_BLOQUEAR", 3)
+    monkeypatch.setattr(settings, "FUENTE_BLOQUEO_BASE_SEG", 60)
+    monkeypatch.setattr(settings, "FUENTE_BLOQUEO_MAX_SEG", 200)
+    monkeypatch.setattr(settings, "FUENTE_VENTANA_EXITO", 4)
+    monkeypatch.setattr(settings, "FUENTE_TASA_CADA_SEG", 30)
+    return reloj
+
+
+def test_retraso_exponencial_con_tope(monkeypatch):
+    monkeypatch.setattr(settings, "SCRAPE_REINTENTO_BASE_SEG", 10)
+    monkeypatch.setattr(settings, "SCRAPE_REINTENTO_MAX_SEG", 50)
+    assert [retraso_reintento(i).total_seconds() for i in range(1, 6)] == [10, 20, 40, 50, 50]
+    assert retraso_reintento(0) == timedelta(seconds=10)
+    assert retraso_reintento(3, base_seg=1, max_seg=100) == timedelta(seconds=4)
+
+
+def test_se_abre_tras_n_fallos_seguidos(reloj):
+    circuito = Circuito("fuente", 1)
+    circuito.registrar(False)
+    circuito.registrar(False)
+    circuito.registrar(True)  # Un acierto reinicia la cuenta
+    circuito.registrar(False)
+    circuito.registrar(False)
+    assert not circuito.abierto
+    circuito.registrar(False)
+    assert circuito.abierto
+    assert not circuito.permite()
+    assert circuito.segundos_para_sonda() == 60
+
+
+def test_una_sola_sonda_y_cierre_si_sale_bien(reloj):
+    circuito = Circuito("fuente", 1)
+    for _ in range(3):
+        circuito.registrar(False)
+    reloj.ahora += 60
+    assert circuito.permite()
+    assert not circuito.permite()  # La segunda lectura espera a que vuelva la sonda
+    circuito.registrar(True)
+    assert not circuito.abierto
+    assert circuito.permite()
+    assert circuito.aperturas == 0
+
+
+def test_sonda_fallida_duplica_la_espera_con_tope(reloj):
+    circuito = Circuito("fuente", 1)
+    for _ in range(3):
+        circuito.registrar(False)
+    esperas = []
+    for _ in range(4):
+        reloj.ahora += circuito.segundos_para_sonda()
+        assert circuito.permite()
+        circuito.registrar(False)
+        esperas.append(circuito.segundos_para_sonda())
+    assert esperas == [120, 200, 200, 200]
+
+
+def test_sonda_perdida_no_bloquea_para_siempre(reloj):
+    circuito = Circuito("fuente", 1)
+    for _ in range(3):
+        circuito.registrar(False)
+    reloj.ahora += 60
+    assert circuito.permite()
+    # La tarea de la sonda murió sin registrar nada
+    reloj.ahora += 59
+    assert not circuito.permite()
+    reloj.ahora += 1
+    assert circuito.permite()
+
+
+def test_fuente_bloqueada_en_la_db_empieza_con_sonda(reloj):
+    circuito = Circuito("fuente", 1, bloqueada=True)
+    assert circuito.abierto
+    assert circuito.permite()
+    assert not circuito.permite()
+
+
+def test_tasa_de_exito_en_ventana(reloj):
+    circuito = Circuito("fuente", 1)
+    assert circuito.tasa_exito == 100.0
+    for ok in (False, True, True, True, True):
+        circuito.registrar(ok)
+    # Ventana de 4: el primer fallo ya ha salido
+    assert circuito.tasa_exito == 100.0
+    circuito.registrar(False)
+    assert circuito.tasa_exito == 75.0
+
+
+def test_circuito_por_fuente_o_por_dominio(reloj, monkeypatch):
+    monkeypatch.setattr(fallos, "_circuitos", {})
+    fuente = SimpleNamespace(id_fuente=5, nombre_fuente="twkan", estado="activa")
+    assert circuito_para(fuente, "https://twkan.com/a") is circuito_para(fuente, "https://otra.com/b")
+    sin_fuente = circuito_para(None, "https://mirror.com/cap/1")
+    assert sin_fuente is circuito_para(None, "https://mirror.com/cap/2")
+    assert sin_fuente.nombre == "mirror.com"
+    assert sin_fuente.id_fuente is None
+
+
+@pytest.fixture
+def db():
+    FuenteScraping.__table__.create(engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+        FuenteScraping.__table__.drop(engine)
+
+
+def test_guardar_estado_de_las_fuentes(reloj, monkeypatch, db):
+    db.add(FuenteScraping(id_fuente=1, nombre_fuente="f", url_base="https://f.com", estado="activa"))
+    db.commit()
+    circuito = Circuito("f", 1)
+    sin_fuente = Circuito("dominio", None)
+    monkeypatch.setattr(fallos, "_circuitos", {"fuente:1": circuito, "dominio:x": sin_fuente})
+
+    def leer():
+        db.expire_all()
+        fuente = db.get(FuenteScraping, 1)
+        return float(fuente.tasa_exito), fuente.estado
+
+    circuito.registrar(True)
+    circuito.registrar(False)
+    sin_fuente.registrar(False)
+    guardar_estado_fuentes(db)
+    db.commit()
+    assert leer() == (50.0, "activa")
+
+    # La tasa se escribe como mucho cada FUENTE_TASA_CADA_SEG...
+    circuito.registrar(False)
+    guardar_estado_fuentes(db)
+    db.commit()
+    assert leer() == (50.0, "activa")
+
+    # ...pero abrir el circuito se guarda al momento
+    circuito.registrar(False)
+    guardar_estado_fuentes(db)
+    db.commit()
+    assert leer() == (25.0, "bloqueada")
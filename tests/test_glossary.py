@@ -0,0 +1,49 @@
+import random
+from app.services.glossary import AhoCorasick, EntradaGlosario, Glosario, formatear_para_prompt
+
+
+def _ingenuo(patrones: list[str], texto: str) -> set[int]:
+    return {i for i, p in enumerate(patrones) if p and p in texto}
+
+
+def test_encuentra_todos_los_patrones():
+    patrones = ["林动", "林", "动", "岩城", "城主"]
+    assert AhoCorasick(patrones).buscar("林动来到岩城，拜见城主。") == {0, 1, 2, 3, 4}
+
+
+def test_patrones_solapados_y_contenidos_en_otros():
+    # "he"/"she"/"his"/"hers": el ejemplo clásico de enlaces de fallo
+    patrones = ["he", "she", "his", "hers"]
+    automata = AhoCorasick(patrones)
+    assert automata.buscar("ushers") == {0, 1, 3}
+    assert automata.buscar("this") == {2}
+    assert automata.buscar("hx") == set()
+
+
+def test_patrones_vacios_se_ignoran():
+    assert AhoCorasick(["", "a"]).buscar("abc") == {1}
+    assert AhoCorasick([]).buscar("abc") == set()
+
+
+def test_coincide_con_la_busqueda_ingenua():
+    aleatorio = random.Random(7)
+    alfabeto = "天地玄黄宇宙洪荒"
+    for _ in range(200):
+        patrones = ["".join(aleatorio.choices(alfabeto, k=aleatorio.randint(1, 4))) for _ in range(10)]
+        texto = "".join(aleatorio.choices(alfabeto, k=60))
+        assert AhoCorasick(patrones).buscar(texto) == _ingenuo(patrones, texto)
+
+
+def test_glosario_devuelve_solo_las_entradas_del_texto_en_orden():
+    glosario = Glosario([
+        EntradaGlosario("岩城", "Ciudad Roca"),
+        EntradaGlosario("林动", "Lin Dong", "protagonista"),
+        EntradaGlosario("青阳镇", "Pueblo Qingyang"),
+    ])
+    assert [e.traducido for e in glosario.coincidencias("林动回到岩城")] == ["Ciudad Roca", "Lin Dong"]
+    assert Glosario([]).coincidencias("林动") == []
+
+
+def test_formato_del_prompt():
+    entradas = [EntradaGlosario("林动", "Lin Dong", "protagonista"), EntradaGlosario("岩城", "Ciudad Roca")]
+    assert formatear_para_prompt(entradas) == "- 林动 → Lin Dong (protagonista)\n- 岩城 → Ciudad Roca"
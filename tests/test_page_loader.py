@@ -0,0 +1,25 @@
+from app.services.extraction_rules import reglas_para
+from app.services.page_loader import perfil_de_carga
+
+
+def test_capitulo_espera_tambien_al_hijo_de():
+    perfil = perfil_de_carga(reglas_para("https://twkan.com/txt/1/2.html"), "capitulo")
+    assert perfil["esperar"] == ["#txtcontent0", '.txtnav div[id^="txtcontent"]', ".txtnav > :nth-child(4)"]
+    assert perfil["min_caracteres"] == 50
+
+
+def test_portada_espera_a_la_descripcion_tras_el_clic():
+    perfil = perfil_de_carga(reglas_para("https://twkan.com/book/1.html"), "portada")
+    assert perfil["esperar"] == ["div.booknav2 h1 a"]
+    assert perfil["clic_antes"] == ["#li_info"]
+    assert perfil["tras_clic"][0] == "div.navtxt p"
+    assert perfil["tras_clic_ms"] == 2000
+
+
+def test_ajustes_por_fuente():
+    reglas = reglas_para("https://otra.com/1")
+    reglas["carga"]["portada"] = {"tras_clic": ["#resumen"], "tras_clic_ms": 500}
+    reglas["contenido"]["hijo_de"] = None
+    perfil = perfil_de_carga(reglas, "portada")
+    assert (perfil["tras_clic"], perfil["tras_clic_ms"]) == (["#resumen"], 500)
+    assert ".txtnav > :nth-child(4)" not in perfil_de_carga(reglas, "capitulo")["esperar"]
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.services import rate_limit
+from app.services.rate_limit import TokenBucket, limitador_para
+
+
+class Reloj:
+    """time.monotonic controlado por el test; asyncio.sleep lo adelanta sin esperar."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+        self.esperas: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.ahora
+
+    async def sleep(self, segundos: float):
+        self.esperas.append(segundos)
+        self.ahora += segundos
+
+
+def _bucket(monkeypatch, tasa_por_hora: int, capacidad: int) -> tuple[TokenBucket, Reloj]:
+    reloj = Reloj()
+    monkeypatch.setattr(rate_limit.time, "monotonic", reloj.monotonic)
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", reloj.sleep)
+    return TokenBucket(tasa_por_hora, capacidad), reloj
+
+
+def _adquirir(bucket: TokenBucket, veces: int):
+    async def adquirir():
+        for _ in range(veces):
+            await bucket.acquire()
+    asyncio.run(adquirir())
+
+
+def test_rafaga_inicial_sin_esperas(monkeypatch):
+    bucket, reloj = _bucket(monkeypatch, tasa_por_hora=3600, capacidad=3)
+    _adquirir(bucket, 3)
+    assert reloj.esperas == []
+
+
+def test_espera_lo_justo_para_el_siguiente_token(monkeypatch):
+    # 3600/h = 1 token por segundo
+    bucket, reloj = _bucket(monkeypatch, tasa_por_hora=3600, capacidad=2)
+    _adquirir(bucket, 4)
+    assert len(reloj.esperas) == 2
+    assert all(abs(espera - 1.0) < 1e-9 for espera in reloj.esperas)
+
+
+def test_recarga_sin_pasar_de_la_capacidad(monkeypatch):
+    bucket, reloj = _bucket(monkeypatch, tasa_por_hora=3600, capacidad=2)
+    _adquirir(bucket, 2)
+    reloj.ahora += 3600  # Una hora parado: sólo se recuperan `capacidad` tokens
+    _adquirir(bucket, 3)
+    assert len(reloj.esperas) == 1
+
+
+def test_tasa_y_capacidad_minimas(monkeypatch):
+    bucket, _ = _bucket(monkeypatch, tasa_por_hora=0, capacidad=0)
+    assert bucket.capacidad == 1
+    assert bucket.tasa == 1 / 3600
+
+
+# ---------------------------------------------------------
+# LIMITADOR POR FUENTE
+# ---------------------------------------------------------
+
+def _fuente(config, limite_hora=60):
+    return SimpleNamespace(id_fuente=1, nombre_fuente="f", limite_requests_hora=limite_hora, configuracion_scraper=config)
+
+
+@pytest.mark.parametrize("concurrencia_max", [0, -2, "muchas", None, [3]])
+def test_concurrencia_invalida_no_reconstruye_el_limitador(monkeypatch, concurrencia_max):
+    monkeypatch.setattr(rate_limit, "_limitadores", {})
+    fuente = _fuente({"concurrencia_max": concurrencia_max})
+    limitador = limitador_para(fuente, "https://f.com/1")
+    assert limitador.concurrencia >= 1
+    assert limitador_para(fuente, "https://f.com/2") is limitador
+
+
+def test_cambiar_los_limites_reconstruye_el_limitador(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limitadores", {})
+    limitador = limitador_para(_fuente({"concurrencia_max": "3"}), "https://f.com/1")
+    assert limitador.concurrencia == 3
+    assert limitador_para(_fuente({"concurrencia_max": 3}), "https://f.com/1") is limitador
+    otro = limitador_para(_fuente({"concurrencia_max": 5}), "https://f.com/1")
+    assert otro is not limitador and otro.concurrencia == 5
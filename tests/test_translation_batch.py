@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+from app.services.translation_batch import EmpaquetadorLotes, marca_lote, partir_respuesta
+from app.services.translation_engine import ResultadoTraduccion
+
+
+# ---------------------------------------------------------
+# REPARTO DE LA RESPUESTA
+# ---------------------------------------------------------
+
+def test_reparte_por_marcas():
+    respuesta = f"{marca_lote(1)}\nUno.\nDos.\n{marca_lote(2)}\nTres.\n"
+    assert partir_respuesta(respuesta, 2) == ["Uno.\nDos.", "Tres."]
+
+
+def test_marcas_con_espacios_y_texto_previo():
+    respuesta = f"Aquí tienes:\n  <<< 1 >>>  \nUno.\n\t<<<2>>>\nDos."
+    assert partir_respuesta(respuesta, 2) == ["Uno.", "Dos."]
+
+
+def test_marca_que_falta_deja_ese_texto_a_none():
+    respuesta = f"{marca_lote(1)}\nUno.\n{marca_lote(3)}\nTres."
+    assert partir_respuesta(respuesta, 3) == ["Uno.", None, "Tres."]
+
+
+def test_marca_repetida_invalida_ese_texto():
+    respuesta = f"{marca_lote(1)}\nUno.\n{marca_lote(1)}\nOtra vez.\n{marca_lote(2)}\nDos."
+    assert partir_respuesta(respuesta, 2) == [None, "Dos."]
+
+
+def test_marcas_fuera_de_orden_invalidan_todo():
+    respuesta = f"{marca_lote(2)}\nDos.\n{marca_lote(1)}\nUno."
+    assert partir_respuesta(respuesta, 2) == [None, None]
+
+
+def test_marcas_fuera_de_rango_se_ignoran():
+    respuesta = f"{marca_lote(1)}\nUno.\n{marca_lote(7)}\nBasura."
+    assert partir_respuesta(respuesta, 1) == ["Uno."]
+
+
+def test_parte_vacia_es_none():
+    respuesta = f"{marca_lote(1)}\n\n{marca_lote(2)}\nDos."
+    assert partir_respuesta(respuesta, 2) == [None, "Dos."]
+
+
+def test_respuesta_vacia_o_sin_marcas():
+    assert partir_respuesta(None, 2) == [None, None]
+    assert partir_respuesta("", 2) == [None, None]
+    assert partir_respuesta("Uno.\nDos.", 2) == [None, None]
+
+
+def test_marca_en_mitad_de_una_linea_no_cuenta():
+    respuesta = f"{marca_lote(1)}\nUno dice {marca_lote(2)} en voz alta.\n{marca_lote(2)}\nDos."
+    assert partir_respuesta(respuesta, 2) == [f"Uno dice {marca_lote(2)} en voz alta.", "Dos."]
+
+
+# ---------------------------------------------------------
+# EMPAQUETADOR
+# ---------------------------------------------------------
+
+class MotorFalso:
+    def __init__(self, responder):
+        self.responder = responder
+        self.prompts: list[list[str]] = []
+
+    async def generar(self, prompt):
+        self.prompts.append(prompt)
+        texto = self.responder(prompt)
+        if isinstance(texto, Exception):
+            raise texto
+        return SimpleNamespace(text=texto)
+
+    @staticmethod
+    def contabilizar(respuestas):
+        return 100, 50
+
+
+def _traducir_lote(textos: list[str]) -> str:
+    return "\n".join(f"{marca_lote(i)}\n{t.upper()}" for i, t in enumerate(textos, 1))
+
+
+def _empaquetador(responder, max_textos=4):
+    sueltos: list[str] = []
+
+    async def traducir_suelto(texto, contexto):
+        sueltos.append(texto)
+        return ResultadoTraduccion(texto=f"suelto:{texto}", segundos=0.0, palabras=1)
+
+    motor = MotorFalso(responder)
+    empaquetador = EmpaquetadorLotes(
+        motor,
+        construir_prompt=lambda textos, contexto: list(textos),
+        traducir_suelto=traducir_suelto,
+        max_textos=max_textos,
+        max_tokens=1000,
+        espera_seg=0.01
+    )
+    return empaquetador, motor, sueltos
+
+
+def _traducir_a_la_vez(empaquetador, textos, clave="novela"):
+    async def todos():
+        return await asyncio.gather(*(empaquetador.traducir(clave, t, None) for t in textos))
+    return asyncio.run(todos())
+
+
+def test_textos_a_la_vez_van_en_una_peticion():
+    empaquetador, motor, sueltos = _empaquetador(_traducir_lote)
+    resultados = _traducir_a_la_vez(empaquetador, ["a\nb", "c"])
+    assert len(motor.prompts) == 1
+    assert sueltos == []
+    assert [r.texto for r in resultados] == ["A\nB", "C"]
+    # Los tokens se reparten por tamaño
+    assert [r.tokens_entrada for r in resultados] == [75, 25]
+
+
+def test_lote_lleno_se_envia_sin_esperar_y_el_resto_va_en_otro():
+    empaquetador, motor, sueltos = _empaquetador(_traducir_lote, max_textos=2)
+    resultados = _traducir_a_la_vez(empaquetador, ["a", "b", "c"])
+    # El tercero abre otro lote que se cierra por tiempo con un solo texto
+    assert motor.prompts == [["a", "b"]]
+    assert sueltos == ["c"]
+    assert [r.texto for r in resultados] == ["A", "B", "suelto:c"]
+
+
+def test_parte_con_otros_parrafos_se_traduce_aparte():
+    def juntar_el_segundo(textos):
+        return f"{marca_lote(1)}\nA\n{marca_lote(2)}\nB y C juntos"
+    empaquetador, _, sueltos = _empaquetador(juntar_el_segundo)
+    resultados = _traducir_a_la_vez(empaquetador, ["a", "b\nc"])
+    assert sueltos == ["b\nc"]
+    assert [r.texto for r in resultados] == ["A", "suelto:b\nc"]
+
+
+def test_si_falla_el_lote_cada_texto_va_por_separado():
+    empaquetador, _, sueltos = _empaquetador(lambda textos: RuntimeError("Gemini caído"))
+    resultados = _traducir_a_la_vez(empaquetador, ["a", "b"])
+    assert sorted(sueltos) == ["a", "b"]
+    assert [r.texto for r in resultados] == ["suelto:a", "suelto:b"]
+
+
+def test_texto_solo_no_se_empaqueta():
+    empaquetador, motor, sueltos = _empaquetador(_traducir_lote)
+    resultados = _traducir_a_la_vez(empaquetador, ["a"])
+    assert motor.prompts == []
+    assert sueltos == ["a"]
+    assert resultados[0].texto == "suelto:a"
+
+
+def test_novelas_distintas_no_se_mezclan():
+    empaquetador, motor, _ = _empaquetador(_traducir_lote)
+
+    async def dos_novelas():
+        return await asyncio.gather(
+            empaquetador.traducir(1, "a", None), empaquetador.traducir(1, "b", None),
+            empaquetador.traducir(2, "c", None), empaquetador.traducir(2, "d", None),
+        )
+    asyncio.run(dos_novelas())
+    assert sorted(motor.prompts) == [["a", "b"], ["c", "d"]]
@@ -0,0 +1,207 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.services import translation_engine
+from app.services.translation_engine import (
+    ConcurrenciaAdaptativa, MotorTraduccion, RespuestaIncompleta,
+    dividir_en_fragmentos, estimar_tokens, motivo_incompleta
+)
+
+
+# ---------------------------------------------------------
+# FRAGMENTOS
+# ---------------------------------------------------------
+
+def test_estimar_tokens_cjk_y_latino():
+    assert estimar_tokens("天下第一") == 4 + 0 + 1
+    assert estimar_tokens("abcdefgh") == 0 + 2 + 1
+
+
+def test_texto_corto_en_un_fragmento():
+    texto = "第一段。\n第二段。"
+    assert dividir_en_fragmentos(texto, 100) == [texto]
+
+
+def test_fragmentos_alineados_a_parrafos_y_sin_perder_texto():
+    parrafos = [f"第{i}段" + "字" * 20 for i in range(30)]
+    fragmentos = dividir_en_fragmentos("\n".join(parrafos), 100)
+    assert len(fragmentos) > 1
+    assert all(estimar_tokens(f) <= 100 for f in fragmentos)
+    # Ningún párrafo se corta ni se pierde
+    assert "\n".join(fragmentos).split("\n") == parrafos
+
+
+def test_parrafo_gigante_se_parte_por_frases():
+    parrafo = "。".join("字" * 30 for _ in range(10)) + "。"
+    fragmentos = dividir_en_fragmentos(parrafo, 50)
+    assert len(fragmentos) > 1
+    assert all(estimar_tokens(f) <= 50 for f in fragmentos)
+    assert "".join(fragmentos) == parrafo
+
+
+def test_frase_sin_puntuacion_se_corta_a_la_fuerza():
+    frase = "字" * 500
+    fragmentos = dividir_en_fragmentos(frase, 60)
+    assert all(estimar_tokens(f) <= 60 for f in fragmentos)
+    assert "".join(fragmentos) == frase
+
+
+def test_fragmentos_en_blanco_se_descartan():
+    assert dividir_en_fragmentos("\n\n  \n", 10) == []
+
+
+# ---------------------------------------------------------
+# RESPUESTAS INCOMPLETAS
+# ---------------------------------------------------------
+
+def _respuesta(texto, finish_reason="STOP", block_reason=None):
+    return SimpleNamespace(
+        text=texto,
+        candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason))] if finish_reason else [],
+        prompt_feedback=SimpleNamespace(block_reason=block_reason) if block_reason else None,
+        usage_metadata=SimpleNamespace(prompt_token_count=10, candidates_token_count=5)
+    )
+
+
+def test_respuesta_completa():
+    assert motivo_incompleta(_respuesta("Hola")) is None
+
+
+@pytest.mark.parametrize("texto", [None, "", "  \n "])
+def test_respuesta_sin_texto(texto):
+    assert motivo_incompleta(_respuesta(texto)).startswith("respuesta vacía")
+
+
+def test_respuesta_bloqueada_sin_candidatos():
+    motivo = motivo_incompleta(_respuesta(None, finish_reason=None, block_reason="SAFETY"))
+    assert "block_reason=SAFETY" in motivo
+
+
+@pytest.mark.parametrize("motivo", ["SAFETY", "MAX_TOKENS", "RECITATION"])
+def test_respuesta_cortada(motivo):
+    assert motivo_incompleta(_respuesta("Texto a medias", finish_reason=motivo)) == f"finish_reason={motivo}"
+
+
+# ---------------------------------------------------------
+# MOTOR
+# ---------------------------------------------------------
+
+class GeminiFalso:
+    """Cliente con la forma de genai.Client que devuelve las respuestas de `guion` en orden."""
+
+    def __init__(self, guion):
+        self.guion = list(guion)
+        self.prompts: list[str] = []
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generar))
+
+    async def _generar(self, model: str, contents: str):
+        self.prompts.append(contents)
+        siguiente = self.guion.pop(0)
+        if callable(siguiente):
+            return siguiente(contents)
+        if isinstance(siguiente, Exception):
+            raise siguiente
+        return siguiente
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+    async def dormir(_):
+        return None
+    monkeypatch.setattr(translation_engine.asyncio, "sleep", dormir)
+
+
+def _motor(cliente, max_tokens=1000, reintentos=2) -> MotorTraduccion:
+    return MotorTraduccion(lambda: cliente, modelo="falso", max_tokens=max_tokens, concurrencia=2, reintentos=reintentos)
+
+
+def test_el_cliente_se_crea_en_la_primera_peticion():
+    creados = []
+    motor = MotorTraduccion(lambda: creados.append(1) or GeminiFalso([_respuesta("ok")] * 2), "falso", 100, 1, 0)
+    assert creados == []
+    asyncio.run(motor.generar("x"))
+    asyncio.run(motor.generar("x"))
+    assert creados == [1]
+
+
+def test_traducir_reensambla_los_fragmentos_en_orden():
+    traducir = lambda prompt: _respuesta(prompt.upper())  # noqa: E731
+    parrafos = ["a" * 40, "b" * 40, "c" * 40]
+    cliente = GeminiFalso([traducir] * 3)
+    resultado = asyncio.run(_motor(cliente, max_tokens=15).traducir("\n".join(parrafos), lambda f: f))
+    assert resultado.fragmentos == 3
+    assert resultado.texto == "\n".join(p.upper() for p in parrafos)
+    assert (resultado.tokens_entrada, resultado.tokens_salida) == (30, 15)
+
+
+def test_parrafo_partido_vuelve_a_ser_una_linea():
+    # Gemini responde cada trozo en su propia línea (y alguno partido en dos)
+    traducir = lambda prompt: _respuesta(f"[{prompt}]\n")  # noqa: E731
+    parrafo = "。".join("字" * 10 for _ in range(6)) + "。"
+    texto = f"前\n{parrafo}\n后"
+    cliente = GeminiFalso([traducir] * 10)
+    resultado = asyncio.run(_motor(cliente, max_tokens=25).traducir(texto, lambda f: f))
+    assert resultado.fragmentos > 3
+    lineas = resultado.texto.split("\n")
+    assert len(lineas) == 3
+    assert lineas[1].replace("[", "").replace("]", "").replace(" ", "") == parrafo
+
+
+def test_respuesta_vacia_se_reintenta():
+    cliente = GeminiFalso([_respuesta(""), _respuesta("Hola")])
+    resultado = asyncio.run(_motor(cliente).traducir("你好", lambda f: f))
+    assert resultado.texto == "Hola"
+    assert len(cliente.prompts) == 2
+
+
+def test_respuesta_vacia_persistente_no_se_da_por_traducida():
+    cliente = GeminiFalso([_respuesta("")] * 3)
+    with pytest.raises(RespuestaIncompleta):
+        asyncio.run(_motor(cliente, reintentos=2).traducir("你好", lambda f: f))
+    assert len(cliente.prompts) == 3
+
+
+def test_un_fragmento_bloqueado_hace_fallar_el_capitulo():
+    # El segundo fragmento vuelve bloqueado en todos los intentos: no se guarda un capítulo al que le falta
+    def responder(prompt):
+        return _respuesta(None, finish_reason="SAFETY") if prompt.startswith("b") else _respuesta(prompt)
+    cliente = GeminiFalso([responder] * 10)
+    with pytest.raises(RespuestaIncompleta):
+        asyncio.run(_motor(cliente, max_tokens=15, reintentos=1).traducir("a" * 40 + "\n" + "b" * 40, lambda f: f))
+
+
+def test_errores_no_reintentables_se_propagan_al_momento():
+    error = ValueError("prompt inválido")
+    cliente = GeminiFalso([error, _respuesta("no llega")])
+    with pytest.raises(ValueError):
+        asyncio.run(_motor(cliente).generar("x"))
+    assert len(cliente.prompts) == 1
+
+
+def test_429_reduce_la_concurrencia_y_reintenta():
+    limitado = Exception("429 RESOURCE_EXHAUSTED")
+    cliente = GeminiFalso([limitado, _respuesta("ok")])
+    motor = _motor(cliente)
+    asyncio.run(motor.generar("x"))
+    assert motor.concurrencia.limite == 1
+
+
+# ---------------------------------------------------------
+# CONCURRENCIA ADAPTATIVA
+# ---------------------------------------------------------
+
+def test_concurrencia_aimd():
+    concurrencia = ConcurrenciaAdaptativa(8)
+    concurrencia.limitado()
+    assert concurrencia.limite == 4
+    concurrencia.limitado()
+    concurrencia.limitado()
+    concurrencia.limitado()
+    assert concurrencia.limite == 1
+    # Sube de uno en uno tras una racha de 4 × límite éxitos
+    for _ in range(4):
+        concurrencia.exito()
+    assert concurrencia.limite == 2
+    for _ in range(1000):
+        concurrencia.exito()
+    assert concurrencia.limite == 8
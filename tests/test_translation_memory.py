@@ -0,0 +1,179 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.db.database import engine, SessionLocal
+from app.db.models import MemoriaTraduccion
+from app.services import translation_memory
+from app.services.glossary import EntradaGlosario, Glosario
+from app.services.translation_engine import MotorTraduccion, ResultadoTraduccion
+from app.services.translation_memory import MemoriaTraducciones, hash_parrafo, normalizar_parrafo, traducir_con_memoria
+
+
+class SesionAsync:
+    """Lo único que usa traducir_con_memoria de la AsyncSession: run_sync y commit sobre una sesión síncrona."""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def run_sync(self, fn, *args):
+        return fn(self.db, *args)
+
+    async def commit(self):
+        self.db.commit()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    MemoriaTraduccion.__table__.create(engine)
+    monkeypatch.setattr(translation_memory, "memoria", MemoriaTraducciones(100))
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+        MemoriaTraduccion.__table__.drop(engine)
+
+
+class Traductor:
+    """
+    Sustituto de Gemini: traduce cada línea a '<línea>-es' y apunta con qué textos se
+    le llama (y si la sesión tenía una transacción abierta mientras tanto).
+    """
+
+    def __init__(self, respuesta=None, db=None):
+        self.llamadas: list[str] = []
+        self.respuesta = respuesta
+        self.db = db
+        self.en_transaccion: list[bool] = []
+
+    async def __call__(self, texto: str):
+        self.llamadas.append(texto)
+        if self.db is not None:
+            self.en_transaccion.append(self.db.in_transaction())
+        if self.respuesta is not None:
+            return self.respuesta(texto)
+        return ResultadoTraduccion(texto="\n".join(f"{linea}-es" for linea in texto.split("\n")), segundos=1.0, palabras=0)
+
+
+def _traducir(db, texto, traductor, glosario=None):
+    return asyncio.run(traducir_con_memoria(SesionAsync(db), texto, traductor, glosario))
+
+
+def test_normalizacion_iguala_mirrors():
+    assert normalizar_parrafo("  天下　第一  \t!") == "天下 第一 !"
+    assert hash_parrafo("ＡＢＣ  def") == hash_parrafo("ABC def")
+
+
+def test_solo_se_traducen_los_parrafos_que_faltan(db):
+    traductor = Traductor()
+    _traducir(db, "uno\ndos", traductor)
+    db.commit()
+
+    resultado = _traducir(db, "uno\ntres\ndos", traductor)
+    assert traductor.llamadas[-1] == "tres"
+    assert resultado.texto == "uno-es\ntres-es\ndos-es"
+
+
+def test_parrafos_repetidos_se_envian_una_vez_y_se_conservan_las_lineas_vacias(db):
+    traductor = Traductor()
+    resultado = _traducir(db, "uno\n\nuno\ndos\n", traductor)
+    assert traductor.llamadas == ["uno\ndos"]
+    assert resultado.texto == "uno-es\n\nuno-es\ndos-es\n"
+
+
+def test_no_se_espera_a_gemini_con_la_transaccion_abierta(db):
+    _traducir(db, "uno", Traductor())
+    traductor = Traductor(db=db)
+    assert _traducir(db, "uno\ndos", traductor).texto == "uno-es\ndos-es"
+    assert traductor.en_transaccion == [False]
+    assert not db.in_transaction()
+
+
+def test_capitulo_ya_conocido_no_llama_a_gemini(db):
+    _traducir(db, "uno\ndos", Traductor())
+    db.commit()
+    traductor = Traductor()
+    resultado = _traducir(db, "dos\nuno", traductor)
+    assert traductor.llamadas == []
+    assert resultado.texto == "dos-es\nuno-es"
+    assert resultado.fragmentos == 0
+
+
+def test_la_memoria_sobrevive_a_la_lru(db, monkeypatch):
+    _traducir(db, "uno", Traductor())
+    db.commit()
+    # Un proceso nuevo (LRU vacía) encuentra el párrafo en la tabla
+    monkeypatch.setattr(translation_memory, "memoria", MemoriaTraducciones(100))
+    traductor = Traductor()
+    assert _traducir(db, "uno", traductor).texto == "uno-es"
+    assert traductor.llamadas == []
+
+
+def test_si_gemini_junta_parrafos_se_traduce_el_capitulo_entero(db):
+    _traducir(db, "uno", Traductor())
+    db.commit()
+
+    def juntar(texto):
+        return ResultadoTraduccion(texto=texto.replace("\n", " ") + "-es", segundos=1.0, palabras=0)
+    traductor = Traductor(juntar)
+    resultado = _traducir(db, "uno\ndos\ntres", traductor)
+    # Primero sólo lo que faltaba; al no cuadrar las líneas, el texto completo
+    assert traductor.llamadas == ["dos\ntres", "uno\ndos\ntres"]
+    assert resultado.texto == "uno dos tres-es"
+    # Nada de lo desalineado entra en la memoria
+    assert db.query(MemoriaTraduccion).count() == 1
+
+
+def test_parrafo_largo_partido_en_fragmentos_no_se_traduce_dos_veces(db):
+    _traducir(db, "uno", Traductor())
+    db.commit()
+
+    prompts = []
+
+    async def gemini(model, contents):
+        prompts.append(contents)
+        return SimpleNamespace(text=f"{contents}-es", candidates=[], prompt_feedback=None, usage_metadata=None)
+
+    cliente = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=gemini)))
+    motor = MotorTraduccion(lambda: cliente, modelo="falso", max_tokens=20, concurrencia=2, reintentos=0)
+    largo = "。".join("字" * 10 for _ in range(4)) + "。"
+    resultado = _traducir(db, f"uno\n{largo}", lambda texto: motor.traducir(texto, lambda f: f))
+    # Un prompt por trozo del párrafo largo; ninguno para el capítulo entero
+    assert len(prompts) == 4
+    assert resultado.texto.split("\n")[0] == "uno-es"
+    assert len(resultado.texto.split("\n")) == 2
+
+
+def test_si_gemini_falla_no_hay_resultado(db):
+    traductor = Traductor(lambda texto: None)
+    assert _traducir(db, "uno", traductor) is None
+    assert db.query(MemoriaTraduccion).count() == 0
+
+
+def test_el_glosario_forma_parte_de_la_clave(db):
+    lin_dong = Glosario([EntradaGlosario("林动", "Lin Dong")])
+    _traducir(db, "林动笑了\n天黑了", Traductor(), lin_dong)
+    db.commit()
+
+    # Otra novela sin ese término en su glosario: el párrafo con el nombre no se reutiliza
+    traductor = Traductor()
+    _traducir(db, "林动笑了\n天黑了", traductor)
+    assert traductor.llamadas == ["林动笑了"]
+    db.commit()
+
+    # Editar la entrada invalida sólo los párrafos que la usan
+    traductor = Traductor()
+    _traducir(db, "林动笑了\n天黑了", traductor, Glosario([EntradaGlosario("林动", "Lin Tung")]))
+    assert traductor.llamadas == ["林动笑了"]
+
+    # Con el mismo glosario vuelve a salir todo de la memoria
+    traductor = Traductor()
+    _traducir(db, "林动笑了\n天黑了", traductor, lin_dong)
+    assert traductor.llamadas == []
+
+
+def test_lru_acotada():
+    memoria = MemoriaTraducciones(2)
+    for clave in ("a", "b", "c"):
+        memoria._recordar((clave, ""), clave.upper())
+    assert list(memoria._lru) == [("b", ""), ("c", "")]
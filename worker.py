@@ -1,10 +1,25 @@
+"""
+Worker del agente.
+
+    python worker.py [run]          bucle continuo (secuencial o pipeline según AGENT_MODO)
+    python worker.py once           un ciclo completo y termina
+    python worker.py discover       una pasada de cada fase por separado, para cron
+    python worker.py scrape           o Jobs de Kubernetes (código de salida 1 si falla)
+    python worker.py translate
+    python worker.py recheck
+
+Cada orden importa sólo lo que usa su fase: `scrape` no carga el SDK de Gemini,
+y Playwright se carga al abrir el primer navegador (nunca si basta con HTTP).
+"""
+import argparse
 import asyncio
 import logging
-from app.db.database import SessionLocal
+import sys
+import time
+
+_INICIO = time.perf_counter()
+
 from app.core.config import settings
-from app.services.discovery import discover_new_chapters
-from app.services.scraper import process_pending_scrapes
-# from app.services.translator import process_pending_translations
 
 # Configuración de logs para el worker
 logging.basicConfig(
@@ -14,36 +29,146 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Worker")
 
+
+# ---------------------------------------------------------
+# FASES (una pasada cada una)
+# ---------------------------------------------------------
+
+async def fase_discovery(db):
+    from app.services.discovery import discover_new_chapters
+    # FASE 0: Descubrir nuevos capítulos en las fuentes (SkyNovels, etc.)
+    logger.info("🔍 Fase 0: Buscando actualizaciones en la web...")
+    await discover_new_chapters(db)
+
+async def fase_scrape(db):
+    from app.services.scraper import process_pending_scrapes
+    # FASE 1: Extraer contenido original de los capítulos detectados
+    logger.info("🔍 Fase 1: Extrayendo contenido de capítulos pendientes...")
+    await process_pending_scrapes(db)
+
+async def fase_traduccion(db):
+    from app.services.translator import process_pending_translations
+    # FASE 2: Traducir con Gemini el contenido extraído
+    logger.info("🔍 Fase 2: Procesando traducciones con Gemini...")
+    await process_pending_translations(db)
+
+async def fase_revision(db):
+    from app.services.revision import process_rechecks
+    # FASE 3: Releer capítulos recientes y retraducir sólo lo que haya cambiado
+    logger.info("🔍 Fase 3: Revisando capítulos recientes en su fuente...")
+    await process_rechecks(db)
+
+FASES_CLI = {
+    "discover": ("discovery", fase_discovery),
+    "scrape": ("scrape", fase_scrape),
+    "translate": ("traduccion", fase_traduccion),
+    "recheck": ("revision", fase_revision),
+}
+
+def _fases_del_ciclo() -> list[str]:
+    fases = ["discover", "scrape"]
+    if settings.AGENT_TRADUCCION_ACTIVA:
+        fases.append("translate")
+    if settings.REVISION_ACTIVA:
+        fases.append("recheck")
+    return fases
+
+
+async def _ciclo(ordenes: list[str], propagar: bool = False):
+    from app.core.metricas import FASES
+    from app.db.database import AsyncSessionLocal
+
+    # Una nueva sesión de base de datos por ciclo
+    # (al salir del bloque se cierra y la conexión vuelve al pool)
+    async with AsyncSessionLocal() as db:
+        try:
+            for orden in ordenes:
+                nombre, fase = FASES_CLI[orden]
+                with FASES.labels(nombre).time():
+                    await fase(db)
+        except Exception:
+            # En las pasadas únicas lo registra main() (con la traza) al devolver el código de salida
+            if propagar:
+                raise
+            logger.exception("❌ Error crítico en el ciclo del worker")
+
+
+# ---------------------------------------------------------
+# MODOS
+# ---------------------------------------------------------
+
 async def main_worker():
-    logger.info("🚀 Agente de Novelas iniciado (Modo: Worker)")
-    
+    from app.core.metricas import iniciar_exportador
+    from app.services.browser_pool import browser_pool
+    from app.services.leases import latido
+
+    logger.info(f"🚀 Agente de Novelas iniciado (Modo: Worker, {settings.AGENT_MODO})")
+    iniciar_exportador(settings.METRICAS_PUERTO_WORKER)
+    await browser_pool.start()
+    latido.start()
+    try:
+        if settings.AGENT_MODO == "pipeline":
+            from app.services.pipeline import Pipeline
+            await Pipeline().run()
+        else:
+            await _loop_worker()
+    finally:
+        await _cerrar(latido)
+
+async def _loop_worker():
     while True:
-        # 1. Creamos una nueva sesión de base de datos para este ciclo
-        db = SessionLocal()
-        try:
-            # FASE 0: Descubrir nuevos capítulos en las fuentes (SkyNovels, etc.)
-            logger.info("🔍 Fase 0: Buscando actualizaciones en la web...")
-            await discover_new_chapters(db)
-            
-            # FASE 1: Extraer contenido original de los capítulos detectados
-            logger.info("🔍 Fase 1: Extrayendo contenido de capítulos pendientes...")
-            await process_pending_scrapes(db)
-            
-            # FASE 2: Traducir con Gemini el contenido extraído
-          #  logger.info("🔍 Fase 2: Procesando traducciones con Gemini...")
-          #  await process_pending_translations(db)
-            
-        except Exception as e:
-            logger.error(f"❌ Error crítico en el ciclo del worker: {e}")
-        finally:
-            # IMPORTANTE: Siempre cerrar la conexión con XAMPP para evitar saturar MySQL
-            db.close()
-        
+        await _ciclo(_fases_del_ciclo())
         logger.info(f"😴 Ciclo completado. Esperando {settings.AGENT_POLLING_INTERVAL} segundos...")
         await asyncio.sleep(settings.AGENT_POLLING_INTERVAL)
 
-if __name__ == "__main__":
+async def una_pasada(ordenes: list[str], lotes: int = 1):
+    """
+    Ejecuta las fases indicadas `lotes` veces y termina. El navegador no se abre
+    por adelantado: lo arranca el primer capítulo que lo necesite.
+    """
+    from app.services.leases import latido
+
+    logger.info(f"🚀 Pasada única: {', '.join(ordenes)} (arranque en {(time.perf_counter() - _INICIO) * 1000:.0f} ms)")
+    latido.start()
     try:
-        asyncio.run(main_worker())
+        for _ in range(max(1, lotes)):
+            await _ciclo(ordenes, propagar=True)
+    finally:
+        await _cerrar(latido)
+
+async def _cerrar(latido):
+    # Soltar leases y cerrar los navegadores del pool y el cliente HTTP al salir del worker
+    from app.db.database import async_engine
+    from app.services.browser_pool import browser_pool
+    from app.services.http_client import close_http_client
+
+    await latido.stop()
+    await browser_pool.close()
+    await close_http_client()
+    await async_engine.dispose()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Worker del agente de novelas")
+    parser.add_argument(
+        "orden", nargs="?", default="run", choices=["run", "once", *FASES_CLI],
+        help="run: bucle continuo; once: un ciclo completo; el resto, una pasada de esa fase"
+    )
+    parser.add_argument("--lotes", type=int, default=1, help="pasadas seguidas en los modos de una sola vez")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.orden == "run":
+            asyncio.run(main_worker())
+        else:
+            ordenes = _fases_del_ciclo() if args.orden == "once" else [args.orden]
+            asyncio.run(una_pasada(ordenes, args.lotes))
     except KeyboardInterrupt:
-        logger.info("🛑 Worker detenido manualmente por el usuario.")
\ No newline at end of file
+        logger.info("🛑 Worker detenido manualmente por el usuario.")
+    except Exception:
+        logger.exception(f"❌ Falló la orden '{args.orden}'")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())